@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """Database baru dengan skema terbaru; jalur tulis crud diarahkan ke sini"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import crud
+    from migrations import run_migrations
+    from partitions import PartitionRouter
+
+    path = str(tmp_path / "aws_db.sqlite")
+    conn = sqlite3.connect(path)
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    monkeypatch.setattr(crud, "SessionLocal", sessionmaker(bind=engine, autocommit=False, autoflush=False))
+    monkeypatch.setattr(crud, "router", PartitionRouter(path, {"enabled": False}))
+    yield path
+    engine.dispose()
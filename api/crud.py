@@ -1,60 +1,490 @@
-from sqlalchemy import select, desc, func, and_
-from models import sensor_datas
-from database import SessionLocal
+from sqlalchemy import select, desc, func, and_, or_
+from models import sensor_datas, stations, stations_rtree
+from database import SessionLocal, DB_PATH, read_pool, lookup_pool, compile_query
+from partitions import PartitionRouter, prepare_partition, schema_name
+from connections import readonly_uri
+from rollup import bucket_start, update_rollups, rebuild_rollups
+from migrations import next_change_seqs
+from contextlib import contextmanager, asynccontextmanager
+import sqlite3
+import math
+import time
 
-def get_latest(device=None):
-    with SessionLocal() as db:
-        query = select(sensor_datas).order_by(desc(sensor_datas.c.timestamp))
-        if device:
-            query = query.where(sensor_datas.c.device == device)
-        return db.execute(query).fetchone()
+# Partisi bulanan (opsional, backend/partitions.py): query rentang waktu
+# dijalankan per jendela partisi; tanpa partisi cukup satu jendela biasa
+router = PartitionRouter(DB_PATH)
 
-def insert_data(data: dict):
-    with SessionLocal() as db:
-        db.execute(sensor_datas.insert().values(**data))
-        db.commit()
+# ================================================================
+# Baca (async): koneksi read-only dari pool aiosqlite (database.py).
+# Hasil berupa sqlite3.Row: r[0], r["kolom"], dict(r)
+# ================================================================
 
-def query_by_params(params, from_ts, to_ts, device=None, limit=None):
-    with SessionLocal() as db:
-        cols = [sensor_datas.c.timestamp] + [sensor_datas.c.get(p) for p in params]
-        query = select(*cols).where(sensor_datas.c.timestamp.between(from_ts, to_ts))
-        if device:
-            query = query.where(sensor_datas.c.device == device)
-        if limit:
-            query = query.limit(limit)
-        return db.execute(query).fetchall()
-
-def get_all(filters):
-    with SessionLocal() as db:
-        query = select(sensor_datas)
-        if filters.get("device"):
-            query = query.where(sensor_datas.c.device == filters["device"])
-        if filters.get("from_ts") and filters.get("to_ts"):
-            query = query.where(sensor_datas.c.timestamp.between(filters["from_ts"], filters["to_ts"]))
-        if filters.get("limit"):
-            query = query.limit(filters["limit"])
-        return db.execute(query).fetchall()
-
-def list_devices():
+async def _attach(conn, lo, hi, parts):
+    """
+    Versi async PartitionRouter.attach: partisi di-ATTACH read-only lalu
+    TEMP VIEW sensor_datas dibuat. None jika jendela tidak perlu routing.
+    """
+    if not parts and lo is None and hi is None:
+        return None
+    columns = [r[1] for r in await conn.execute_fetchall("PRAGMA main.table_info(sensor_datas)")]
+    names = []
+    attached = []
+    try:
+        for key, path in parts:
+            name = schema_name(key)
+            try:
+                await conn.execute(f"ATTACH DATABASE ? AS {name}", (readonly_uri(path),))
+            except sqlite3.OperationalError:
+                # File terhapus retensi di antara listdir dan ATTACH
+                continue
+            names.append(name)
+            existing = await conn.execute_fetchall(f"PRAGMA {name}.table_info(sensor_datas)")
+            attached.append((name, {r[1] for r in existing}))
+        await _temp_ddl(conn, "DROP VIEW IF EXISTS temp.sensor_datas", router.view_sql(columns, lo, hi, attached))
+    except Exception:
+        await _detach(conn, names)
+        raise
+    return names
+
+async def _temp_ddl(conn, *statements):
+    """DDL pada schema temp; query_only dibuka sebentar (file tetap mode=ro)"""
+    await conn.execute("PRAGMA query_only = OFF")
+    try:
+        for sql in statements:
+            await conn.execute(sql)
+    finally:
+        await conn.execute("PRAGMA query_only = ON")
+
+async def _detach(conn, names):
+    await _temp_ddl(conn, "DROP VIEW IF EXISTS temp.sensor_datas")
+    for name in names:
+        await conn.execute(f"DETACH DATABASE {name}")
+
+@asynccontextmanager
+async def _reading(window=(None, None, ()), pool=read_pool):
+    """Koneksi baca dengan sensor_datas mencakup partisi pada jendela ini"""
+    async with pool.connection() as conn:
+        names = await _attach(conn, *window)
+        try:
+            yield conn
+        finally:
+            if names is not None:
+                await _detach(conn, names)
+
+async def _first(conn, query):
+    sql, params = compile_query(query)
+    async with conn.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+async def _rows(conn, query):
+    sql, params = compile_query(query)
+    return list(await conn.execute_fetchall(sql, params))
+
+async def _latest(query):
+    """Baris terbaru: database utama dulu, lalu partisi dari yang terbaru"""
+    async with _reading(pool=lookup_pool) as conn:
+        row = await _first(conn, query)
+    if row is None:
+        for key, path in reversed(router.partitions()):
+            async with _reading((None, None, [(key, path)]), lookup_pool) as conn:
+                row = await _first(conn, query)
+            if row is not None:
+                break
+    return row
+
+async def get_latest(device=None):
+    query = select(sensor_datas).order_by(desc(sensor_datas.c.timestamp))
+    if device:
+        query = query.where(sensor_datas.c.device == device)
+    return await _latest(query)
+
+# ================================================================
+# Ingest: upsert per batch (executemany, satu transaksi per batch),
+# dedupe pada (device, timestamp) lewat index unik migrasi v7.
+# Jalur tulis tetap sync (SQLAlchemy engine, dijalankan di threadpool)
+# ================================================================
+
+ROLLUP_FIELDS = ["temp", "hum", "press", "wspeed", "wdir", "rain", "srad"]
+DAY = 86400
+
+def _existing_keys(cur, rows):
+    """(device, timestamp) dari batch yang sudah tersimpan"""
+    spans = {}
+    for r in rows:
+        if r["device"] is None:
+            continue
+        lo, hi = spans.get(r["device"], (r["timestamp"], r["timestamp"]))
+        spans[r["device"]] = (min(lo, r["timestamp"]), max(hi, r["timestamp"]))
+    found = set()
+    for device, (lo, hi) in spans.items():
+        found.update(cur.execute(
+            "SELECT device, timestamp FROM sensor_datas WHERE device = ? AND timestamp BETWEEN ? AND ?",
+            (device, lo, hi)
+        ).fetchall())
+    return found
+
+def _upsert_group(rows, target=None):
+    """
+    Upsert baris ke main.sensor_datas atau ke partisi `target` (kunci, path).
+    Rollup baris baru ditambah inkremental; hari yang berisi baris yang
+    diperbarui dihitung ulang dari data mentah. Tiap baris (baru maupun
+    koreksi) mendapat change_seq baru, jadi backup & uplink ikut membawanya.
+    """
+    columns = list(rows[0]) + ["change_seq"]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in ("device", "timestamp"))
+    schema = schema_name(target[0]) if target else "main"
+    sql = f"""
+    INSERT INTO {schema}.sensor_datas ({", ".join(columns)})
+    VALUES ({", ".join("?" for _ in columns)})
+    ON CONFLICT (device, timestamp) DO UPDATE SET {updates}
+    """
     with SessionLocal() as db:
-        result = db.execute(select(sensor_datas.c.device).distinct()).fetchall()
-        return [r[0] for r in result]
+        raw = db.connection().connection.driver_connection
+        if target:
+            prepare_partition(raw, target[1])
+        # ATTACH harus sebelum transaksi dimulai
+        with router.routed(raw, parts=[target] if target else ()):
+            cur = raw.cursor()
+            existing = _existing_keys(cur, rows)
+            seen = set()
+            inserted = []
+            changed_days = set()
+            for r in rows:
+                key = (r["device"], r["timestamp"])
+                if key in existing or key in seen:
+                    changed_days.add(bucket_start(r["timestamp"], DAY))
+                else:
+                    inserted.append(r)
+                if r["device"] is not None:
+                    seen.add(key)
+            try:
+                # Partisi tidak punya trigger change_seq: nomor diambil dari penghitung main
+                first = next_change_seqs(cur, len(rows))
+                cur.executemany(sql, [[r[c] for c in columns[:-1]] + [first + i] for i, r in enumerate(rows)])
+                # Hitung ulang dulu: register_math gagal jika masih ada statement aktif
+                for day in sorted(changed_days):
+                    rebuild_rollups(raw, since=day, until=day + DAY, commit=False)
+                for r in inserted:
+                    if bucket_start(r["timestamp"], DAY) not in changed_days:
+                        update_rollups(cur, r["device"], r["timestamp"], {p: r.get(p) for p in ROLLUP_FIELDS})
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+    return len(inserted), len(rows) - len(inserted)
 
-def stats_for_param(param, from_ts, to_ts):
+@contextmanager
+def _session(window=(None, None, ())):
+    """Session dengan sensor_datas mencakup partisi pada jendela ini"""
     with SessionLocal() as db:
-        col = sensor_datas.c.get(param)
-        query = select(func.avg(col), func.min(col), func.max(col)).where(sensor_datas.c.timestamp.between(from_ts, to_ts))
-        result = db.execute(query).fetchone()
-        return {"parameter": param, "avg": result[0], "min": result[1], "max": result[2]}
+        raw = db.connection().connection.driver_connection
+        with router.routed(raw, *window):
+            yield db
 
-def query_geo(min_lat, max_lat, min_lon, max_lon):
+def _stored(query):
+    """Baris yang baru ditulis (main dulu, lalu partisi) lewat koneksi tulis"""
     with SessionLocal() as db:
-        query = select(sensor_datas).where(
+        row = db.execute(query).first()
+    if row is None:
+        for key, path in reversed(router.partitions()):
+            with _session((None, None, [(key, path)])) as db:
+                row = db.execute(query).first()
+            if row is not None:
+                break
+    return row
+
+def upsert_batch(rows):
+    """
+    Simpan satu batch (list dict kolom SensorCreate). Kembalikan
+    (inserted, updated, baris lengkap terbaru per device).
+    """
+    rows = [dict(r, created_at=r["timestamp"]) for r in rows]
+    groups = {}
+    for r in rows:
+        groups.setdefault(router.write_target(r["timestamp"]), []).append(r)
+    inserted = updated = 0
+    for target, group in groups.items():
+        i, u = _upsert_group(group, target)
+        inserted += i
+        updated += u
+
+    newest = {}
+    for r in rows:
+        if r["device"] not in newest or r["timestamp"] >= newest[r["device"]]["timestamp"]:
+            newest[r["device"]] = r
+    latest = []
+    for r in newest.values():
+        query = select(sensor_datas).where(and_(sensor_datas.c.device == r["device"],
+                                                sensor_datas.c.timestamp == r["timestamp"]))
+        row = _stored(query)
+        latest.append(dict(row._mapping) if row else dict(r))
+    return inserted, updated, latest
+
+def insert_data(data: dict):
+    """Simpan satu baris (upsert), kembalikan baris lengkap (termasuk id)"""
+    return upsert_batch([data])[2][0]
+
+def _keyset(query, after):
+    """Urutkan (timestamp, id) dan lanjutkan setelah cursor (timestamp, id) jika ada"""
+    if after:
+        ts, row_id = after
+        query = query.where(or_(
+            sensor_datas.c.timestamp > ts,
+            and_(sensor_datas.c.timestamp == ts, sensor_datas.c.id > row_id)
+        ))
+    return query.order_by(sensor_datas.c.timestamp, sensor_datas.c.id)
+
+async def _fetch(query, from_ts=None, to_ts=None, limit=None):
+    """fetchall() lintas jendela partisi, berhenti setelah `limit` baris"""
+    rows = []
+    for window in router.windows(from_ts, to_ts):
+        async with _reading(window) as conn:
+            rows += await _rows(conn, query)
+        if limit and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+async def _stream(query, from_ts=None, to_ts=None, limit=None):
+    """Yield baris langsung dari cursor DB (per READ_CHUNK baris) tanpa fetchall()"""
+    count = 0
+    sql, params = compile_query(query)
+    for window in router.windows(from_ts, to_ts):
+        async with _reading(window) as conn:
+            # Cursor ditutup sebelum partisi di-DETACH
+            async with conn.execute(sql, params) as cursor:
+                async for row in cursor:
+                    yield row
+                    count += 1
+                    if limit and count >= limit:
+                        return
+
+def _params_query(params, from_ts, to_ts, device=None, limit=None, after=None):
+    cols = [sensor_datas.c.timestamp] + [sensor_datas.c.get(p) for p in params] + [sensor_datas.c.id]
+    query = select(*cols).where(sensor_datas.c.timestamp.between(from_ts, to_ts))
+    if device:
+        query = query.where(sensor_datas.c.device == device)
+    query = _keyset(query, after)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+async def query_by_params(params, from_ts, to_ts, device=None, limit=None, after=None):
+    return await _fetch(_params_query(params, from_ts, to_ts, device, limit, after), from_ts, to_ts, limit)
+
+def stream_by_params(params, from_ts, to_ts, device=None, limit=None, after=None):
+    return _stream(_params_query(params, from_ts, to_ts, device, limit, after), from_ts, to_ts, limit)
+
+def _all_query(filters):
+    query = select(sensor_datas)
+    if filters.get("device"):
+        query = query.where(sensor_datas.c.device == filters["device"])
+    if filters.get("from_ts") and filters.get("to_ts"):
+        query = query.where(sensor_datas.c.timestamp.between(filters["from_ts"], filters["to_ts"]))
+    query = _keyset(query, filters.get("after"))
+    if filters.get("limit"):
+        query = query.limit(filters["limit"])
+    return query
+
+def _all_range(filters):
+    if filters.get("from_ts") and filters.get("to_ts"):
+        return filters["from_ts"], filters["to_ts"]
+    return None, None
+
+async def get_all(filters):
+    return await _fetch(_all_query(filters), *_all_range(filters), filters.get("limit"))
+
+def stream_all(filters):
+    return _stream(_all_query(filters), *_all_range(filters), filters.get("limit"))
+
+async def list_devices():
+    devices = []
+    for row in await _fetch(select(sensor_datas.c.device).distinct()):
+        if row[0] not in devices:
+            devices.append(row[0])
+    return devices
+
+# Lebar bucket statistik (detik)
+STAT_BUCKETS = {"1h": 3600, "1d": 86400, "1w": 7 * 86400}
+
+def _bucket_expr(bucket):
+    """Awal bucket dalam waktu lokal; minggu dimulai hari Senin"""
+    width = STAT_BUCKETS[bucket]
+    offset = time.localtime().tm_gmtoff
+    if bucket == "1w":
+        # Epoch 0 jatuh pada hari Kamis; geser 3 hari agar bucket mulai Senin
+        offset += 3 * 86400
+    ts = sensor_datas.c.timestamp
+    return ts - (ts + offset) % width
+
+def _stat_row(param, avg, mn, mx, count, m2):
+    stddev = None
+    if count:
+        # Simpangan baku populasi dari jumlah kuadrat deviasi (M2)
+        stddev = math.sqrt(max(0.0, m2 / count))
+    return {"parameter": param, "avg": avg, "min": mn, "max": mx, "count": count, "stddev": stddev}
+
+def _centered_aggs(values):
+    """
+    (avg, min, max, count, avg_d, avg_dd) per parameter dari query ->
+    (avg, min, max, count, m2). d = x - shift dengan shift sebuah nilai dari
+    rentang itu sendiri, jadi E[d^2] - E[d]^2 tidak kehilangan presisi untuk
+    nilai dengan rata-rata besar dan sebaran kecil (mis. tekanan ±1013 hPa).
+    """
+    out = ()
+    for i in range(0, len(values), 6):
+        avg, mn, mx, n, avg_d, avg_dd = values[i:i + 6]
+        out += (avg, mn, mx, n, n * max(0.0, avg_dd - avg_d * avg_d) if n else 0.0)
+    return out
+
+def _merge_aggs(a, b):
+    """Gabungkan (avg, min, max, count, m2) per parameter dari dua jendela (Chan dkk.)"""
+    merged = ()
+    for i in range(0, len(a), 5):
+        avg1, mn1, mx1, n1, m2_1 = a[i:i + 5]
+        avg2, mn2, mx2, n2, m2_2 = b[i:i + 5]
+        if not n2:
+            merged += a[i:i + 5]
+        elif not n1:
+            merged += b[i:i + 5]
+        else:
+            n = n1 + n2
+            delta = avg2 - avg1
+            merged += (avg1 + delta * n2 / n, min(mn1, mn2), max(mx1, mx2), n,
+                       m2_1 + m2_2 + delta * delta * n1 * n2 / n)
+    return merged
+
+async def stats_for_params(params, from_ts, to_ts, bucket=None, device=None):
+    """
+    avg/min/max/count/stddev untuk semua parameter dalam SATU query (satu
+    kali scan rentang waktu). Dengan `bucket` (1h/1d/1w) hasilnya berupa
+    time series: [{"bucket": ts, "stats": [...]}, ...].
+    """
+    unknown = [p for p in params if sensor_datas.c.get(p) is None]
+    if unknown:
+        raise ValueError(f"Parameter tidak dikenal: {', '.join(unknown)}")
+    if bucket and bucket not in STAT_BUCKETS:
+        raise ValueError(f"Bucket tidak dikenal: {bucket}")
+
+    in_range = [sensor_datas.c.timestamp.between(from_ts, to_ts)]
+    if device:
+        in_range.append(sensor_datas.c.device == device)
+
+    aggs = []
+    for p in params:
+        col = sensor_datas.c.get(p)
+        # Titik tengah per parameter: nilai pertama di rentang (subquery tak
+        # berkorelasi, dihitung sekali per query)
+        shift = select(col).where(*in_range, col.isnot(None)).limit(1).scalar_subquery()
+        d = col - shift
+        aggs += [func.avg(col), func.min(col), func.max(col), func.count(col), func.avg(d), func.avg(d * d)]
+
+    if bucket:
+        b = _bucket_expr(bucket).label("bucket")
+        query = select(b, *aggs).group_by(b).order_by(b)
+    else:
+        query = select(*aggs)
+    query = query.where(*in_range)
+
+    # Tiap jendela partisi menghasilkan agregat sendiri; gabungkan per bucket
+    merged = {}
+    for window in router.windows(from_ts, to_ts):
+        async with _reading(window) as conn:
+            for r in await _rows(conn, query):
+                key, values = (r[0], _centered_aggs(tuple(r[1:]))) if bucket else (None, _centered_aggs(tuple(r)))
+                merged[key] = _merge_aggs(merged[key], values) if key in merged else values
+    rows = [(key,) + values for key, values in sorted(merged.items())] if bucket else list(merged.values())
+
+    def unpack(values):
+        return [_stat_row(p, *values[i * 5:(i + 1) * 5]) for i, p in enumerate(params)]
+
+    if bucket:
+        return [{"bucket": r[0], "stats": unpack(r[1:])} for r in rows]
+    return unpack(rows[0])
+
+async def stats_for_param(param, from_ts, to_ts):
+    return (await stats_for_params([param], from_ts, to_ts))[0]
+
+# ================================================================
+# Geo: bbox/nearest diselesaikan ke registry stasiun (R-tree) dulu,
+# baru pembacaan device terkait diambil lewat index (device, timestamp)
+# ================================================================
+
+async def stations_in_bbox(min_lat, max_lat, min_lon, max_lon):
+    async with _reading(pool=lookup_pool) as conn:
+        query = select(stations).join(stations_rtree, stations_rtree.c.id == stations.c.id).where(
             and_(
-                sensor_datas.c.latitude >= min_lat,
-                sensor_datas.c.latitude <= max_lat,
-                sensor_datas.c.longitude >= min_lon,
-                sensor_datas.c.longitude <= max_lon
+                stations_rtree.c.min_lat >= min_lat,
+                stations_rtree.c.max_lat <= max_lat,
+                stations_rtree.c.min_lon >= min_lon,
+                stations_rtree.c.max_lon <= max_lon
             )
         )
-        return db.execute(query).fetchall()
+        return [dict(r) for r in await _rows(conn, query)]
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+async def nearest_stations(lat, lon, n=5):
+    """
+    N stasiun terdekat. R-tree tidak punya kNN, jadi kotak pencarian
+    diperbesar bertahap sampai cukup stasiun berada di dalam lingkaran yang
+    pasti termuat kotak (stasiun di sudut kotak belum tentu lebih dekat dari
+    stasiun di luar kotak), lalu diurutkan berdasarkan jarak.
+    """
+    radius = 0.1  # derajat (~11 km)
+    while True:
+        candidates = await stations_in_bbox(lat - radius, lat + radius, lon - radius, lon + radius)
+        for st in candidates:
+            st["distance_km"] = round(_haversine_km(lat, lon, st["latitude"], st["longitude"]), 3)
+        safe_km = min(_haversine_km(lat, lon, lat + radius, lon), _haversine_km(lat, lon, lat, lon + radius))
+        inside = [st for st in candidates if st["distance_km"] <= safe_km]
+        if len(inside) >= n:
+            return sorted(inside, key=lambda st: st["distance_km"])[:n]
+        if radius >= 180:
+            # Kotak sudah mencakup seluruh bumi
+            return sorted(candidates, key=lambda st: st["distance_km"])[:n]
+        radius *= 4
+
+async def latest_for_devices(devices):
+    """Pembacaan terakhir tiap device (satu lookup index per device)"""
+    rows = []
+    for device in devices:
+        query = select(sensor_datas).where(sensor_datas.c.device == device) \
+            .order_by(desc(sensor_datas.c.timestamp)).limit(1)
+        row = await _latest(query)
+        if row:
+            rows.append(row)
+    return rows
+
+async def range_for_devices(devices, from_ts, to_ts, limit=None):
+    if not devices:
+        return []
+    query = select(sensor_datas).where(
+        and_(
+            sensor_datas.c.device.in_(devices),
+            sensor_datas.c.timestamp.between(from_ts, to_ts)
+        )
+    ).order_by(sensor_datas.c.timestamp, sensor_datas.c.id)
+    if limit:
+        query = query.limit(limit)
+    return await _fetch(query, from_ts, to_ts, limit)
+
+async def query_geo(min_lat, max_lat, min_lon, max_lon, mode="latest", from_ts=None, to_ts=None, limit=None):
+    """
+    mode="stations" → daftar stasiun dalam bbox
+    mode="latest"   → pembacaan terakhir tiap stasiun dalam bbox
+    mode="range"    → pembacaan stasiun dalam bbox pada rentang waktu
+    """
+    found = await stations_in_bbox(min_lat, max_lat, min_lon, max_lon)
+    if mode == "stations":
+        return found
+    devices = [st["device"] for st in found]
+    if mode == "range":
+        rows = await range_for_devices(devices, from_ts, to_ts, limit)
+    else:
+        rows = await latest_for_devices(devices)
+    return [dict(r) for r in rows]
@@ -1,11 +1,95 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import sys
+
+import aiosqlite
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Modul bersama (skema/migrasi) berada di folder backend
+sys.path.append(str(BASE_DIR / "backend"))
+from connections import apply_profile, profile_pragmas, readonly_uri, sqlite_profile
+
 DB_PATH = BASE_DIR / "database" / "aws_db.sqlite"
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Engine sync hanya untuk jalur tulis (ingest, dijalankan di threadpool)
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 metadata = MetaData()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@event.listens_for(engine, "connect")
+def _writer_profile(dbapi_conn, connection_record):
+    # Profil PRAGMA bersama (WAL, checkpoint, mmap, ...) untuk koneksi writer
+    apply_profile(dbapi_conn)
+
+
+# ================================================================
+# Pembaca async: endpoint baca memakai koneksi aiosqlite read-only
+# (mode=ro + query_only) yang tetap terbuka. Dalam mode WAL pembaca
+# tidak menunggu writer. Jumlah koneksi dibatasi per pool; request yang
+# belum kebagian koneksi menunggu di event loop, bukan memakan thread.
+# ================================================================
+
+READ_POOL_SIZE = 4     # query rentang / statistik / streaming paralel
+LOOKUP_POOL_SIZE = 2   # jalur terpisah untuk lookup index (latest, stasiun)
+READ_CHUNK = 1000      # baris per fetch saat iterasi cursor
+
+# Profil PRAGMA pembaca dari connections.py (query_only, mmap, cache, ...)
+READER_PRAGMAS = profile_pragmas(readonly=True)
+
+_dialect = sqlite.dialect(paramstyle="qmark")
+
+def compile_query(query):
+    """Query SQLAlchemy Core -> (sql, parameter) untuk aiosqlite"""
+    compiled = query.compile(dialect=_dialect, compile_kwargs={"render_postcompile": True})
+    return str(compiled), [compiled.params[name] for name in compiled.positiontup]
+
+
+class ReadPool:
+    """Maksimal `size` koneksi aiosqlite read-only, dibuka saat pertama dipakai"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._slots = None
+
+    async def _open(self):
+        conn = await aiosqlite.connect(readonly_uri(self.path), uri=True, isolation_level=None,
+                                       iter_chunk_size=READ_CHUNK,
+                                       cached_statements=int(sqlite_profile()["cached_statements"]))
+        conn.row_factory = aiosqlite.Row
+        for pragma in READER_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._open()
+            try:
+                yield conn
+            except asyncio.CancelledError:
+                # Dibatalkan di tengah query: state koneksi (ATTACH) tidak pasti
+                await conn.close()
+                raise
+            except BaseException:
+                self._idle.append(conn)
+                raise
+            self._idle.append(conn)
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+read_pool = ReadPool(DB_PATH, READ_POOL_SIZE)
+lookup_pool = ReadPool(DB_PATH, LOOKUP_POOL_SIZE)
@@ -1,25 +1,50 @@
-from fastapi import FastAPI, Query, Depends, Request
+from fastapi import FastAPI, Query, Depends, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Union
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+import gzip
+import io
+import json
+import threading
+import zlib
 
 import crud, schemas
-from database import metadata, engine
+from database import DB_PATH, read_pool, lookup_pool
 from auth import verify_token
+from migrations import run_migrations
+from connections import connect, describe_profile
+from latest_cache import LatestCacheReader, LatestCacheWriter
+from response_cache import ResponseCache, IngestVersion, cache_key, etag_matches
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Tutup koneksi pembaca async (thread aiosqlite) saat server berhenti
+    await read_pool.close()
+    await lookup_pool.close()
 
 # 🔧 Inisialisasi FastAPI App
 app = FastAPI(
     title="Sensor API",
     description="API untuk mengakses dan mengelola data sensor cuaca secara fleksibel",
     version="1.0.0",
-    docs_url=None  # Nonaktifkan Swagger bawaan
+    docs_url=None,  # Nonaktifkan Swagger bawaan
+    lifespan=lifespan
 )
 
-# 🔧 Jalankan otomatis pembuatan tabel (jika belum ada)
-metadata.create_all(bind=engine)
+# 🔧 Jalankan migrasi skema (tabel, index, registry stasiun) jika belum
+_conn = connect(DB_PATH)
+try:
+    print(f"🗄️ Profil SQLite API: {describe_profile(_conn)}")
+    run_migrations(_conn)
+finally:
+    _conn.close()
 
 # 🔧 Path direktori template & icon
 BASE_DIR = Path(__file__).resolve().parent
@@ -42,75 +67,328 @@ async def custom_docs(request: Request):
 
 # ✅ Endpoint untuk pengecekan server (opsional)
 @app.get("/health", tags=["utility"])
-def health():
+async def health():
     return {
         "status": "ok",
         "server_time": datetime.now().isoformat()
     }
 
+# ================================================================
+# ==========      PAGINATION & STREAMING HELPERS        ==========
+# ================================================================
+
+# Mode streaming: ndjson = satu objek JSON per baris, json = array JSON dikirim bertahap
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+def parse_cursor(cursor: Optional[str]):
+    """Cursor keyset berformat "<timestamp>:<id>" dari header X-Next-Cursor"""
+    if not cursor:
+        return None
+    try:
+        ts, row_id = cursor.split(":")
+        return int(ts), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor tidak valid, gunakan nilai X-Next-Cursor")
+
+def paged_response(items, last_row, limit):
+    """
+    Response JSON biasa (tanpa validasi pydantic per baris). Jika halaman
+    penuh, cursor halaman berikutnya dikirim di header X-Next-Cursor.
+    """
+    headers = {}
+    if limit and last_row is not None and len(items) == limit:
+        headers["X-Next-Cursor"] = f"{last_row['timestamp']}:{last_row['id']}"
+    return JSONResponse(content=items, headers=headers)
+
+def stream_response(rows, to_item, mode):
+    """Serialisasi baris langsung dari cursor DB (async) ke response chunked"""
+    async def ndjson():
+        async for r in rows:
+            yield json.dumps(to_item(r)) + "\n"
+
+    async def json_array():
+        yield "["
+        first = True
+        async for r in rows:
+            yield ("" if first else ",") + json.dumps(to_item(r))
+            first = False
+        yield "]"
+
+    body = ndjson() if mode == "ndjson" else json_array()
+    return StreamingResponse(body, media_type=STREAM_MEDIA_TYPES[mode])
+
+# ================================================================
+# ==========        CACHE RESPONSE (ETag + LRU)          =========
+# ================================================================
+
+# 🔧 Cache data terakhir bersama service sensor (lihat backend/latest_cache.py)
+latest_cache = LatestCacheReader()
+_latest_cache_writer = None
+_latest_cache_lock = threading.Lock()
+
+# GET /api/sensors/* dirender sekali per versi ingest; token ikut dalam
+# kunci agar response ber-auth tidak bocor ke request tanpa token
+response_cache = ResponseCache()
+ingest_version = IngestVersion(DB_PATH, latest_cache)
+
+def cached_response(request: Request, entry):
+    headers = dict(entry.headers, ETag=entry.etag)
+    headers["Cache-Control"] = "no-cache"
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+@app.middleware("http")
+async def response_cache_middleware(request: Request, call_next):
+    if (request.method != "GET" or not request.url.path.startswith("/api/sensors/")
+            or request.query_params.get("stream")):
+        return await call_next(request)
+
+    key = cache_key(request.url.path, request.query_params.multi_items(),
+                    ingest_version.current(), request.headers.get("authorization"))
+    entry = response_cache.get(key)
+    if entry is None:
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = response_cache.put(key, body, response.media_type or response.headers.get("content-type"),
+                                   dict(response.headers))
+    return cached_response(request, entry)
+
 # ================================================================
 # ==========        SENSOR DATA ENDPOINTS (UTAMA)        =========
 # ================================================================
 
+def update_latest_cache(row):
+    global _latest_cache_writer
+    try:
+        # Dipanggil dari threadpool: writer (mmap + fd) hanya boleh dibuat sekali
+        with _latest_cache_lock:
+            if _latest_cache_writer is None:
+                _latest_cache_writer = LatestCacheWriter()
+        _latest_cache_writer.update([row])
+    except OSError as e:
+        print(f"⚠️ Cache data terakhir tidak diperbarui: {e}")
+
 @app.get("/api/sensors/latest")
-def latest(device: Optional[str] = None):
-    row = crud.get_latest(device)
-    return dict(row._mapping) if row else {}
+async def latest(device: Optional[str] = None):
+    cached = latest_cache.get(device or None)
+    if cached:
+        return cached
+    row = await crud.get_latest(device)
+    return dict(row) if row else {}
 
 @app.get("/api/sensors/query", response_model=List[schemas.SensorQueryResponse])
-def query_params(
+async def query_params(
     params: List[str] = Query(...),
     from_: datetime = Query(..., alias="from"),
     to: datetime = Query(..., alias="to"),
     device: Optional[str] = None,
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="Nilai X-Next-Cursor dari halaman sebelumnya"),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$", description="Streaming: ndjson atau json")
 ):
     from_ts = int(from_.timestamp())
     to_ts = int((to + timedelta(days=1)).timestamp()) - 1
-    rows = crud.query_by_params(params, from_ts, to_ts, device, limit)
-    return [{"timestamp": r[0], "data": dict(zip(params, r[1:]))} for r in rows]
+    after = parse_cursor(cursor)
+    n = len(params)
+
+    def to_item(r):
+        return {"timestamp": r[0], "data": dict(zip(params, r[1:n + 1]))}
+
+    if stream:
+        return stream_response(crud.stream_by_params(params, from_ts, to_ts, device, limit, after), to_item, stream)
+
+    rows = await crud.query_by_params(params, from_ts, to_ts, device, limit, after)
+    return paged_response([to_item(r) for r in rows], rows[-1] if rows else None, limit)
 
 @app.get("/api/sensors/all")
-def get_all_data(
+async def get_all_data(
     device: Optional[str] = None,
     from_: Optional[datetime] = Query(None, alias="from"),
     to: Optional[datetime] = Query(None, alias="to"),
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="Nilai X-Next-Cursor dari halaman sebelumnya"),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$", description="Streaming: ndjson atau json")
 ):
     filters = {
         "device": device,
         "from_ts": int(from_.timestamp()) if from_ else None,
         "to_ts": int((to + timedelta(days=1)).timestamp()) - 1 if to else None,
-        "limit": limit
+        "limit": limit,
+        "after": parse_cursor(cursor)
     }
-    rows = crud.get_all(filters)
-    return [dict(r._mapping) for r in rows]
+
+    def to_item(r):
+        return dict(r)
+
+    if stream:
+        return stream_response(crud.stream_all(filters), to_item, stream)
+
+    rows = await crud.get_all(filters)
+    return paged_response([to_item(r) for r in rows], rows[-1] if rows else None, limit)
 
 @app.post("/api/sensors/", dependencies=[Depends(verify_token)])
 def post_sensor(data: schemas.SensorCreate):
-    crud.insert_data(data.dict())
+    row = crud.insert_data(data.dict())
+    if row.get("timestamp") is not None:
+        update_latest_cache(row)
     return {"status": "success"}
 
+# Ingest massal: array JSON atau NDJSON (satu objek SensorCreate per baris)
+BULK_BATCH = 500
+MAX_BULK_ITEMS = 100000
+MAX_BULK_ERRORS = 100
+MAX_BULK_BYTES = 64 * 1024 * 1024  # batas body setelah dekompresi
+
+def decode_bulk_body(body: bytes, content_encoding: str):
+    """Body gzip (mis. dari uplink stasiun) didekompresi dengan batas ukuran"""
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return body
+    if encoding != "gzip":
+        raise ValueError(f"Content-Encoding {content_encoding} tidak didukung")
+    try:
+        data = gzip.GzipFile(fileobj=io.BytesIO(body)).read(MAX_BULK_BYTES + 1)
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"gzip rusak: {e}")
+    if len(data) > MAX_BULK_BYTES:
+        raise ValueError("Body terlalu besar setelah dekompresi")
+    return data
+
+def parse_bulk_body(body: bytes, content_type: str):
+    """Kembalikan list item (dict, atau Exception untuk baris NDJSON yang rusak)"""
+    text = body.decode("utf-8").strip()
+    if text.startswith("[") and "ndjson" not in content_type:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("Body harus array JSON")
+        return items
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(e)
+    return items
+
+def ingest_bulk(items, batch_size):
+    """Validasi lalu upsert per batch; kegagalan satu batch tidak membatalkan batch lain"""
+    result = {"accepted": 0, "rejected": 0, "inserted": 0, "updated": 0, "batches": [], "errors": []}
+
+    def reject(index, error):
+        result["rejected"] += 1
+        if len(result["errors"]) < MAX_BULK_ERRORS:
+            result["errors"].append({"index": index, "error": error})
+
+    for number, start in enumerate(range(0, len(items), batch_size), 1):
+        rows = []
+        rejected = result["rejected"]
+        for index, item in enumerate(items[start:start + batch_size], start):
+            if isinstance(item, Exception):
+                reject(index, f"JSON tidak valid: {item}")
+                continue
+            if not isinstance(item, dict):
+                reject(index, "Item harus berupa objek JSON")
+                continue
+            try:
+                rows.append(schemas.SensorCreate(**item).dict())
+            except ValidationError as e:
+                reject(index, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        batch = {"batch": number, "accepted": 0, "rejected": result["rejected"] - rejected}
+        if rows:
+            try:
+                inserted, updated, latest = crud.upsert_batch(rows)
+            except Exception as e:
+                batch["rejected"] += len(rows)
+                batch["error"] = str(e)
+                result["rejected"] += len(rows)
+            else:
+                batch.update(accepted=len(rows), inserted=inserted, updated=updated)
+                result["accepted"] += len(rows)
+                result["inserted"] += inserted
+                result["updated"] += updated
+                for row in latest:
+                    update_latest_cache(row)
+        result["batches"].append(batch)
+    result["status"] = "success" if not result["rejected"] else ("partial" if result["accepted"] else "failed")
+    return result
+
+@app.post("/api/sensors/bulk", response_model=schemas.SensorBulkResponse, dependencies=[Depends(verify_token)])
+async def post_sensor_bulk(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH, ge=1, le=5000, description="Baris per transaksi")
+):
+    """
+    Backfill banyak pembacaan sekaligus. Body berupa array JSON atau NDJSON
+    (Content-Type application/x-ndjson), boleh dikompresi (Content-Encoding:
+    gzip). Pembacaan dengan (device, timestamp) yang sudah ada diperbarui
+    (upsert), sehingga batch yang dikirim ulang tidak menggandakan data.
+    """
+    try:
+        body = decode_bulk_body(await request.body(), request.headers.get("content-encoding", ""))
+        items = parse_bulk_body(body, request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Body tidak valid: {e}")
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Maksimal {MAX_BULK_ITEMS} pembacaan per request")
+    return await run_in_threadpool(ingest_bulk, items, batch_size)
+
 @app.get("/api/sensors/devices")
-def list_devices():
-    return crud.list_devices()
+async def list_devices():
+    return await crud.list_devices()
 
-@app.get("/api/sensors/stats", response_model=List[schemas.SensorStatResponse], dependencies=[Depends(verify_token)])
-def sensor_stats(
+@app.get(
+    "/api/sensors/stats",
+    response_model=Union[List[schemas.SensorStatResponse], List[schemas.SensorStatBucketResponse]],
+    dependencies=[Depends(verify_token)]
+)
+async def sensor_stats(
     params: List[str] = Query(...),
     from_: datetime = Query(..., alias="from"),
-    to: datetime = Query(..., alias="to")
+    to: datetime = Query(..., alias="to"),
+    bucket: Optional[str] = Query(None, pattern="^(1h|1d|1w)$", description="Kelompokkan per 1h, 1d, atau 1w"),
+    device: Optional[str] = None
 ):
     from_ts = int(from_.timestamp())
     to_ts = int((to + timedelta(days=1)).timestamp()) - 1
-    return [crud.stats_for_param(p, from_ts, to_ts) for p in params]
+    try:
+        return await crud.stats_for_params(params, from_ts, to_ts, bucket, device)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/sensors/geo")
-def geo_query(
+async def geo_query(
     min_lat: float,
     max_lat: float,
     min_lon: float,
-    max_lon: float
+    max_lon: float,
+    mode: str = Query("latest", pattern="^(latest|range|stations)$",
+                      description="latest: data terakhir per stasiun, range: data pada rentang waktu, stations: daftar stasiun"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = Query(None, alias="to"),
+    limit: Optional[int] = 10000
+):
+    from_ts = to_ts = None
+    if mode == "range":
+        if not from_ or not to:
+            raise HTTPException(status_code=400, detail="mode=range membutuhkan parameter from dan to")
+        from_ts = int(from_.timestamp())
+        to_ts = int((to + timedelta(days=1)).timestamp()) - 1
+    return await crud.query_geo(min_lat, max_lat, min_lon, max_lon, mode, from_ts, to_ts, limit)
+
+@app.get("/api/sensors/geo/nearest")
+async def geo_nearest(
+    lat: float,
+    lon: float,
+    n: int = Query(5, ge=1, le=100)
 ):
-    rows = crud.query_geo(min_lat, max_lat, min_lon, max_lon)
-    return [dict(r._mapping) for r in rows]
+    """N stasiun terdekat beserta jarak (km) dan data terakhirnya"""
+    nearest = await crud.nearest_stations(lat, lon, n)
+    latest = {r["device"]: dict(r) for r in await crud.latest_for_devices([st["device"] for st in nearest])}
+    for st in nearest:
+        st["latest"] = latest.get(st["device"])
+    return nearest
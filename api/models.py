@@ -1,5 +1,6 @@
 from sqlalchemy import Table, Column, Integer, Float, Text
 from database import metadata
+from aggregator import STAT_COLUMNS
 
 sensor_datas = Table(
     "sensor_datas",
@@ -18,5 +19,31 @@ sensor_datas = Table(
     Column("latitude", Float),
     Column("longitude", Float),
     Column("altitude", Float),
-    Column("location", Text)
+    Column("location", Text),
+    # Kolom statistik mode agregasi (lihat backend/migrations.py)
+    *[Column(col, Integer if col == "sample_count" else Float) for col in STAT_COLUMNS]
+)
+
+# Registry stasiun (satu baris per device) + R-tree lokasinya
+stations = Table(
+    "stations",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("device", Text),
+    Column("location", Text),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("altitude", Float),
+    Column("first_ts", Integer),
+    Column("last_ts", Integer)
+)
+
+stations_rtree = Table(
+    "stations_rtree",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+    Column("min_lon", Float),
+    Column("max_lon", Float)
 )
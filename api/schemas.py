@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 class SensorBase(BaseModel):
     timestamp: int
@@ -28,3 +28,30 @@ class SensorStatResponse(BaseModel):
     avg: Optional[float]
     min: Optional[float]
     max: Optional[float]
+    count: Optional[int] = None
+    stddev: Optional[float] = None
+
+class SensorStatBucketResponse(BaseModel):
+    bucket: int
+    stats: List[SensorStatResponse]
+
+class SensorBulkBatch(BaseModel):
+    batch: int
+    accepted: int
+    rejected: int
+    inserted: int = 0
+    updated: int = 0
+    error: Optional[str] = None
+
+class SensorBulkError(BaseModel):
+    index: int
+    error: str
+
+class SensorBulkResponse(BaseModel):
+    status: str
+    accepted: int
+    rejected: int
+    inserted: int
+    updated: int
+    batches: List[SensorBulkBatch]
+    errors: List[SensorBulkError]
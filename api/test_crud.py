@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+import crud
+from partitions import PartitionRouter, month_start, rotate_partitions
+from rollup import bucket_start
+
+HOUR = 3600
+T0 = 1_750_000_800  # awal jam UTC
+
+
+def reading(ts, temp, device="A", **extra):
+    row = {"timestamp": ts, "device": device, "temp": temp, "hum": 70.0, "press": 1010.0, "wspeed": 2.0,
+           "wdir": 90.0, "rain": 0.0, "srad": 500.0, "latitude": None, "longitude": None,
+           "altitude": None, "location": None}
+    row.update(extra)
+    return row
+
+
+def fetch(path, sql, *args):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+
+def test_insert_then_update_counts(db_file):
+    inserted, updated, latest = crud.upsert_batch([reading(T0 + i * 300, 20.0 + i) for i in range(3)])
+    assert (inserted, updated) == (3, 0)
+    assert [r["timestamp"] for r in latest] == [T0 + 600]
+    assert latest[0]["id"] == 3
+
+    inserted, updated, _ = crud.upsert_batch([reading(T0, 30.0), reading(T0 + 300, 31.0), reading(T0 + 900, 23.0)])
+    assert (inserted, updated) == (1, 2)
+    rows = fetch(db_file, "SELECT id, timestamp, temp FROM sensor_datas ORDER BY timestamp")
+    # Koreksi mempertahankan id; baris baru mendapat id baru
+    assert rows[:3] == [(1, T0, 30.0), (2, T0 + 300, 31.0), (3, T0 + 600, 22.0)]
+    assert rows[3][0] > 3 and rows[3][1:] == (T0 + 900, 23.0)
+
+
+def test_duplicate_key_within_batch_counts_as_update(db_file):
+    inserted, updated, latest = crud.upsert_batch([reading(T0, 20.0), reading(T0, 21.0), reading(T0, 22.0, "B")])
+    assert (inserted, updated) == (2, 1)
+    assert fetch(db_file, "SELECT device, temp FROM sensor_datas ORDER BY device") == [("A", 21.0), ("B", 22.0)]
+    assert sorted((r["device"], r["temp"]) for r in latest) == [("A", 21.0), ("B", 22.0)]
+
+
+def test_every_write_gets_new_change_seq(db_file):
+    crud.upsert_batch([reading(T0, 20.0), reading(T0 + 300, 21.0)])
+    before = dict(fetch(db_file, "SELECT id, change_seq FROM sensor_datas"))
+    crud.upsert_batch([reading(T0, 25.0)])
+    after = dict(fetch(db_file, "SELECT id, change_seq FROM sensor_datas"))
+    assert after[2] == before[2]
+    assert after[1] > max(before.values())
+    assert fetch(db_file, "SELECT seq FROM change_counter") == [(after[1],)]
+
+
+def test_rollups_follow_corrections(db_file):
+    crud.upsert_batch([reading(T0 + i * 300, 20.0) for i in range(4)])
+    crud.upsert_batch([reading(T0, 40.0), reading(T0 + HOUR, 10.0)])
+    hours = fetch(db_file, "SELECT bucket, temp_count, temp_avg, temp_max FROM sensor_rollup_1h ORDER BY bucket")
+    assert hours == [(bucket_start(T0, HOUR), 4, 25.0, 40.0), (bucket_start(T0 + HOUR, HOUR), 1, 10.0, 10.0)]
+
+
+def test_old_month_goes_to_partition(db_file, monkeypatch):
+    settings = {"enabled": True, "hot_months": 1, "batch_sleep": 0}
+    old = month_start("2025-01") + HOUR
+    crud.upsert_batch([reading(old, 20.0), reading(old + 300, 21.0)])
+    rotate_partitions(db_file, settings, now=month_start("2025-03"))
+    router = PartitionRouter(db_file, settings)
+    monkeypatch.setattr(crud, "router", router)
+
+    inserted, updated, latest = crud.upsert_batch([reading(old, 19.5), reading(old + 600, 22.0),
+                                                   reading(month_start("2025-03"), 18.0)])
+    assert (inserted, updated) == (2, 1)
+    part = router.path("2025-01")
+    assert fetch(part, "SELECT timestamp, temp FROM sensor_datas ORDER BY timestamp") == [
+        (old, 19.5), (old + 300, 21.0), (old + 600, 22.0)]
+    assert fetch(db_file, "SELECT COUNT(*) FROM sensor_datas") == [(1,)]
+    # Nomor change_seq baris partisi diambil dari penghitung main (tidak bentrok)
+    seqs = [s for (s,) in fetch(part, "SELECT change_seq FROM sensor_datas")]
+    seqs += [s for (s,) in fetch(db_file, "SELECT change_seq FROM sensor_datas")]
+    assert len(set(seqs)) == len(seqs)
+    assert max(seqs) == fetch(db_file, "SELECT seq FROM change_counter")[0][0]
@@ -0,0 +1,166 @@
+import math
+
+# === Parameter & Kolom Statistik ===
+PARAMETERS = ["temp", "hum", "press", "wspeed", "wdir", "rain", "srad"]
+
+# Parameter skalar yang dirata-rata biasa (wdir & rain punya perlakuan khusus)
+SCALAR_PARAMS = ["temp", "hum", "press", "wspeed", "srad"]
+
+# Kolom tambahan di sensor_datas untuk mode agregasi
+STAT_COLUMNS = (
+    [f"{p}_{s}" for p in SCALAR_PARAMS for s in ("min", "max", "std")]
+    + ["wdir_std", "wind_vec_speed", "wind_vec_dir", "rain_sum", "sample_count"]
+)
+
+
+class RunningStats:
+    """Min/max/mean/stddev berjalan (algoritma Welford), tanpa menyimpan sampel"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        if x is None:
+            return
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+
+    @property
+    def std(self):
+        # Simpangan baku populasi — seluruh sampel interval diamati
+        return math.sqrt(self.m2 / self.n) if self.n else None
+
+    def result(self):
+        if not self.n:
+            return None, None, None, None
+        return self.mean, self.min, self.max, self.std
+
+
+class IntervalAggregator:
+    """
+    Mengumpulkan sampel frekuensi tinggi dalam satu interval penyimpanan.
+
+    - Parameter skalar: mean/min/max/stddev
+    - Arah angin: rata-rata vektor satuan + stddev Yamartino
+    - Angin vektor: kecepatan & arah dari rata-rata vektor (berbobot kecepatan)
+    - Hujan: akumulasi selama interval. `rain_mode="counter"` untuk sensor yang
+      melaporkan total kumulatif (diambil selisih positif), `"sum"` untuk
+      sensor yang melaporkan curah hujan per pembacaan.
+    """
+
+    def __init__(self, rain_mode="counter"):
+        self.rain_mode = rain_mode
+        self._last_rain = None
+        self.reset()
+
+    def reset(self):
+        self.stats = {p: RunningStats() for p in SCALAR_PARAMS}
+        self.count = 0
+        self._dir_sin = 0.0
+        self._dir_cos = 0.0
+        self._dir_n = 0
+        self._u = 0.0
+        self._v = 0.0
+        self._vec_n = 0
+        self.rain_sum = 0.0
+        self.rain_last = None
+
+    def add(self, sample):
+        """Tambahkan satu sampel (tuple urut PARAMETERS atau dict)"""
+        if not isinstance(sample, dict):
+            sample = dict(zip(PARAMETERS, sample))
+
+        self.count += 1
+        for p in SCALAR_PARAMS:
+            self.stats[p].add(sample.get(p))
+
+        wspeed, wdir = sample.get("wspeed"), sample.get("wdir")
+        if wdir is not None:
+            rad = math.radians(wdir)
+            self._dir_sin += math.sin(rad)
+            self._dir_cos += math.cos(rad)
+            self._dir_n += 1
+            if wspeed is not None:
+                self._u += wspeed * math.sin(rad)
+                self._v += wspeed * math.cos(rad)
+                self._vec_n += 1
+
+        rain = sample.get("rain")
+        if rain is not None:
+            self._add_rain(rain)
+
+    def _add_rain(self, rain):
+        if self.rain_mode == "sum":
+            self.rain_sum += rain
+        elif self._last_rain is not None:
+            # Counter kumulatif; nilai turun berarti counter direset
+            delta = rain - self._last_rain
+            self.rain_sum += delta if delta >= 0 else rain
+        self._last_rain = rain
+        self.rain_last = rain
+
+    def _wind_direction(self):
+        if not self._dir_n:
+            return None, None
+        sa = self._dir_sin / self._dir_n
+        ca = self._dir_cos / self._dir_n
+        direction = (math.degrees(math.atan2(sa, ca)) + 360) % 360
+        # Yamartino (1984)
+        eps = math.sqrt(max(0.0, 1 - (sa * sa + ca * ca)))
+        std = math.degrees(math.asin(eps) * (1 + (2 / math.sqrt(3) - 1) * eps ** 3))
+        return direction, std
+
+    def _wind_vector(self):
+        if not self._vec_n:
+            return None, None
+        u = self._u / self._vec_n
+        v = self._v / self._vec_n
+        return math.hypot(u, v), (math.degrees(math.atan2(u, v)) + 360) % 360
+
+    def summary(self):
+        """
+        Ringkasan interval: (values, stats). `values` berisi kolom utama
+        sensor_datas, `stats` berisi kolom STAT_COLUMNS. None jika kosong.
+        """
+        if not self.count:
+            return None
+
+        values, stats = {}, {}
+        for p in SCALAR_PARAMS:
+            mean, lo, hi, std = self.stats[p].result()
+            values[p] = _round(mean)
+            stats[f"{p}_min"] = _round(lo)
+            stats[f"{p}_max"] = _round(hi)
+            stats[f"{p}_std"] = _round(std)
+
+        wdir, wdir_std = self._wind_direction()
+        values["wdir"] = _round(wdir)
+        stats["wdir_std"] = _round(wdir_std)
+
+        vec_speed, vec_dir = self._wind_vector()
+        stats["wind_vec_speed"] = _round(vec_speed)
+        stats["wind_vec_dir"] = _round(vec_dir)
+
+        # Kolom rain tetap berisi pembacaan terakhir seperti mode lama
+        values["rain"] = self.rain_last
+        stats["rain_sum"] = _round(self.rain_sum) if self.rain_last is not None else None
+        stats["sample_count"] = self.count
+        return values, stats
+
+    def flush(self):
+        """Ambil ringkasan lalu mulai interval baru"""
+        result = self.summary()
+        self.reset()
+        return result
+
+
+def _round(x, digits=2):
+    return None if x is None else round(x, digits)
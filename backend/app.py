@@ -1,6 +1,7 @@
-from flask import Flask, send_from_directory, jsonify, request, send_file
+from flask import Flask, send_from_directory, jsonify, request, send_file, Response, stream_with_context, g
 import sqlite3
-import pandas as pd
+import csv
+import tempfile
 from datetime import datetime
 import json
 import os
@@ -10,6 +11,21 @@ import logging
 import traceback
 import re
 import subprocess
+import threading
+import time
+import math
+import atexit
+import queue
+from array import array
+
+from live import LiveHub, format_sse
+from latest_cache import LatestCacheReader
+from columns import Columns
+from partitions import PartitionRouter
+from connections import ReadOnlyConnections, describe_profile
+from windrose import WINDROSE_DEFAULTS, windrose_bins
+from response_cache import CACHE_DEFAULTS, ResponseCache, IngestVersion, cache_key, etag_matches
+from rollup import ROLLUP_PARAMS, choose_level, series_query, wind_query, wind_direction, RAW_INTERVAL
 
 # === Logging Setup ===
 log_path = "/opt/aws/logs/web.log"
@@ -110,10 +126,82 @@ def cleanup_usb_mounts():
     MOUNTED_USB = []  # Clear list
 
 
+# Koneksi read-only per thread worker yang tetap terbuka (lihat connections.py);
+# jangan di-close() setelah dipakai
+read_connections = ReadOnlyConnections(
+    DB_FILE,
+    row_factory=sqlite3.Row,  # supaya hasil bisa diakses dengan nama kolom
+    on_open=lambda conn: logging.info(f"🗄️ Profil SQLite web (pid {os.getpid()}): {describe_profile(conn)}")
+)
+
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # supaya hasil bisa diakses dengan nama kolom
-    return conn
+    return read_connections.get()
+
+
+# === Partisi bulanan (opsional, lihat partitions.py) ===
+# Query data mentah lewat router: hanya partisi yang beririsan dengan
+# rentang waktu yang di-ATTACH. Rollup & data terakhir tetap di database utama.
+partition_router = PartitionRouter(DB_FILE, readonly=True)
+
+
+def raw_connections(start, end):
+    """
+    Koneksi ke sensor_datas untuk rentang [start, end], sekali per jendela
+    partisi (koneksi thread yang sama, partisi di-ATTACH bergantian)
+    """
+    conn = get_db_connection()
+    for lo, hi, parts in partition_router.windows(start, end):
+        with partition_router.routed(conn, lo, hi, parts):
+            yield conn
+
+
+def fetch_raw_columns(query, params, start, end):
+    cols = None
+    for conn in raw_connections(start, end):
+        part = Columns.fetch(conn, query, params)
+        cols = part if cols is None else cols.extend(part)
+    return cols
+
+
+# Rentang waktu grafik (detik)
+RANGE_SECONDS = {
+    "realtime": 15 * 60,
+    "1h": 3600,
+    "12h": 12 * 3600,
+    "1d": 86400,
+    "3d": 3 * 86400,
+    "7d": 7 * 86400,
+    "30d": 30 * 86400,
+    "1y": 365 * 86400
+}
+
+
+def get_start_time(range_time, now):
+    return now - RANGE_SECONDS.get(range_time, RANGE_SECONDS["realtime"])
+
+
+def chart_params():
+    """Parameter yang boleh diminta: yang dikonfigurasi dan dikenal sebagai kolom"""
+    configured = CONFIG.get("parameters") or ROLLUP_PARAMS
+    return [param for param in configured if param in ROLLUP_PARAMS]
+
+
+def request_error(args):
+    """
+    Validasi query string grafik sebelum apa pun masuk ke SQL.
+    Mengembalikan pesan error (untuk response 400) atau None.
+    """
+    range_time = args.get('range', 'realtime')
+    if range_time not in RANGE_SECONDS:
+        return f"range harus salah satu dari {', '.join(RANGE_SECONDS)}"
+    param = args.get('param')
+    if param is not None and param not in chart_params():
+        return f"Parameter tidak dikenal: {param}. Pilihan: {', '.join(chart_params())}"
+    fmt = args.get('format', 'json')
+    if fmt not in CHART_FORMATS:
+        return f"format harus salah satu dari {', '.join(CHART_FORMATS)}"
+    return None
 
 
 def sanitize_filename(filename):
@@ -138,15 +226,69 @@ def get_config():
     return jsonify(CONFIG)
 
 
+# Cache data terakhir yang ditulis service sensor (lihat latest_cache.py)
+latest_cache = LatestCacheReader()
+
+
+# === Cache Response (ETag + LRU) ===
+# Endpoint baca dirender sekali per versi ingest; request berikutnya dengan
+# parameter yang sama dilayani dari memori, atau 304 jika ETag cocok.
+CACHED_PATHS = {"/api/latest", "/api/history", "/api/windrose", "/api/windrose/bins"}
+
+response_cache = ResponseCache(**{**CACHE_DEFAULTS, **CONFIG.get("response_cache", {})})
+ingest_version = IngestVersion(DB_FILE, latest_cache)
+
+
+def cached_response(entry):
+    """Response dari entry cache, 304 jika browser sudah punya versi ini"""
+    if etag_matches(request.headers.get("If-None-Match"), entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype=entry.media_type, headers=entry.headers)
+    response.headers["ETag"] = entry.etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.before_request
+def serve_from_cache():
+    if request.method != "GET" or request.path not in CACHED_PATHS:
+        return None
+    g.cache_key = cache_key(request.path, request.args.items(multi=True), ingest_version.current())
+    entry = response_cache.get(g.cache_key)
+    if entry is not None:
+        g.cache_hit = True
+        return cached_response(entry)
+    return None
+
+
+@app.after_request
+def store_in_cache(response):
+    key = g.pop("cache_key", None)
+    if key is None or g.pop("cache_hit", False):
+        return response
+    if response.status_code != 200 or response.is_streamed:
+        return response
+    entry = response_cache.put(key, response.get_data(), response.mimetype, dict(response.headers))
+    return cached_response(entry)
+
+
 @app.route('/api/latest')
 def latest_data():
     try:
-        logging.info("📥 MEMASUKI /api/latest")
         params = CONFIG.get("parameters", [])
         if not params:
             logging.warning("⚠️ Parameter kosong")
             return jsonify({"error": "No parameters defined in config"}), 400
 
+        # Jalur cepat: tanpa SQLite selama service sensor sudah mengisi cache
+        cached = latest_cache.get()
+        if cached:
+            row = {param: cached.get(param) for param in params}
+            row["timestamp"] = datetime.fromtimestamp(cached["timestamp"]).strftime("%Y-%m-%d %H:%M")
+            return jsonify(row)
+
+        logging.info("📥 /api/latest dari database (cache belum tersedia)")
         param_fields = ', '.join(params + ["timestamp"])
         logging.info("🔍 SQL kolom: %s", param_fields)
 
@@ -156,15 +298,13 @@ def latest_data():
         ORDER BY timestamp DESC
         LIMIT 1;
         """
-        conn = get_db_connection()
-        df = pd.read_sql(query, conn)
-        conn.close()
+        cols = Columns.fetch(get_db_connection(), query)
 
-        if df.empty:
+        if not len(cols):
             logging.info("📭 Data kosong")
             return jsonify({param: None for param in params})
         else:
-            row = df.iloc[0].to_dict()
+            row = cols.row(0)
             if 'timestamp' in row and row['timestamp']:
                 ts = datetime.fromtimestamp(row['timestamp'])
                 row['timestamp'] = ts.strftime("%Y-%m-%d %H:%M")
@@ -177,43 +317,106 @@ def latest_data():
         return jsonify({"error": str(e)}), 500
 
 
+# === Format payload grafik ===
+# json    : timestamp sebagai string "YYYY-MM-DD HH:MM" (format lama)
+# compact : epoch awal (t0) + selisih antar titik (dt, detik); browser yang
+#           memformat waktu
+# f32     : biner little-endian: int32 dt[n] lalu float32 per seri [n],
+#           NaN = null; metadata di header X-Chart-*
+CHART_FORMATS = ("json", "compact", "f32")
+
+
+def epoch_deltas(timestamps):
+    """[t0, t1, ...] -> (t0, [0, t1 - t0, t2 - t1, ...])"""
+    if not len(timestamps):
+        return None, []
+    ts = [int(t) for t in timestamps]
+    return ts[0], [0] + [b - a for a, b in zip(ts, ts[1:])]
+
+
+def chart_response(fmt, timestamps, series, resolution):
+    """`series` berurutan: nama -> kolom (array/list, NaN atau None = kosong)"""
+    if fmt == "f32":
+        t0, dt = epoch_deltas(timestamps)
+        body = array("i", dt).tobytes()
+        for values in series.values():
+            body += array("f", [math.nan if v is None else v for v in values]).tobytes()
+        return Response(body, mimetype="application/octet-stream", headers={
+            "X-Chart-Count": str(len(dt)),
+            "X-Chart-Start": "" if t0 is None else str(t0),
+            "X-Chart-Series": ",".join(series),
+            "X-Chart-Resolution": str(resolution)
+        })
+
+    result = {name: [None if v is None or v != v else v for v in values] for name, values in series.items()}
+    result["resolution"] = resolution
+    if fmt == "compact":
+        result["t0"], result["dt"] = epoch_deltas(timestamps)
+    else:
+        result["timestamps"] = [datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M") for ts in timestamps]
+    return jsonify(result)
+
+
+def empty_chart(fmt, names, resolution):
+    return chart_response(fmt, [], {name: [] for name in names}, resolution)
+
+
+def rollup_wind_columns(table, start_time):
+    """Kecepatan & arah angin per bucket rollup"""
+    cols = Columns.fetch(get_db_connection(), wind_query(table), (start_time,))
+    # Arah rata-rata dihitung dari komponen vektor, bukan rata-rata derajat
+    cols["wdir"] = [
+        wind_direction(u, v)
+        for u, v in zip(cols.to_list("wind_u"), cols.to_list("wind_v"))
+    ]
+    return cols
+
+
 @app.route('/api/history')
 def history_data():
+    error = request_error(request.args)
+    if error:
+        return jsonify({"error": error}), 400
     param = request.args.get('param', 'temp')
     range_time = request.args.get('range', 'realtime')
+    fmt = request.args.get('format', 'json')
     now = int(datetime.now().timestamp())
+    start_time = get_start_time(range_time, now)
 
-    start_time = {
-        "realtime": now - 15 * 60,
-        "1h": now - 3600,
-        "12h": now - 12 * 3600,
-        "1d": now - 86400,
-        "3d": now - 3 * 86400,
-        "7d": now - 7 * 86400
-    }.get(range_time, now - 15 * 60)
+    # Rentang panjang dibaca dari rollup (1 jam / 1 hari)
+    table, resolution = choose_level(start_time, now)
 
     try:
-        query = f"""
-        SELECT timestamp, {param}
-        FROM sensor_datas
-        WHERE timestamp >= ?
-        ORDER BY timestamp ASC;
-        """
-        conn = get_db_connection()
-        df = pd.read_sql(query, conn, params=(start_time,))
-        conn.close()
-
-        # Ganti NaN dengan None agar JSON valid
-        df.fillna(value=pd.NA, inplace=True)
-        df = df.astype(object).where(pd.notnull(df), None)
+        cols = None
+        if table:
+            try:
+                if param == "wdir":
+                    # Tanpa min/max: tidak bermakna untuk besaran melingkar
+                    cols = rollup_wind_columns(table, start_time)
+                else:
+                    cols = Columns.fetch(get_db_connection(), series_query(table, param), (start_time,))
+            except Exception as e:
+                logging.warning("⚠️ Rollup %s tidak bisa dipakai, kembali ke data mentah: %s", table, e)
+                cols = None
+        if cols is None:
+            resolution = RAW_INTERVAL
+            query = f"""
+            SELECT timestamp, {param}
+            FROM sensor_datas
+            WHERE timestamp >= ?
+            ORDER BY timestamp ASC;
+            """
+            cols = fetch_raw_columns(query, (start_time,), start_time, now)
 
-        if param not in df.columns:
-            return jsonify({"timestamps": [], "values": []})
+        if param not in cols:
+            return empty_chart(fmt, ["values"], resolution)
 
-        return jsonify({
-            "timestamps": [datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M") for ts in df["timestamp"]],
-            "values": df[param].tolist()
-        })
+        # NaN (NULL) menjadi None saat serialisasi agar JSON valid
+        series = {"values": cols[param]}
+        if "min" in cols:
+            series["min"] = cols["min"]
+            series["max"] = cols["max"]
+        return chart_response(fmt, cols["timestamp"], series, resolution)
 
     except Exception as e:
         logging.error("❌ /api/history error: %s", e)
@@ -223,41 +426,38 @@ def history_data():
 
 @app.route('/api/windrose')
 def windrose_data():
+    error = request_error(request.args)
+    if error:
+        return jsonify({"error": error}), 400
     range_time = request.args.get('range', 'realtime')
+    fmt = request.args.get('format', 'json')
     now = int(datetime.now().timestamp())
+    start_time = get_start_time(range_time, now)
 
-    start_time = {
-        "realtime": now - 15 * 60,
-        "1h": now - 3600,
-        "12h": now - 12 * 3600,
-        "1d": now - 86400,
-        "3d": now - 3 * 86400,
-        "7d": now - 7 * 86400
-    }.get(range_time, now - 15 * 60)
+    table, resolution = choose_level(start_time, now)
 
     try:
-        query = """
-        SELECT timestamp, wspeed, wdir
-        FROM sensor_datas
-        WHERE timestamp >= ?
-        ORDER BY timestamp ASC;
-        """
-        conn = get_db_connection()
-        df = pd.read_sql(query, conn, params=(start_time,))
-        conn.close()
-
-        # Ganti NaN dengan None agar JSON valid
-        df.fillna(value=pd.NA, inplace=True)
-        df = df.astype(object).where(pd.notnull(df), None)
+        cols = None
+        if table:
+            try:
+                cols = rollup_wind_columns(table, start_time)
+            except Exception as e:
+                logging.warning("⚠️ Rollup %s tidak bisa dipakai, kembali ke data mentah: %s", table, e)
+                cols = None
+        if cols is None:
+            resolution = RAW_INTERVAL
+            query = """
+            SELECT timestamp, wspeed, wdir
+            FROM sensor_datas
+            WHERE timestamp >= ?
+            ORDER BY timestamp ASC;
+            """
+            cols = fetch_raw_columns(query, (start_time,), start_time, now)
 
-        if "wspeed" not in df.columns or "wdir" not in df.columns:
-            return jsonify({"timestamps": [], "wspeed": [], "wdir": []})
+        if "wspeed" not in cols or "wdir" not in cols:
+            return empty_chart(fmt, ["wspeed", "wdir"], resolution)
 
-        return jsonify({
-            "timestamps": [datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M") for ts in df["timestamp"]],
-            "wspeed": df["wspeed"].tolist(),
-            "wdir": df["wdir"].tolist()
-        })
+        return chart_response(fmt, cols["timestamp"], {"wspeed": cols["wspeed"], "wdir": cols["wdir"]}, resolution)
 
     except Exception as e:
         logging.error("❌ /api/windrose error: %s", e)
@@ -265,6 +465,126 @@ def windrose_data():
         return jsonify({"timestamps": [], "wspeed": [], "wdir": [], "error": str(e)}), 500
 
 
+@app.route('/api/windrose/bins')
+def windrose_bins_data():
+    """
+    Wind rose yang sudah di-bin di server: ?range=&sectors=&calm=&classes=2,4,6
+    Default dari config.json -> "windrose".
+    """
+    error = request_error(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    defaults = dict(WINDROSE_DEFAULTS)
+    defaults.update(CONFIG.get("windrose", {}))
+    range_time = request.args.get('range', 'realtime')
+    now = int(datetime.now().timestamp())
+    start_time = get_start_time(range_time, now)
+
+    try:
+        sectors = int(request.args.get('sectors', defaults["sectors"]))
+        calm = float(request.args.get('calm', defaults["calm"]))
+        classes = request.args.get('classes')
+        edges = [float(c) for c in classes.split(",") if c] if classes else defaults["speed_classes"]
+    except ValueError:
+        return jsonify({"error": "sectors, calm, dan classes harus berupa angka"}), 400
+
+    try:
+        result = windrose_bins(raw_connections(start_time, now), start_time, now,
+                               sectors=sectors, calm=calm, edges=edges)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error("❌ /api/windrose/bins error: %s", e)
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+    result["range"] = range_time
+    return jsonify(result)
+
+
+# === Live Update (Server-Sent Events) ===
+# Data baru didorong oleh service sensor setelah commit (lihat live.py),
+# jadi browser tidak perlu polling /api/latest, /api/windrose, /api/wifi-status.
+WIFI_CHECK_INTERVAL = 30
+SSE_HEARTBEAT = 15
+SSE_RETRY_AFTER = 60   # detik; client yang ditolak memakai polling dulu
+
+# Batas client SSE per proses. Tiap client menahan satu thread selama
+# terhubung, jadi di bawah gunicorn gthread dibatasi di bawah jumlah thread
+# (lihat run_server) agar request biasa selalu kebagian thread. None = tanpa batas.
+sse_limit = None
+
+live_hub = None
+live_hub_lock = threading.Lock()
+
+
+def format_live_reading(row):
+    """Bentuk payload sama dengan /api/latest (+ device)"""
+    params = CONFIG.get("parameters", [])
+    data = {param: row.get(param) for param in params}
+    if row.get("timestamp"):
+        data["timestamp"] = datetime.fromtimestamp(row["timestamp"]).strftime("%Y-%m-%d %H:%M")
+    data["device"] = row.get("device")
+    return data
+
+
+def wifi_watch_loop(hub):
+    """Cek WiFi sekali untuk semua client (bukan per tab), hanya jika ada yang terhubung"""
+    last_check = 0
+    while True:
+        due = time.monotonic() - last_check >= WIFI_CHECK_INTERVAL or "wifi" not in hub.last
+        if hub.client_count and due:
+            last_check = time.monotonic()
+            try:
+                hub.broadcast("wifi", check_wifi_status())
+            except Exception as e:
+                logging.error(f"Kesalahan saat memeriksa status WiFi: {e}")
+        time.sleep(1)
+
+
+def get_live_hub():
+    global live_hub
+    with live_hub_lock:
+        if live_hub is None:
+            hub = LiveHub()
+            hub.start()
+            atexit.register(hub.stop)
+            threading.Thread(target=wifi_watch_loop, args=(hub,), name="wifi-watch", daemon=True).start()
+            live_hub = hub
+    return live_hub
+
+
+@app.route('/api/stream')
+def live_stream():
+    hub = get_live_hub()
+    q = hub.subscribe(sse_limit)
+    if q is None:
+        # Slot SSE penuh: EventSource menutup koneksi dan dashboard kembali ke polling
+        return jsonify({"error": "Live update penuh, gunakan polling"}), 503, {"Retry-After": str(SSE_RETRY_AFTER)}
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, payload = q.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # Komentar SSE sebagai heartbeat agar koneksi tidak diputus proxy
+                    yield ": ping\n\n"
+                    continue
+                if event == "reading":
+                    payload = format_live_reading(payload)
+                yield format_sse(event, payload)
+        finally:
+            hub.unsubscribe(q)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route('/api/usb-list', methods=['GET'])
 def list_usb_devices():
     try:
@@ -279,55 +599,179 @@ def list_usb_devices():
         return jsonify(["download"]), 500
 
 
+# === Export Streaming ===
+# Jumlah baris per halaman export; memori puncak tetap ~1 halaman
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+# Kolom internal (watermark backup/uplink) tidak ikut diekspor
+EXPORT_EXCLUDE = {"change_seq"}
+
+
+def iter_export_pages(start_dt, end_dt, chunk_rows=None):
+    """
+    Baca sensor_datas per halaman dengan keyset (timestamp, id) supaya tiap
+    query pendek dan memakai index timestamp. Yield (kolom, list baris).
+    """
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    # Jendela partisi berurutan waktu (lihat partitions.py)
+    for conn in raw_connections(start_dt, end_dt):
+        select_list = ", ".join(row[1] for row in conn.execute("PRAGMA main.table_info(sensor_datas)")
+                                if row[1] not in EXPORT_EXCLUDE)
+        cur = conn.execute(f"""
+            SELECT {select_list}
+            FROM sensor_datas
+            WHERE timestamp BETWEEN ? AND ?
+            ORDER BY timestamp ASC, id ASC
+            LIMIT ?;
+        """, (start_dt, end_dt, chunk_rows))
+        columns = [d[0] for d in cur.description]
+        ts_idx, id_idx = columns.index("timestamp"), columns.index("id")
+        rows = cur.fetchall()
+        while rows:
+            yield columns, rows
+            if len(rows) < chunk_rows:
+                break
+            last_ts, last_id = rows[-1][ts_idx], rows[-1][id_idx]
+            rows = conn.execute(f"""
+                SELECT {select_list}
+                FROM sensor_datas
+                WHERE timestamp BETWEEN ? AND ?
+                  AND (timestamp > ? OR (timestamp = ? AND id > ?))
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ?;
+            """, (start_dt, end_dt, last_ts, last_ts, last_id, chunk_rows)).fetchall()
+
+
+def iter_csv_chunks(pages):
+    """Ubah halaman baris menjadi potongan teks CSV (header sekali di awal)"""
+    header_written = False
+    for columns, rows in pages:
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buf.getvalue()
+
+
+def load_pyarrow():
+    """
+    Parquet opsional — pyarrow (ikut memuat numpy) baru di-import saat export
+    Parquet pertama, bukan saat worker start. ImportError jika tidak terpasang.
+    """
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_schema(columns):
+    """Schema Arrow dari tipe kolom yang dideklarasikan di sensor_datas"""
+    pa, _ = load_pyarrow()
+    conn = get_db_connection()
+    declared = {row[1]: (row[2] or "").upper() for row in conn.execute("PRAGMA main.table_info(sensor_datas)")}
+
+    def arrow_type(decl):
+        if "INT" in decl:
+            return pa.int64()
+        if any(t in decl for t in ("REAL", "FLOA", "DOUB")):
+            return pa.float64()
+        return pa.string()
+
+    return pa.schema([(col, arrow_type(declared.get(col, ""))) for col in columns])
+
+
+def write_parquet(pages, path):
+    """Tulis halaman baris ke file Parquet, satu row group per halaman"""
+    pa, pq = load_pyarrow()
+    writer = None
+    try:
+        for columns, rows in pages:
+            if writer is None:
+                schema = parquet_schema(columns)
+                writer = pq.ParquetWriter(path, schema, compression="snappy")
+            table = pa.Table.from_pydict(
+                {col: [r[i] for r in rows] for i, col in enumerate(columns)},
+                schema=schema
+            )
+            writer.write_table(table)
+    finally:
+        if writer:
+            writer.close()
+
+
+def has_export_data(start_dt, end_dt):
+    return any(
+        conn.execute(
+            "SELECT 1 FROM sensor_datas WHERE timestamp BETWEEN ? AND ? LIMIT 1;",
+            (start_dt, end_dt)
+        ).fetchone() is not None
+        for conn in raw_connections(start_dt, end_dt)
+    )
+
+
 @app.route('/api/export', methods=['POST'])
 def export_data():
     """
-    Export data ke USB atau download
+    Export data ke USB atau download.
+    Data dibaca per halaman dan langsung ditulis/di-stream, tidak pernah
+    dimuat seluruhnya ke memori. Format: csv (default) atau parquet.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         start = data.get("start")
         end = data.get("end")
         destination = data.get("destination", "download")
+        fmt = data.get("format", "csv")
 
         if not start or not end:
             return jsonify({"error": "Parameter 'start' dan 'end' wajib diisi."}), 400
 
-        logging.info(f"📦 Export request: {start} → {end} to {destination}")
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": f"Format '{fmt}' tidak dikenal. Pilihan: {', '.join(EXPORT_FORMATS)}"}), 400
 
-        start_dt = int(datetime.fromisoformat(start).timestamp())
-        end_dt = int(datetime.fromisoformat(end).timestamp())
+        if fmt == "parquet":
+            try:
+                load_pyarrow()
+            except ImportError:
+                return jsonify({"error": "Format parquet membutuhkan paket pyarrow."}), 400
 
-        # Query data
-        query = """
-            SELECT *
-            FROM sensor_datas
-            WHERE timestamp BETWEEN ? AND ?
-            ORDER BY timestamp ASC;
-        """
-        conn = get_db_connection()
-        df = pd.read_sql(query, conn, params=(start_dt, end_dt))
-        conn.close()
+        try:
+            start_dt = int(datetime.fromisoformat(start).timestamp())
+            end_dt = int(datetime.fromisoformat(end).timestamp())
+        except (TypeError, ValueError):
+            return jsonify({"error": "Parameter 'start' dan 'end' harus berformat ISO (YYYY-MM-DDTHH:MM)."}), 400
+        if start_dt > end_dt:
+            return jsonify({"error": "Parameter 'start' harus sebelum 'end'."}), 400
 
-        if df.empty:
+        logging.info(f"📦 Export request: {start} → {end} to {destination} ({fmt})")
+
+        if not has_export_data(start_dt, end_dt):
             return jsonify({"error": "Tidak ada data dalam rentang waktu tersebut."}), 400
 
-        filename = f"export_{start}_{end}.csv"
+        filename = f"export_{start}_{end}.{fmt}"
         filename = sanitize_filename(filename)
 
         if destination == "download":
-            # Export untuk di-download langsung
-            csv_io = io.StringIO()
-            df.to_csv(csv_io, index=False)
-            mem = io.BytesIO()
-            mem.write(csv_io.getvalue().encode('utf-8'))
-            mem.seek(0)
-            response = send_file(
-                mem,
-                download_name=filename,
-                as_attachment=True,
-                mimetype='text/csv'
-            )
+            if fmt == "csv":
+                # Stream CSV per potongan (chunked transfer)
+                response = Response(
+                    stream_with_context(iter_csv_chunks(iter_export_pages(start_dt, end_dt))),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={filename}"}
+                )
+            else:
+                # Parquet butuh footer di akhir file, jadi ditulis ke file sementara di disk
+                tmp = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False)
+                tmp.close()
+                write_parquet(iter_export_pages(start_dt, end_dt), tmp.name)
+                response = send_file(
+                    tmp.name,
+                    download_name=filename,
+                    as_attachment=True,
+                    mimetype=EXPORT_FORMATS[fmt]
+                )
+                response.call_on_close(lambda: os.remove(tmp.name))
         else:
             # Export ke USB
             usb_devices = get_usb_devices()
@@ -338,7 +782,13 @@ def export_data():
 
             export_path = os.path.join(mount_point, filename)
             try:
-                df.to_csv(export_path, index=False)
+                pages = iter_export_pages(start_dt, end_dt)
+                if fmt == "csv":
+                    with open(export_path, "w", newline="", encoding="utf-8") as f:
+                        for chunk in iter_csv_chunks(pages):
+                            f.write(chunk)
+                else:
+                    write_parquet(pages, export_path)
                 logging.info(f"✅ Data berhasil diekspor ke: {export_path}")
                 response = jsonify({"status": "success", "path": export_path})
             except Exception as e:
@@ -354,23 +804,27 @@ def export_data():
         cleanup_usb_mounts()
 
 
-@app.route('/api/wifi-status', methods=['GET'])
-def wifi_status():
-    try:
-        logging.info("Memeriksa status koneksi WiFi...")
-        result = subprocess.run(['nmcli', '-t', '-f', 'active,ssid', 'dev', 'wifi'], capture_output=True, text=True)
-        lines = result.stdout.strip().split('\n')
-        ssid_connected = next((line.split(":")[1] for line in lines if line.startswith("yes:")), None)
+def check_wifi_status():
+    logging.info("Memeriksa status koneksi WiFi...")
+    result = subprocess.run(['nmcli', '-t', '-f', 'active,ssid', 'dev', 'wifi'], capture_output=True, text=True)
+    lines = result.stdout.strip().split('\n')
+    ssid_connected = next((line.split(":")[1] for line in lines if line.startswith("yes:")), None)
 
-        ping_check = subprocess.run(['ping', '-c', '1', '8.8.8.8'], stdout=subprocess.DEVNULL)
-        connected = ping_check.returncode == 0
+    ping_check = subprocess.run(['ping', '-c', '1', '8.8.8.8'], stdout=subprocess.DEVNULL)
+    connected = ping_check.returncode == 0
 
-        logging.info(f"Status koneksi: {'terhubung' if connected else 'tidak terhubung'}, SSID: {ssid_connected or '-'}")
+    logging.info(f"Status koneksi: {'terhubung' if connected else 'tidak terhubung'}, SSID: {ssid_connected or '-'}")
 
-        return jsonify({
-            'connected': connected,
-            'ssid': ssid_connected if ssid_connected else "-"
-        })
+    return {
+        'connected': connected,
+        'ssid': ssid_connected if ssid_connected else "-"
+    }
+
+
+@app.route('/api/wifi-status', methods=['GET'])
+def wifi_status():
+    try:
+        return jsonify(check_wifi_status())
     except Exception as e:
         logging.error(f"Kesalahan saat memeriksa status WiFi: {e}")
         return jsonify({'connected': False, 'ssid': '-'})
@@ -422,6 +876,69 @@ def shutdown():
     return '', 204
 
 
+# === Server Produksi (pre-fork) ===
+# gunicorn dengan worker gthread: beberapa proses worker, masing-masing
+# dengan beberapa thread dan koneksi read-only sendiri per thread. Export
+# panjang atau client SSE hanya memakai satu thread di satu worker, jadi
+# dashboard lain tetap dilayani. Client SSE menahan thread selama tab
+# terbuka, jadi dibatasi per worker (sse_clients, default separuh thread);
+# client berikutnya mendapat 503 dan memakai polling. Cache response & live
+# hub berjalan per worker (live.py memang mendukung banyak proses web).
+# Tanpa gunicorn kembali ke server bawaan Flask (satu proses).
+WEB_SERVER = {
+    "workers": 2,           # proses worker (±jumlah core)
+    "threads": 8,           # thread per worker; tiap tab SSE memakai satu thread
+    "sse_clients": None,    # client SSE per worker (None = threads // 2)
+    "timeout": 60,          # detik tanpa heartbeat sebelum worker di-restart
+    "graceful_timeout": 10,
+    "max_requests": 0       # >0: worker diganti setelah N request
+}
+
+
+def run_server(port):
+    global sse_limit
+    cfg = dict(WEB_SERVER)
+    cfg.update(CONFIG.get("web", {}))
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logging.warning("⚠️ gunicorn tidak terpasang, memakai server Flask satu proses")
+        get_live_hub()
+        app.run(host="0.0.0.0", port=port, threaded=True)
+        return
+
+    threads = int(cfg["threads"])
+    sse_limit = int(cfg["sse_clients"]) if cfg["sse_clients"] is not None else threads // 2
+    if sse_limit >= threads:
+        # Minimal satu thread harus tersisa untuk request biasa (0 = SSE nonaktif, semua polling)
+        logging.warning(f"⚠️ sse_clients={sse_limit} ≥ threads={threads}, dibatasi ke {threads - 1}")
+        sse_limit = threads - 1
+
+    options = {
+        "bind": f"0.0.0.0:{port}",
+        "worker_class": "gthread",
+        "workers": int(cfg["workers"]),
+        "threads": threads,
+        "timeout": int(cfg["timeout"]),
+        "graceful_timeout": int(cfg["graceful_timeout"]),
+        "max_requests": int(cfg["max_requests"]),
+        # Live hub (socket per proses) dibuat di tiap worker setelah fork
+        "post_worker_init": lambda worker: get_live_hub()
+    }
+
+    class WebServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    logging.info(f"🚀 Web server pre-fork: {options['workers']} worker × {options['threads']} thread "
+                 f"(maks {sse_limit} client SSE per worker) di port {port}")
+    WebServer().run()
+
+
 if __name__ == "__main__":
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 5010
-    app.run(host="0.0.0.0", port=port)
+    run_server(port)
@@ -1,18 +1,58 @@
 import os
+import gzip
 import shutil
 import sqlite3
-import subprocess
 from datetime import datetime, timedelta
 import logging
 import time
 import json
 
+from retention import retention_settings, run_retention
+from partitions import PartitionRouter, rotate_partitions
+from connections import connect
+from migrations import run_migrations
+
 # === Path Konfigurasi ===
 BASE_DB = "/opt/aws/database/aws_db.sqlite"
 BACKUP_DIR = "/opt/aws/database/backup"
 STATE_FILE = "/opt/aws/database/backup_state.json"
 LOG_PATH = "/opt/aws/logs/backup.log"
-SERVICES = ["aws-sensor.service", "aws-api.service"]  # 🆕
+
+# === Backup online (service tetap berjalan) ===
+# online : API backup SQLite, disalin bertahap N halaman per langkah dengan
+#          jeda di antaranya. Satu transaksi baca ditahan selama backup agar
+#          salinan konsisten dan tidak diulang dari awal saat ada insert baru.
+# vacuum : VACUUM INTO — satu langkah, hasil langsung ringkas (tanpa jeda).
+# Dalam mode WAL pembaca tidak pernah memblokir writer, jadi ingest tetap jalan.
+BACKUP = {
+    "method": "online",
+    "pages_per_step": 64,   # 64 × 4 KB = 256 KB per langkah
+    "step_sleep": 0.005,    # detik jeda antar langkah
+    "interval_days": 1,     # backup inkremental (segmen) tiap N hari
+    "full_every_days": 28,  # base penuh baru tiap N hari
+    "keep_bases": 2,        # jumlah rantai (base + segmen) yang disimpan
+    "compress_level": 6,
+    "segment_rows": 5000    # baris per fetch saat menulis segmen
+}
+
+# === Backup inkremental ===
+# Satu rantai = folder chain_<tanggal_jam>/ berisi base.sqlite.gz (salinan penuh)
+# dan seg_<nomor>_<seq awal>-<seq akhir>.jsonl.gz (perubahan sensor_datas
+# dengan change_seq di atas watermark). change_seq (migrasi v8) naik setiap
+# baris ditulis, termasuk koreksi lewat upsert yang mempertahankan id, jadi
+# segmen menangkap baris baru, replay journal, dan baris yang dikoreksi.
+# Baris yang dihapus retensi atau dipindah ke partisi dicatat sebagai
+# tombstone (migrasi v9) dan ikut di segmen sebagai daftar id; baris partisi
+# sendiri ada di backup per file partisi.
+# Watermark disimpan di backup_state.json; restore.py membangun ulang
+# database dari base + semua segmen (baris dengan id sama ditimpa, lalu
+# tombstone dihapus). Rantai dengan format lama diganti base baru.
+CHAIN_FORMAT = 3
+CHAIN_PREFIX = "chain_"
+BASE_FILE = "base.sqlite.gz"
+SEGMENT_TABLE = "sensor_datas"
+# Partisi bulanan (jika aktif) disalin utuh per file, hanya yang berubah
+PARTITION_BACKUP_DIR = os.path.join(BACKUP_DIR, "partitions")
 
 # === Setup Logging ===
 os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
@@ -36,41 +76,265 @@ def load_state():
     return {}
 
 def save_state(state):
+    # Tulis lalu rename agar watermark tidak rusak jika mati listrik
     try:
-        with open(STATE_FILE, 'w') as f:
+        with open(STATE_FILE + ".tmp", 'w') as f:
             json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(STATE_FILE + ".tmp", STATE_FILE)
     except Exception as e:
         logging.error(f"❌ Gagal menyimpan state: {e}")
 
-# === Stop & Start Service ===
-def control_services(action):
-    for service in SERVICES:
+# === Backup Database ===
+def online_backup(src_path, dest_path, pages_per_step=64, step_sleep=0.005):
+    """Salin database yang sedang dipakai secara bertahap ke dest_path"""
+    src = connect(src_path, readonly=True)
+    dest = sqlite3.connect(dest_path)
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining:
+            time.sleep(step_sleep)
+
+    try:
+        # Tahan snapshot: insert dari service lain tidak mengulang backup
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dest, pages=pages_per_step, progress=progress)
+        src.rollback()
+        # Salinan berupa satu file utuh, tanpa -wal/-shm
+        dest.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        src.close()
+        dest.close()
+    return steps
+
+
+def vacuum_backup(src_path, dest_path):
+    """Salinan ringkas dalam satu langkah (VACUUM INTO)"""
+    # VACUUM INTO ditolak pada koneksi query_only, jadi dibuka sebagai writer
+    src = connect(src_path)
+    try:
+        src.execute("VACUUM INTO ?", (dest_path,))
+    finally:
+        src.close()
+
+
+def verify_backup(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+
+
+def gzip_file(src_path, dest_path, level=6):
+    with open(src_path, "rb") as src, gzip.open(dest_path, "wb", compresslevel=level) as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+
+
+def create_base(chain_dir):
+    """
+    Backup penuh (online / VACUUM INTO) ke chain_dir/base.sqlite.gz.
+    Mengembalikan change_seq terakhir di salinan = watermark awal rantai.
+    """
+    os.makedirs(chain_dir, exist_ok=True)
+    tmp_path = os.path.join(chain_dir, "base.sqlite.part")
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        start = time.monotonic()
+        if BACKUP["method"] == "vacuum":
+            vacuum_backup(BASE_DB, tmp_path)
+            detail = "VACUUM INTO"
+        else:
+            steps = online_backup(BASE_DB, tmp_path, BACKUP["pages_per_step"], BACKUP["step_sleep"])
+            detail = f"{steps} langkah × {BACKUP['pages_per_step']} halaman"
+
+        if not verify_backup(tmp_path):
+            raise RuntimeError("quick_check backup gagal")
+        conn = sqlite3.connect(tmp_path)
         try:
-            subprocess.run(["systemctl", action, service], check=True)
-            logging.info(f"✅ Service '{service}' berhasil: {action}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"❌ Gagal {action} service {service}: {e}")
+            max_seq = conn.execute("SELECT seq FROM change_counter WHERE id = 1").fetchone()[0]
+        finally:
+            conn.close()
 
-# === Backup Database ===
-def backup_database():
-    today_str = datetime.today().strftime('%Y-%m-%d')
-    backup_name = f"aws_db_{today_str}.sqlite"
-    backup_path = os.path.join(BACKUP_DIR, backup_name)
+        gzip_file(tmp_path, os.path.join(chain_dir, BASE_FILE + ".part"), BACKUP["compress_level"])
+        os.replace(os.path.join(chain_dir, BASE_FILE + ".part"), os.path.join(chain_dir, BASE_FILE))
+        logging.info(f"✅ Base backup dibuat: {chain_dir} ({detail}, change_seq ≤ {max_seq}, "
+                     f"{time.monotonic() - start:.1f} detik)")
+        return max_seq
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    if os.path.exists(backup_path):
-        logging.info("✅ Backup hari ini sudah ada.")
-        return False
 
+def write_segment(chain_dir, seq, after_seq):
+    """
+    Tulis perubahan dengan change_seq > after_seq ke segmen terkompresi.
+    Baris pertama berisi metadata (kolom, rentang change_seq), lalu satu
+    array JSON per baris yang ditulis/dikoreksi, lalu {"deleted": [id, ...]}
+    untuk baris yang dihapus atau dipindah ke partisi. Mengembalikan
+    (change_seq terakhir, jumlah perubahan); tanpa perubahan tidak ada file.
+    """
+    # Tombstone sampai watermark sudah tercatat di segmen sebelumnya (state tersimpan)
+    conn = connect(BASE_DB)
+    try:
+        with conn:
+            conn.execute("DELETE FROM sensor_datas_deleted WHERE seq <= ?", (after_seq,))
+    finally:
+        conn.close()
+
+    conn = connect(BASE_DB, readonly=True)
+    tmp_path = os.path.join(chain_dir, f"seg_{seq:06d}.part")
     try:
-        shutil.copy2(BASE_DB, backup_path)
-        logging.info(f"✅ Backup berhasil dibuat: {backup_path}")
+        # Satu snapshot untuk seluruh segmen
+        conn.execute("BEGIN")
+        to_seq = conn.execute("SELECT seq FROM change_counter WHERE id = 1").fetchone()[0]
+        if to_seq <= after_seq:
+            conn.rollback()
+            return after_seq, 0
+
+        cur = conn.execute(f"SELECT * FROM {SEGMENT_TABLE} WHERE change_seq > ? AND change_seq <= ? "
+                           f"ORDER BY change_seq", (after_seq, to_seq))
+        columns = [d[0] for d in cur.description]
+        count = deleted = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=BACKUP["compress_level"]) as f:
+            f.write(json.dumps({"table": SEGMENT_TABLE, "columns": columns,
+                                "from_seq": after_seq + 1, "to_seq": to_seq}) + "\n")
+            while True:
+                rows = cur.fetchmany(BACKUP["segment_rows"])
+                if not rows:
+                    break
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                count += len(rows)
+            cur = conn.execute("SELECT id FROM sensor_datas_deleted WHERE seq > ? AND seq <= ? ORDER BY seq",
+                               (after_seq, to_seq))
+            while True:
+                ids = [row[0] for row in cur.fetchmany(BACKUP["segment_rows"])]
+                if not ids:
+                    break
+                f.write(json.dumps({"deleted": ids}) + "\n")
+                deleted += len(ids)
+        conn.rollback()
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+
+    if not count and not deleted:
+        # Nomor terpakai oleh upsert ke partisi; partisi disalin per file
+        os.remove(tmp_path)
+        return after_seq, 0
+    seg_path = os.path.join(chain_dir, f"seg_{seq:06d}_{after_seq + 1}-{to_seq}.jsonl.gz")
+    os.replace(tmp_path, seg_path)
+    logging.info(f"✅ Segmen inkremental dibuat: {os.path.basename(seg_path)} "
+                 f"({count} baris, {deleted} dihapus)")
+    return to_seq, count + deleted
+
+
+def backup_database(state):
+    """
+    Backup inkremental: segmen baru di rantai aktif, atau base penuh baru
+    jika belum ada rantai / base sudah lebih tua dari full_every_days.
+    """
+    chain = state.get("chain")
+    now = datetime.now()
+    need_base = True
+    if chain and chain.get("format") == CHAIN_FORMAT and os.path.exists(os.path.join(BACKUP_DIR, chain.get("dir", ""), BASE_FILE)):
+        try:
+            base_date = datetime.strptime(chain["base_date"], "%Y-%m-%d")
+            need_base = now - base_date >= timedelta(days=BACKUP["full_every_days"])
+        except (KeyError, ValueError):
+            need_base = True
+
+    try:
+        if need_base:
+            name = f"{CHAIN_PREFIX}{now.strftime('%Y-%m-%d_%H%M%S')}"
+            chain_dir = os.path.join(BACKUP_DIR, name)
+            max_seq = create_base(chain_dir)
+            state["chain"] = {"dir": name, "format": CHAIN_FORMAT, "base_date": now.strftime("%Y-%m-%d"),
+                              "base_seq": max_seq, "last_seq": max_seq, "segments": 0}
+        else:
+            chain_dir = os.path.join(BACKUP_DIR, chain["dir"])
+            last_seq, count = write_segment(chain_dir, chain["segments"] + 1, chain["last_seq"])
+            if count:
+                chain["last_seq"] = last_seq
+                chain["segments"] += 1
+            else:
+                logging.info("📭 Tidak ada data baru sejak backup terakhir.")
         return True
     except Exception as e:
         logging.error(f"❌ Gagal backup database: {e}")
         return False
 
-# === Hapus Backup Lama (> 30 hari) ===
+# === Partisi Bulanan ===
+def rotate_database():
+    """Pindahkan bulan di luar hot_months ke file partisi (no-op jika nonaktif)"""
+    try:
+        moved = rotate_partitions(BASE_DB)
+        if moved:
+            logging.info(f"📦 Rotasi partisi: {moved}")
+    except Exception as e:
+        logging.error(f"❌ Gagal memindahkan data ke partisi: {e}")
+
+
+def backup_partitions(state):
+    """
+    Salin partisi yang berubah sejak backup terakhir (dibandingkan ukuran &
+    mtime). Bulan tertutup jarang berubah, jadi umumnya hanya partisi yang
+    baru dirotasi yang disalin. Backup partisi yang sudah dihapus retensi
+    ikut dihapus.
+    """
+    router = PartitionRouter(BASE_DB)
+    if not router.enabled:
+        return 0
+    os.makedirs(PARTITION_BACKUP_DIR, exist_ok=True)
+    saved = state.setdefault("partitions", {})
+    copied = 0
+    current = set()
+    for key, path in router.partitions():
+        current.add(key)
+        st = os.stat(path)
+        signature = [st.st_size, st.st_mtime_ns]
+        dest = os.path.join(PARTITION_BACKUP_DIR, os.path.basename(path) + ".gz")
+        if saved.get(key) == signature and os.path.exists(dest):
+            continue
+        try:
+            tmp_path = dest[:-len(".gz")] + ".tmp"
+            online_backup(path, tmp_path, BACKUP["pages_per_step"], BACKUP["step_sleep"])
+            gzip_file(tmp_path, dest + ".tmp", BACKUP["compress_level"])
+            os.replace(dest + ".tmp", dest)
+            os.remove(tmp_path)
+            saved[key] = signature
+            copied += 1
+            logging.info(f"✅ Backup partisi {key}: {os.path.basename(dest)}")
+        except Exception as e:
+            logging.error(f"❌ Gagal backup partisi {key}: {e}")
+
+    for key in [k for k in saved if k not in current]:
+        dest = os.path.join(PARTITION_BACKUP_DIR, os.path.basename(router.path(key)) + ".gz")
+        if os.path.exists(dest):
+            os.remove(dest)
+        del saved[key]
+        logging.info(f"🗑️ Backup partisi {key} dihapus (partisi sudah tidak ada)")
+    return copied
+
+# === Hapus Rantai Backup Lama ===
 def cleanup_old_backups():
+    """Simpan keep_bases rantai terbaru; hapus juga salinan penuh format lama (> 30 hari)"""
+    chains = sorted(d for d in os.listdir(BACKUP_DIR)
+                    if d.startswith(CHAIN_PREFIX) and os.path.isdir(os.path.join(BACKUP_DIR, d)))
+    for name in chains[:-BACKUP["keep_bases"]]:
+        shutil.rmtree(os.path.join(BACKUP_DIR, name))
+        logging.info(f"🗑️ Rantai backup lama dihapus: {name}")
+
     cutoff = datetime.today() - timedelta(days=30)
     for fname in os.listdir(BACKUP_DIR):
         if fname.startswith("aws_db_") and fname.endswith(".sqlite"):
@@ -83,27 +347,35 @@ def cleanup_old_backups():
             except Exception as e:
                 logging.warning(f"⚠️ Tidak bisa memproses backup: {fname} => {e}")
 
-# === Optimasi Database (hapus >13 bulan) ===
+# === Retensi Data (hapus data mentah >13 bulan, bertahap) ===
 def optimize_database():
     try:
-        conn = sqlite3.connect(BASE_DB)
-        cur = conn.cursor()
-
-        cutoff = int((datetime.now() - timedelta(days=396)).timestamp())
-        cur.execute("DELETE FROM sensor_datas WHERE created_at < ?", (cutoff,))
-        deleted = cur.rowcount
-        logging.info(f"🧹 Menghapus {deleted} baris data lebih dari 13 bulan.")
-
-        cur.execute("VACUUM;")
-        conn.commit()
-        conn.close()
-        logging.info("✅ Database dioptimasi.")
+        summary = run_retention(BASE_DB, retention_settings())
+        logging.info(f"🧹 Retensi selesai (batas {summary['cutoff']}): {summary['raw_deleted']} baris mentah, "
+                     f"{summary['rollup_deleted']} baris rollup dihapus, {summary['partitions_dropped']} partisi dihapus, "
+                     f"{summary['days_downsampled']} hari "
+                     f"di-downsample, {summary['pages_freed']} halaman dikembalikan (auto_vacuum={summary['auto_vacuum']}), "
+                     f"{summary['seconds']} detik.")
     except Exception as e:
-        logging.error(f"❌ Gagal optimasi database: {e}")
+        logging.error(f"❌ Gagal menjalankan retensi: {e}")
 
 # === Main Loop ===
+def days_since(state, key):
+    """Jumlah hari sejak tanggal di state[key], None jika belum pernah / rusak"""
+    try:
+        return (datetime.now() - datetime.strptime(state[key], "%Y-%m-%d")).days
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 def main_loop():
-    logging.info("🚀 Memulai background backup mingguan (malam hari)...")
+    logging.info("🚀 Memulai background backup inkremental (malam hari)...")
+    # Segmen memakai change_seq (migrasi v8); pastikan skema sudah terbaru
+    conn = connect(BASE_DB)
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
     state = load_state()
 
     while True:
@@ -111,40 +383,32 @@ def main_loop():
         hour = now.hour
         today_str = now.strftime('%Y-%m-%d')
 
-        # Cek apakah sudah seminggu sejak backup terakhir
-        last_backup_str = state.get("last_backup", None)
-        do_backup = False
-
-        if last_backup_str:
-            try:
-                last_backup_date = datetime.strptime(last_backup_str, "%Y-%m-%d")
-                if now - last_backup_date >= timedelta(days=7):
-                    do_backup = True
-            except Exception as e:
-                logging.warning(f"⚠️ Format last_backup salah: {e}")
-                do_backup = True
-        else:
-            do_backup = True
+        last = days_since(state, "last_backup")
+        do_backup = last is None or last >= BACKUP["interval_days"]
 
         # Jalankan hanya malam hari (00:00–01:00)
         if 0 <= hour < 1 and do_backup:
-            logging.info("🌙 Malam hari & waktunya backup mingguan. Menjalankan proses...")
-            try:
-                control_services("stop")  # Stop semua service
+            logging.info("🌙 Malam hari & waktunya backup. Menjalankan proses...")
+            # Service sensor & API tetap berjalan selama backup (backup online)
+            rotate_database()
+            if backup_database(state):
+                state["last_backup"] = today_str
+                save_state(state)
+            backup_partitions(state)
+            save_state(state)
 
-                if backup_database():
-                    state["last_backup"] = today_str
-                    save_state(state)
+            cleanup_old_backups()
 
-                cleanup_old_backups()
+            # Pembersihan data lama tetap seminggu sekali
+            last_optimize = days_since(state, "last_optimize")
+            if last_optimize is None or last_optimize >= 7:
                 optimize_database()
-
-            finally:
-                control_services("start")  # Start kembali service
+                state["last_optimize"] = today_str
+                save_state(state)
 
         else:
             if not do_backup:
-                logging.info("📅 Belum waktunya backup mingguan.")
+                logging.info("📅 Belum waktunya backup.")
             elif not (0 <= hour < 1):
                 logging.info("🕓 Bukan malam hari. Menunggu waktu 00:00–01:00.")
 
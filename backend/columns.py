@@ -0,0 +1,94 @@
+import math
+from array import array
+
+# === Query Kolom (pengganti pandas di web service) ===
+# Hasil query dikembalikan per kolom, bukan per baris. Kolom angka disimpan
+# sebagai array('d') dengan NaN untuk NULL (array('q') jika semuanya integer),
+# kolom lain tetap list. NaN baru diubah ke None saat serialisasi JSON.
+
+
+def _to_array(values):
+    """array angka untuk kolom numerik, None jika kolom berisi teks/blob"""
+    has_null = False
+    has_float = False
+    for v in values:
+        if v is None:
+            has_null = True
+        elif isinstance(v, float):
+            has_float = True
+        elif not isinstance(v, int) or isinstance(v, bool):
+            return None
+    if not has_null and not has_float:
+        return array("q", values)
+    if not has_null:
+        return array("d", values)
+    return array("d", [math.nan if v is None else v for v in values])
+
+
+class Columns:
+    """Hasil query berbentuk kolom: cols["temp"] -> array/list"""
+
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.data = dict(zip(self.names, columns))
+
+    @classmethod
+    def fetch(cls, conn, sql, params=()):
+        cur = conn.execute(sql, params)
+        names = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        if not rows:
+            return cls(names, [array("d") for _ in names])
+        columns = []
+        for values in zip(*rows):
+            arr = _to_array(values)
+            columns.append(arr if arr is not None else list(values))
+        return cls(names, columns)
+
+    def __len__(self):
+        return len(self.data[self.names[0]]) if self.names else 0
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __setitem__(self, name, values):
+        if name not in self.data:
+            self.names.append(name)
+        self.data[name] = values
+
+    def extend(self, other):
+        """Sambungkan hasil query lain dengan kolom yang sama (mis. jendela partisi berikutnya)"""
+        for name in self.names:
+            values, more = self.data[name], other.data[name]
+            if not len(more):
+                continue
+            if not len(values):
+                self.data[name] = more
+            elif isinstance(values, array) and isinstance(more, array):
+                if values.typecode == more.typecode:
+                    values.extend(more)
+                else:
+                    self.data[name] = array("d", values) + array("d", more)
+            else:
+                self.data[name] = list(values) + list(more)
+        return self
+
+    def to_list(self, name):
+        """Kolom siap JSON: NaN -> None"""
+        values = self.data[name]
+        if isinstance(values, array):
+            if values.typecode == "d":
+                return [None if v != v else v for v in values]
+            return values.tolist()
+        return [None if isinstance(v, float) and v != v else v for v in values]
+
+    def row(self, i=0):
+        """Satu baris sebagai dict (NaN -> None)"""
+        row = {}
+        for name in self.names:
+            v = self.data[name][i]
+            row[name] = None if isinstance(v, float) and v != v else v
+        return row
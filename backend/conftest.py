@@ -0,0 +1,25 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Service backend dijalankan dari foldernya sendiri (config.json & import modul relatif)
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(BACKEND_DIR)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """Database baru dengan skema terbaru (semua migrasi)"""
+    from migrations import run_migrations
+
+    path = str(tmp_path / "aws_db.sqlite")
+    conn = sqlite3.connect(path)
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
+    return path
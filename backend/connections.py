@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from urllib.parse import quote
+
+# === Profil PRAGMA bersama (semua service) ===
+# Semua koneksi ke database sensor dibuka lewat connect() di modul ini:
+# service sensor (IngestWriter), web, API, backup/retensi, rotasi partisi,
+# dan uplink. Nilai default bisa di-override di config.json -> "sqlite".
+#
+# journal_mode=WAL   : pembaca tidak pernah memblokir writer dan sebaliknya.
+# mmap_size          : halaman dibaca langsung dari page cache OS (tanpa
+#                      syscall read() per halaman) saat scan rentang panjang.
+# cache_size         : page cache per koneksi.
+# temp_store=MEMORY  : sort/GROUP BY sementara di RAM, bukan file di SD card.
+# busy_timeout       : tunggu lock sebentar alih-alih langsung "database is locked".
+#
+# Kebijakan checkpoint (ramah SD card): dengan synchronous=NORMAL fsync hanya
+# terjadi saat checkpoint, bukan setiap commit. wal_autocheckpoint yang lebih
+# besar dari default (1000 halaman) membuat checkpoint lebih jarang; halaman
+# yang diubah berkali-kali (index, rollup) cukup ditulis sekali ke file utama
+# per checkpoint, sehingga tulis acak kecil ke kartu berkurang. Checkpoint
+# hanya dijalankan koneksi yang menulis (pembaca query_only tidak pernah
+# commit). journal_size_limit memotong file -wal kembali setelah checkpoint
+# agar tidak terus membesar.
+PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",           # FULL jika ingin fsync setiap commit
+    "mmap_size": 256 * 1024 * 1024,    # batas mmap per koneksi
+    "cache_size": -16000,              # negatif = KiB → ±16 MB page cache per koneksi
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,              # ms
+    "wal_autocheckpoint": 4000,        # halaman (±16 MB WAL dengan halaman 4 KB)
+    "journal_size_limit": 64 * 1024 * 1024,
+    "cached_statements": 256           # prepared statement yang disimpan per koneksi
+}
+
+# PRAGMA yang hanya berlaku untuk koneksi yang menulis
+WRITER_PRAGMAS = ("journal_mode", "synchronous", "wal_autocheckpoint", "journal_size_limit")
+SESSION_PRAGMAS = ("mmap_size", "cache_size", "temp_store", "busy_timeout")
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+
+def sqlite_profile(overrides=None):
+    """PROFILE + config.json -> "sqlite" + overrides"""
+    cfg = dict(PROFILE)
+    try:
+        with open(CONFIG_PATH) as f:
+            cfg.update(json.load(f).get("sqlite", {}))
+    except (OSError, ValueError):
+        pass
+    cfg.update(overrides or {})
+    return cfg
+
+
+def profile_pragmas(profile=None, readonly=False):
+    """Daftar statement PRAGMA untuk profil ini (juga dipakai pool aiosqlite API)"""
+    cfg = sqlite_profile(profile)
+    names = SESSION_PRAGMAS if readonly else WRITER_PRAGMAS + SESSION_PRAGMAS
+    statements = [f"PRAGMA {name} = {cfg[name]}" for name in names if cfg.get(name) is not None]
+    if readonly:
+        statements.insert(0, "PRAGMA query_only = ON")
+    return statements
+
+
+def apply_profile(conn, profile=None, readonly=False):
+    for statement in profile_pragmas(profile, readonly):
+        conn.execute(statement)
+    return conn
+
+
+def readonly_uri(path):
+    """URI SQLite read-only; file yang tidak ada tidak akan dibuat"""
+    return f"file:{quote(os.path.abspath(str(path)))}?mode=ro"
+
+
+def connect(db_file, readonly=False, profile=None, **kwargs):
+    """
+    sqlite3.connect + profil PRAGMA. readonly=True membuka file dengan
+    mode=ro + query_only (pembaca); selain itu koneksi writer dengan WAL
+    dan kebijakan checkpoint di atas.
+    """
+    cfg = sqlite_profile(profile)
+    kwargs.setdefault("cached_statements", int(cfg["cached_statements"]))
+    if readonly:
+        conn = sqlite3.connect(readonly_uri(db_file), uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_file, **kwargs)
+    return apply_profile(conn, cfg, readonly)
+
+
+def profile_report(conn):
+    """Nilai PRAGMA yang benar-benar berlaku pada koneksi ini"""
+    report = {}
+    for name in WRITER_PRAGMAS + SESSION_PRAGMAS + ("query_only", "page_size"):
+        row = conn.execute(f"PRAGMA {name}").fetchone()
+        report[name] = row[0] if row else None
+    report["synchronous"] = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}.get(report["synchronous"],
+                                                                              report["synchronous"])
+    report["temp_store"] = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}.get(report["temp_store"], report["temp_store"])
+    report["query_only"] = bool(report["query_only"])
+    return report
+
+
+def describe_profile(conn):
+    """Satu baris ringkas untuk log startup"""
+    r = profile_report(conn)
+    return (f"journal={r['journal_mode']}, synchronous={r['synchronous']}, mmap={r['mmap_size'] // (1024 * 1024)} MB, "
+            f"cache={r['cache_size']}, temp_store={r['temp_store']}, busy_timeout={r['busy_timeout']} ms, "
+            f"autocheckpoint={r['wal_autocheckpoint']} halaman, query_only={r['query_only']}")
+
+
+# === Koneksi baca read-only (web dashboard) ===
+# Tiap thread worker memegang satu koneksi read-only yang tetap terbuka.
+# Karena koneksi dipakai ulang, statement yang sama diambil dari cache
+# statement sqlite3 (cached_statements) — query grafik tidak di-parse ulang
+# di setiap request.
+class ReadOnlyConnections:
+    """
+    Satu koneksi read-only per thread, dibuka saat pertama dipakai dan
+    tidak ditutup di akhir request. Aman untuk server pre-fork: koneksi
+    milik proses induk tidak dipakai (atau ditutup) oleh proses anak.
+    """
+
+    def __init__(self, db_file, profile=None, row_factory=None, on_open=None):
+        self.db_file = db_file
+        self.profile = profile
+        self.row_factory = row_factory
+        # on_open(conn) dipanggil sekali per proses untuk koneksi pertama (mis. log profil)
+        self.on_open = on_open
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._inherited = []
+        self._opened = False
+
+    def get(self):
+        if self._pid != os.getpid():
+            # Setelah fork: menutup koneksi warisan bisa melepas lock milik
+            # proses induk, jadi cukup disimpan dan tidak pernah dipakai
+            self._inherited.append(self._local)
+            self._local = threading.local()
+            self._pid = os.getpid()
+            self._opened = False
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_file, readonly=True, profile=self.profile, check_same_thread=False)
+            conn.row_factory = self.row_factory
+            self._local.conn = conn
+            if not self._opened:
+                self._opened = True
+                if self.on_open:
+                    self.on_open(conn)
+        return conn
+
+
+# === Entry Point: tampilkan profil yang berlaku ===
+# python connections.py [path database]
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "/opt/aws/database/aws_db.sqlite"
+    if not os.path.exists(db_path):
+        sys.exit(f"❌ Database tidak ditemukan: {db_path}")
+    print(json.dumps({
+        "configured": sqlite_profile(),
+        "writer": profile_report(connect(db_path)),
+        "reader": profile_report(connect(db_path, readonly=True))
+    }, indent=2))
@@ -1,10 +1,18 @@
-import sqlite3
 from datetime import datetime
+import atexit
 import json
 import logging
 import os
 import sys
+import threading
+import time
 import traceback
+from rollup import update_rollups
+from aggregator import STAT_COLUMNS
+from migrations import run_migrations
+from live import publish
+from latest_cache import LatestCacheWriter
+from connections import connect, describe_profile
 
 # === Konfigurasi Log ===
 log_path = "/opt/aws/logs/sensor.log"
@@ -34,74 +42,244 @@ except Exception as e:
 
 # === Path ke file database SQLite ===
 DB_FILE = "/opt/aws/database/aws_db.sqlite"
+JOURNAL_FILE = "/opt/aws/database/ingest_journal.jsonl"
 
-def insert_data(temp, hum, press, wspeed, wdir, rain, srad):
-    conn = None
+# === Pengaturan ingest (bisa di-override lewat config.json -> "ingest") ===
+INGEST = {
+    "batch_size": 100,        # flush jika buffer mencapai jumlah baris ini
+    "flush_interval": 10,     # atau jika baris tertua sudah menunggu N detik
+    "synchronous": "NORMAL",  # aman untuk WAL; FULL jika ingin fsync tiap commit
+    "journal_fsync": True     # fsync journal tiap append agar tahan mati listrik
+}
+INGEST.update(config.get("ingest", {}))
+
+BASE_COLUMNS = [
+    "temp", "hum", "press", "wspeed", "wdir", "rain", "srad",
+    "device", "timestamp", "created_at",
+    "latitude", "longitude", "altitude", "location"
+]
+
+ROLLUP_FIELDS = ["temp", "hum", "press", "wspeed", "wdir", "rain", "srad"]
+
+# Urutan kolom baris lengkap seperti hasil SELECT * (untuk cache data terakhir)
+ROW_COLUMNS = ["id"] + BASE_COLUMNS + STAT_COLUMNS
+
+
+class IngestWriter:
+    """
+    Penulis data sensor dengan satu koneksi SQLite yang tetap terbuka.
+
+    Setiap baris lebih dulu ditulis ke journal append-only (JSON per baris),
+    lalu disimpan ke database secara batch dalam satu transaksi. Journal
+    dikosongkan setelah commit; jika proses mati sebelum itu, isi journal
+    diputar ulang saat startup berikutnya.
+    """
+
+    def __init__(self, db_file=DB_FILE, journal_file=JOURNAL_FILE, batch_size=100,
+                 flush_interval=10, synchronous="NORMAL", journal_fsync=True):
+        self.db_file = db_file
+        self.journal_file = journal_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_fsync = journal_fsync
+        self.buffer = []
+        self.oldest = None
+        self.lock = threading.RLock()
+        self.closed = False
+
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.conn = connect(db_file, profile={"synchronous": synchronous}, check_same_thread=False)
+        profile = describe_profile(self.conn)
+
+        # Skema dikelola oleh migrations.py, cukup sekali saat startup
+        run_migrations(self.conn)
+        logging.info(f"✅ Ingest writer siap (batch={batch_size}): {profile}")
+
+        # Cache data terakhir untuk web & API; gagal dibuat bukan alasan berhenti
+        try:
+            self.latest_cache = LatestCacheWriter()
+        except OSError as e:
+            logging.warning(f"⚠️ Cache data terakhir tidak tersedia: {e}")
+            self.latest_cache = None
+
+        self._replay_journal()
+        self.journal = open(journal_file, "a", encoding="utf-8")
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="ingest-flusher", daemon=True)
+        self._flusher.start()
+
+    # === Journal ===
+    def _replay_journal(self):
+        """Simpan ulang baris yang tertinggal di journal dari proses sebelumnya"""
+        if not os.path.exists(self.journal_file):
+            return
+        rows = []
+        with open(self.journal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # Baris terakhir bisa terpotong saat mati listrik
+                    logging.warning(f"⚠️ Baris journal rusak dilewati: {line[:80]!r}")
+        if rows:
+            logging.info(f"🔁 Memutar ulang {len(rows)} baris dari journal...")
+            self._write_rows(rows)
+        open(self.journal_file, "w").close()
+
+    def _append_journal(self, row):
+        self.journal.write(json.dumps(row) + "\n")
+        self.journal.flush()
+        if self.journal_fsync:
+            os.fsync(self.journal.fileno())
+
+    # === Penulisan ===
+    def append(self, row):
+        """Tambahkan satu baris (dict kolom -> nilai) ke buffer"""
+        with self.lock:
+            self._append_journal(row)
+            self.buffer.append(row)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Simpan seluruh buffer dalam satu transaksi"""
+        with self.lock:
+            if not self.buffer:
+                return 0
+            rows = self.buffer
+            self._write_rows(rows)
+            self.buffer = []
+            self.oldest = None
+            self.journal.seek(0)
+            self.journal.truncate()
+            return len(rows)
+
+    def _write_rows(self, rows):
+        cur = self.conn.cursor()
+        stored = []
+        try:
+            for row in rows:
+                columns = list(row)
+                # Baris yang sudah tersimpan (mis. replay journal) dilewati lewat index unik
+                cur.execute(f"""
+                INSERT INTO sensor_datas ({", ".join(columns)})
+                VALUES ({", ".join("?" for _ in columns)})
+                ON CONFLICT (device, timestamp) DO NOTHING
+                """, [row[col] for col in columns])
+                if not cur.rowcount:
+                    continue
+                row_id = cur.lastrowid
+                # Perbarui rollup 1 jam / 1 hari dalam transaksi yang sama
+                update_rollups(cur, row.get("device"), row["timestamp"],
+                               {p: row.get(p) for p in ROLLUP_FIELDS})
+                stored.append(dict(row, id=row_id))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        logging.info(f"💾 {len(stored)} baris disimpan dalam satu transaksi.")
+        self._publish_latest(stored)
+        return len(stored)
+
+    def _publish_latest(self, rows):
+        """
+        Terbitkan baris terbaru tiap device setelah commit: ke cache data
+        terakhir (dibaca web & API) dan ke web service (live update).
+        """
+        latest = {}
+        for row in rows:
+            device = row.get("device")
+            if device not in latest or row["timestamp"] >= latest[device]["timestamp"]:
+                latest[device] = {col: row.get(col) for col in ROW_COLUMNS}
+        if not latest:
+            return
+        if self.latest_cache:
+            try:
+                self.latest_cache.update(latest.values())
+            except Exception as e:
+                logging.error(f"❌ Gagal memperbarui cache data terakhir: {e}")
+        for row in latest.values():
+            publish(row)
+
+    def _flush_loop(self):
+        while not self.closed:
+            time.sleep(1)
+            try:
+                with self.lock:
+                    due = self.oldest is not None and time.monotonic() - self.oldest >= self.flush_interval
+                    if due:
+                        self.flush()
+            except Exception as e:
+                # Baris tetap ada di buffer & journal, dicoba lagi nanti
+                logging.error(f"❌ Gagal flush batch: {e}")
+                traceback.print_exc()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"❌ Gagal flush saat menutup (baris tetap di journal): {e}")
+            self.journal.close()
+            self.conn.close()
+            if self.latest_cache:
+                self.latest_cache.close()
+            logging.debug("🔒 Koneksi database ditutup.")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Writer bersama untuk proses ini (dibuat saat pertama dipakai)"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = IngestWriter(
+                batch_size=INGEST["batch_size"],
+                flush_interval=INGEST["flush_interval"],
+                synchronous=INGEST["synchronous"],
+                journal_fsync=INGEST["journal_fsync"]
+            )
+            atexit.register(_writer.close)
+    return _writer
+
+
+def insert_data(temp, hum, press, wspeed, wdir, rain, srad, timestamp=None, stats=None,
+                device=None, location=None, geo=None):
+    """
+    Simpan satu baris data. `timestamp` default waktu sekarang; `stats`
+    berisi kolom statistik tambahan (STAT_COLUMNS) dari mode agregasi.
+    `device`/`location`/`geo` default dari config.json (satu stasiun).
+    Baris masuk journal & buffer, lalu disimpan secara batch oleh writer.
+    """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-
-        # Buat tabel jika belum ada
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS sensor_datas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            temp REAL,
-            hum REAL,
-            press REAL,
-            wspeed REAL,
-            wdir REAL,
-            rain REAL,
-            srad REAL,
-            device TEXT,
-            timestamp INTEGER,
-            created_at INTEGER,
-            latitude REAL,
-            longitude REAL,
-            altitude REAL,
-            location TEXT
-        )
-        """)
-        logging.debug("✅ Tabel sensor_datas diperiksa/dibuat.")
-
-        # Buat index jika belum ada
-        cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_sensor_timestamp
-        ON sensor_datas (timestamp);
-        """)
-        logging.debug("✅ Index timestamp diperiksa/dibuat.")
-
-        # Persiapan data
-        now = int(datetime.now().timestamp())
-        geo = config.get("geo", {})
-        values = (
+        now = int(timestamp if timestamp is not None else datetime.now().timestamp())
+        device = device or config.get("device", "unknown")
+        geo = geo if geo is not None else config.get("geo", {})
+        row = dict(zip(BASE_COLUMNS, (
             temp, hum, press, wspeed, wdir, rain, srad,
-            config.get("device", "unknown"), now, now,
+            device, now, now,
             geo.get("latitude", 0.0),
             geo.get("longitude", 0.0),
             geo.get("altitude", 0.0),
-            config.get("location", "unknown")
-        )
-
-        # Eksekusi insert
-        cur.execute("""
-        INSERT INTO sensor_datas (
-            temp, hum, press, wspeed, wdir, rain, srad,
-            device, timestamp, created_at,
-            latitude, longitude, altitude, location
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, values)
+            location or config.get("location", "unknown")
+        )))
+        for col in STAT_COLUMNS:
+            if stats and col in stats:
+                row[col] = stats[col]
 
-        conn.commit()
-        logging.info(f"✅ Data berhasil disimpan. Timestamp: {now}, Device: {config.get('device')}")
-        print("✅ Data inserted successfully:", now)
+        get_writer().append(row)
+        logging.info(f"✅ Data masuk antrean simpan. Timestamp: {now}, Device: {device}")
+        print("✅ Data queued:", now)
 
     except Exception as e:
         logging.error(f"❌ Database insert error: {e}")
         traceback.print_exc()
         print("❌ Database insert error:", e)
-
-    finally:
-        if conn:
-            conn.close()
-            logging.debug("🔒 Koneksi database ditutup.")
-
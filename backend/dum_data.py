@@ -1,7 +1,9 @@
-import sqlite3
 import random
 from datetime import datetime, timedelta
 import json
+from rollup import rebuild_rollups
+from migrations import run_migrations
+from connections import connect
 
 # Load konfigurasi device
 with open("config.json") as f:
@@ -9,32 +11,6 @@ with open("config.json") as f:
 
 DB_FILE = "../database/aws_db.sqlite"
 
-def create_table_if_not_exists(conn):
-    """Buat tabel dan index jika belum ada"""
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sensor_datas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            temp REAL,
-            hum REAL,
-            press REAL,
-            wspeed REAL,
-            wdir REAL,
-            rain REAL,
-            srad REAL,
-            device TEXT,
-            timestamp INTEGER,
-            created_at TEXT,
-            latitude REAL,
-            longitude REAL,
-            altitude REAL,
-            location TEXT
-        );
-    """)
-    # Index timestamp agar query cepat
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON sensor_datas (timestamp);")
-    conn.commit()
-
 def insert_dummy_data(conn):
     """Generate data dummy 2 tahun ke belakang (5 menit interval) dengan missing timestamp 10-15%"""
     cur = conn.cursor()
@@ -57,7 +33,7 @@ def insert_dummy_data(conn):
     for i in range(total_intervals):
         dt = start_time + timedelta(minutes=i*5)
         timestamp = int(dt.timestamp())
-        created_at = dt.isoformat()
+        created_at = timestamp
 
         # Update persentase data hilang jika ganti bulan
         if dt.month != current_month:
@@ -85,6 +61,7 @@ def insert_dummy_data(conn):
                 device, timestamp, created_at,
                 latitude, longitude, altitude, location
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (device, timestamp) DO NOTHING
         """, (
             temp, hum, press, wspeed, wdir, rain, srad,
             device, timestamp, created_at,
@@ -102,10 +79,12 @@ def insert_dummy_data(conn):
     print(f"⚠️ Timestamp hilang (simulasi alat mati): {skipped_timestamps} interval.")
 
 def main():
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     try:
-        create_table_if_not_exists(conn)
+        run_migrations(conn)
         insert_dummy_data(conn)
+        # Bangun rollup 1 jam / 1 hari dari data dummy
+        rebuild_rollups(conn)
     finally:
         conn.close()
 
@@ -1,8 +1,11 @@
-import sqlite3
 import random
 from datetime import datetime
 import json
 import time
+from rollup import update_rollups
+from migrations import run_migrations
+from latest_cache import LatestCacheWriter
+from connections import connect
 
 # Load config
 with open("config.json") as f:
@@ -12,18 +15,20 @@ DB_FILE = "../database/aws_db.sqlite"
 
 def insert_realtime_data():
     """Insert 1 baris data realtime setiap 60 detik"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cur = conn.cursor()
 
     geo = config["geo"]
     device = config["device"]
     location = config["location"]
+    run_migrations(conn)
+    latest_cache = LatestCacheWriter()
 
     try:
         while True:
             now = datetime.now()
             timestamp = int(now.timestamp())
-            created_at = now.isoformat()
+            created_at = timestamp
 
             # Random data
             temp = round(random.uniform(20.0, 35.0), 1)
@@ -40,14 +45,32 @@ def insert_realtime_data():
                     device, timestamp, created_at,
                     latitude, longitude, altitude, location
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (device, timestamp) DO NOTHING
             """, (
                 temp, hum, press, wspeed, wdir, rain, srad,
                 device, timestamp, created_at,
                 geo["latitude"], geo["longitude"], geo["altitude"],
                 location
             ))
-            conn.commit()
-            print(f"📡 Inserted realtime data @ {now}")
+            # Sama seperti IngestWriter: rollup hanya diperbarui untuk baris yang benar-benar baru
+            if cur.rowcount:
+                row_id = cur.lastrowid
+                update_rollups(cur, device, timestamp, {
+                    "temp": temp, "hum": hum, "press": press, "wspeed": wspeed,
+                    "wdir": wdir, "rain": rain, "srad": srad
+                })
+                conn.commit()
+                latest_cache.update([{
+                    "id": row_id, "temp": temp, "hum": hum, "press": press, "wspeed": wspeed,
+                    "wdir": wdir, "rain": rain, "srad": srad, "device": device, "timestamp": timestamp,
+                    "created_at": created_at, "latitude": geo["latitude"], "longitude": geo["longitude"],
+                    "altitude": geo["altitude"], "location": location
+                }])
+                print(f"📡 Inserted realtime data @ {now}")
+            else:
+                # Tutup transaksi implisit agar lock tulis tidak tertahan selama sleep
+                conn.commit()
+                print(f"⚠️ Data @ {now} sudah ada, dilewati")
 
             # Tunggu 60 detik
             time.sleep(60*5)
@@ -55,6 +78,7 @@ def insert_realtime_data():
     except KeyboardInterrupt:
         print("\n🛑 Realtime data generator dihentikan oleh user.")
     finally:
+        latest_cache.close()
         conn.close()
 
 if __name__ == "__main__":
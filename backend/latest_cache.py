@@ -0,0 +1,148 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+# === Cache Data Terakhir (shared memory) ===
+# File kecil yang di-mmap: ditulis oleh service sensor setelah commit, dibaca
+# tanpa lock oleh web & API. Pembaca tidak pernah menyentuh SQLite untuk
+# data terakhir.
+#
+# Layout:
+#   [0:4]   magic b"AWSL"
+#   [4:8]   panjang payload (uint32)
+#   [8:16]  versi (uint64) — ganjil saat writer sedang menulis (seqlock)
+#   [16:]   payload JSON {device: baris terakhir}
+CACHE_FILE = "/dev/shm/aws_latest.cache" if os.path.isdir("/dev/shm") else "/opt/aws/run/aws_latest.cache"
+
+MAGIC = b"AWSL"
+HEADER = struct.Struct("<4sIQ")
+CAPACITY = 256 * 1024
+READ_RETRIES = 100
+
+
+class LatestCacheWriter:
+    """
+    Penulis cache. Service sensor adalah penulis utama, tapi API (POST data)
+    juga boleh menulis: setiap update dikunci dengan flock dan digabung
+    dengan isi file saat itu, jadi device dari proses lain tidak hilang.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_FILE
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != HEADER.size + CAPACITY:
+                os.ftruncate(self.fd, HEADER.size + CAPACITY)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.mm = mmap.mmap(self.fd, HEADER.size + CAPACITY)
+        self.lock = threading.Lock()
+
+    def _current(self):
+        magic, length, version = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            return {}, 0
+        try:
+            rows = json.loads(self.mm[HEADER.size:HEADER.size + length])
+        except ValueError:
+            rows = {}
+        # Versi ganjil tertinggal jika penulis sebelumnya mati di tengah jalan
+        return rows, version + (version & 1)
+
+    def update(self, rows):
+        """Gabungkan baris terbaru per device lalu terbitkan versi baru"""
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                current, version = self._current()
+                for row in rows:
+                    key = row.get("device") or ""
+                    old = current.get(key)
+                    if old is None or (row.get("timestamp") or 0) >= (old.get("timestamp") or 0):
+                        current[key] = row
+                payload = json.dumps(current).encode("utf-8")
+                if len(payload) > CAPACITY:
+                    logging.warning(f"⚠️ Cache data terakhir penuh ({len(payload)} byte), tidak diperbarui.")
+                    return version
+
+                # Versi ganjil = sedang menulis; pembaca akan mencoba ulang
+                struct.pack_into("<Q", self.mm, 8, version + 1)
+                self.mm[HEADER.size:HEADER.size + len(payload)] = payload
+                struct.pack_into("<4sI", self.mm, 0, MAGIC, len(payload))
+                struct.pack_into("<Q", self.mm, 8, version + 2)
+                return version + 2
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class LatestCacheReader:
+    """
+    Pembaca cache tanpa lock. Hasil parse disimpan per versi, jadi selama
+    tidak ada data baru, get() hanya membaca 8 byte header.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_FILE
+        self.mm = None
+        self._version = None
+        self._rows = None
+
+    def _open(self):
+        if self.mm is not None:
+            return True
+        try:
+            with open(self.path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def version(self):
+        """Versi ingest saat ini (berubah setiap ada data baru), None jika belum ada cache"""
+        if not self._open():
+            return None
+        magic, _, version = HEADER.unpack_from(self.mm, 0)
+        return version if magic == MAGIC else None
+
+    def snapshot(self):
+        """(versi, {device: baris}) atau (None, None) jika cache belum tersedia"""
+        if not self._open():
+            return None, None
+        for _ in range(READ_RETRIES):
+            magic, length, v1 = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC:
+                return None, None
+            if v1 == self._version:
+                return v1, self._rows
+            if v1 & 1:
+                continue
+            payload = self.mm[HEADER.size:HEADER.size + length]
+            v2 = struct.unpack_from("<Q", self.mm, 8)[0]
+            if v1 != v2:
+                continue
+            try:
+                rows = json.loads(payload)
+            except ValueError:
+                continue
+            self._version, self._rows = v1, rows
+            return v1, rows
+        return None, None
+
+    def get(self, device=None):
+        """Baris terakhir untuk device, atau yang paling baru dari semua device"""
+        _, rows = self.snapshot()
+        if not rows:
+            return None
+        if device is not None:
+            return rows.get(device)
+        return max(rows.values(), key=lambda r: r.get("timestamp") or 0)
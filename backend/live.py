@@ -0,0 +1,133 @@
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+
+# === Live Update (ingest → web) ===
+# Setiap proses web membuka socket datagram UNIX sendiri di LIVE_DIR.
+# Writer ingest mengirim baris terbaru ke semua socket tersebut setelah
+# commit, lalu proses web meneruskannya ke browser lewat Server-Sent Events.
+LIVE_DIR = "/opt/aws/run/live"
+
+# Datagram UNIX bisa jauh lebih besar, tapi satu baris sensor cukup kecil
+MAX_DATAGRAM = 65536
+
+
+def publish(payload, live_dir=None):
+    """
+    Kirim payload (dict) ke semua subscriber. Tidak pernah memblokir atau
+    melempar error: jika tidak ada web service yang mendengar, payload dibuang.
+    """
+    live_dir = live_dir or LIVE_DIR
+    paths = glob.glob(os.path.join(live_dir, "*.sock"))
+    if not paths:
+        return 0
+    data = json.dumps(payload).encode("utf-8")
+    sent = 0
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for path in paths:
+            try:
+                sock.sendto(data, path)
+                sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Proses web sudah mati tanpa membersihkan socket-nya
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                # Buffer penerima penuh, dsb. — update berikutnya akan menyusul
+                logging.debug(f"⚠️ Live update ke {path} gagal: {e}")
+    finally:
+        sock.close()
+    return sent
+
+
+class LiveHub:
+    """
+    Penerima live update di proses web. Satu thread membaca socket dan
+    menyebarkan payload ke antrean tiap client SSE yang terhubung.
+    """
+
+    def __init__(self, live_dir=None, client_queue_size=16):
+        self.live_dir = live_dir or LIVE_DIR
+        self.client_queue_size = client_queue_size
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.last = {}  # event terakhir per jenis, dikirim ke client baru
+        self.sock = None
+        self.path = None
+
+    def start(self):
+        os.makedirs(self.live_dir, exist_ok=True)
+        self.path = os.path.join(self.live_dir, f"web-{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        threading.Thread(target=self._receive_loop, name="live-hub", daemon=True).start()
+        logging.info(f"📡 Live hub mendengarkan di {self.path}")
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _receive_loop(self):
+        while self.sock:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+                payload = json.loads(data)
+            except OSError:
+                break
+            except ValueError as e:
+                logging.warning(f"⚠️ Live update tidak valid: {e}")
+                continue
+            self.broadcast("reading", payload)
+
+    def broadcast(self, event, payload):
+        with self.lock:
+            self.last[event] = payload
+            clients = list(self.clients)
+        for q in clients:
+            try:
+                q.put_nowait((event, payload))
+            except queue.Full:
+                # Client lambat: buang update tertua, simpan yang terbaru
+                try:
+                    q.get_nowait()
+                    q.put_nowait((event, payload))
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def subscribe(self, max_clients=None):
+        """Queue untuk satu client baru, None jika sudah ada max_clients client"""
+        q = queue.Queue(maxsize=self.client_queue_size)
+        with self.lock:
+            if max_clients is not None and len(self.clients) >= max_clients:
+                return None
+            self.clients.add(q)
+            for event, payload in self.last.items():
+                q.put_nowait((event, payload))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.clients.discard(q)
+
+    @property
+    def client_count(self):
+        with self.lock:
+            return len(self.clients)
+
+
+def format_sse(event, payload):
+    """Satu pesan Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
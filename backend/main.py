@@ -1,9 +1,12 @@
 import time
 from datetime import datetime
-from sensor import read_sensor
+from sensor import read_sensor, config
 from database import insert_data
+import scheduler
 import logging
 import os
+import signal
+import sys
 import traceback
 
 # === Konfigurasi Log ===
@@ -22,8 +25,8 @@ def should_run():
     now = datetime.now()
     return now.minute % 5 == 0 and now.second == 0
 
-# === Fungsi utama ===
-def main():
+# === Mode snapshot: satu pembacaan tiap 5 menit ===
+def run_snapshot():
     print("⏱️ Menunggu waktu yang tepat (tiap 5 menit di detik ke-0)...")
     logging.info("⏱️ Service dimulai. Menunggu waktu eksekusi sensor setiap 5 menit.")
 
@@ -75,6 +78,29 @@ def main():
         logging.info("🛑 Service dihentikan secara manual.")
         print("\n🛑 Dihentikan oleh pengguna.")
 
+
+# === Fungsi utama ===
+def main():
+    # Mode sampling menentukan cara baca & arti kolom (mis. rain); "devices"
+    # hanya menentukan jumlah sensor yang dipoll
+    mode = config.get("sampling", {}).get("mode", "snapshot")
+    if mode not in scheduler.SAMPLING_MODES:
+        logging.error(f"❌ sampling.mode tidak dikenal: {mode} (pilih: {', '.join(scheduler.SAMPLING_MODES)})")
+        sys.exit(f"❌ sampling.mode tidak dikenal: {mode}")
+
+    if mode == "aggregate" or config.get("devices"):
+        # Satu worker per port: snapshot tiap storage_interval, atau sampling
+        # tiap N detik dengan ringkasan per interval (aggregate)
+        try:
+            scheduler.run(scheduler.load_devices(config))
+        except KeyboardInterrupt:
+            logging.info("🛑 Service dihentikan secara manual.")
+            print("\n🛑 Dihentikan oleh pengguna.")
+    else:
+        run_snapshot()
+
 # === Eksekusi ===
 if __name__ == "__main__":
+    # systemctl stop mengirim SIGTERM; keluar normal agar buffer ingest di-flush
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     main()
@@ -0,0 +1,317 @@
+import logging
+import time
+
+from aggregator import STAT_COLUMNS
+from rollup import create_rollup_tables, rebuild_rollups
+
+# === Migrasi Skema sensor_datas ===
+# Satu-satunya tempat skema didefinisikan. Service sensor, API, dan script
+# dummy memanggil run_migrations() saat startup; versi yang sudah diterapkan
+# dicatat di tabel schema_migrations sehingga tiap migrasi hanya jalan sekali.
+
+
+def _v1_base_table(cur):
+    """Tabel utama + index timestamp (menyatukan skema lama backend & dum_data)"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sensor_datas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        temp REAL,
+        hum REAL,
+        press REAL,
+        wspeed REAL,
+        wdir REAL,
+        rain REAL,
+        srad REAL,
+        device TEXT,
+        timestamp INTEGER,
+        created_at INTEGER,
+        latitude REAL,
+        longitude REAL,
+        altitude REAL,
+        location TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sensor_timestamp ON sensor_datas (timestamp)")
+    # Index duplikat buatan dum_data.py versi lama
+    cur.execute("DROP INDEX IF EXISTS idx_timestamp")
+
+
+def _v2_stat_columns(cur):
+    """Kolom statistik mode agregasi"""
+    existing = {row[1] for row in cur.execute("PRAGMA table_info(sensor_datas)")}
+    for col in STAT_COLUMNS:
+        if col not in existing:
+            col_type = "INTEGER" if col == "sample_count" else "REAL"
+            cur.execute(f"ALTER TABLE sensor_datas ADD COLUMN {col} {col_type}")
+
+
+def _v3_composite_indexes(cur):
+    """
+    - (device, timestamp DESC): latest/range per device tanpa scan
+    - (timestamp, kolom utama): covering index untuk grafik & latest, SQLite
+      tidak punya INCLUDE jadi kolom ikut sebagai key
+    """
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sensor_device_timestamp
+    ON sensor_datas (device, timestamp DESC)
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sensor_timestamp_cover
+    ON sensor_datas (timestamp, temp, hum, press, wspeed, wdir, rain, srad)
+    """)
+
+
+def _v4_station_registry(cur):
+    """
+    Registry stasiun (satu baris per device, bukan per pembacaan) dengan
+    R-tree untuk pencarian lokasi. Dijaga oleh trigger saat insert.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device TEXT NOT NULL UNIQUE,
+        location TEXT,
+        latitude REAL,
+        longitude REAL,
+        altitude REAL,
+        first_ts INTEGER,
+        last_ts INTEGER
+    )
+    """)
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS stations_rtree
+    USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sensor_station_upsert
+    AFTER INSERT ON sensor_datas
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO stations (device, location, latitude, longitude, altitude, first_ts, last_ts)
+        VALUES (IFNULL(NEW.device, ''), NEW.location, NEW.latitude, NEW.longitude, NEW.altitude,
+                NEW.timestamp, NEW.timestamp)
+        ON CONFLICT(device) DO UPDATE SET
+            location = CASE WHEN excluded.last_ts >= last_ts THEN excluded.location ELSE location END,
+            latitude = CASE WHEN excluded.last_ts >= last_ts THEN excluded.latitude ELSE latitude END,
+            longitude = CASE WHEN excluded.last_ts >= last_ts THEN excluded.longitude ELSE longitude END,
+            altitude = CASE WHEN excluded.last_ts >= last_ts THEN excluded.altitude ELSE altitude END,
+            first_ts = min(first_ts, excluded.first_ts),
+            last_ts = max(last_ts, excluded.last_ts);
+        INSERT OR REPLACE INTO stations_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT id, latitude, latitude, longitude, longitude
+        FROM stations WHERE device = IFNULL(NEW.device, '');
+    END
+    """)
+
+    # Isi dari data yang sudah ada: lokasi terakhir tiap device
+    cur.execute("""
+    INSERT OR IGNORE INTO stations (device, location, latitude, longitude, altitude, first_ts, last_ts)
+    SELECT IFNULL(s.device, ''), s.location, s.latitude, s.longitude, s.altitude, agg.first_ts, agg.last_ts
+    FROM (
+        SELECT device, MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts
+        FROM sensor_datas
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        GROUP BY device
+    ) agg
+    JOIN sensor_datas s
+      ON s.device IS agg.device AND s.timestamp = agg.last_ts
+    GROUP BY IFNULL(s.device, '')
+    """)
+    cur.execute("""
+    INSERT OR REPLACE INTO stations_rtree (id, min_lat, max_lat, min_lon, max_lon)
+    SELECT id, latitude, latitude, longitude, longitude FROM stations
+    """)
+
+
+def _v5_rollup_tables(cur):
+    """Tabel rollup 1 jam / 1 hari, di-backfill dari data mentah"""
+    create_rollup_tables(cur)
+    rebuild_rollups(cur.connection, commit=False)
+
+
+def _v6_created_at_epoch(cur):
+    """dum_data.py versi lama menulis created_at sebagai teks ISO; samakan ke epoch"""
+    cur.execute("""
+    UPDATE sensor_datas SET created_at = timestamp
+    WHERE typeof(created_at) = 'text'
+    """)
+
+
+def _v7_unique_device_timestamp(cur):
+    """
+    Satu baris per (device, timestamp), dasar upsert ingest massal API.
+    Duplikat lama (replay journal, import ganda) dibuang, yang tersimpan
+    terakhir dipertahankan, lalu rollup hari terdampak dihitung ulang.
+    Index (device, timestamp DESC) v3 digantikan index unik ini.
+    """
+    since = cur.execute("""
+    SELECT MIN(timestamp) FROM sensor_datas
+    WHERE device IS NOT NULL AND id NOT IN (
+        SELECT MAX(id) FROM sensor_datas WHERE device IS NOT NULL GROUP BY device, timestamp
+    )
+    """).fetchone()[0]
+    if since is not None:
+        cur.execute("""
+        DELETE FROM sensor_datas
+        WHERE device IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM sensor_datas WHERE device IS NOT NULL GROUP BY device, timestamp
+        )
+        """)
+        logging.info(f"🧹 {cur.rowcount} baris duplikat (device, timestamp) dihapus.")
+        rebuild_rollups(cur.connection, since=since, commit=False)
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_device_timestamp_unique
+    ON sensor_datas (device, timestamp)
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_sensor_device_timestamp")
+
+
+def _v8_change_sequence(cur):
+    """
+    change_seq: nomor urut perubahan yang selalu naik, dasar watermark
+    konsumen (segmen backup, uplink). Upsert ingest massal mengubah baris di
+    tempat dengan id yang sama, jadi watermark id tidak melihat koreksi.
+    Penghitung disimpan di tabel tersendiri (bukan MAX(change_seq)) agar
+    tidak turun saat baris dipindah ke partisi atau dihapus retensi.
+    Baris lama memakai id sebagai change_seq dan penghitung mulai dari id
+    terbesar yang pernah dipakai, sehingga watermark id lama tetap berlaku.
+    """
+    existing = {row[1] for row in cur.execute("PRAGMA table_info(sensor_datas)")}
+    if "change_seq" not in existing:
+        cur.execute("ALTER TABLE sensor_datas ADD COLUMN change_seq INTEGER")
+    cur.execute("UPDATE sensor_datas SET change_seq = id WHERE change_seq IS NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sensor_change_seq ON sensor_datas (change_seq)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_counter (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )
+    """)
+    cur.execute("""
+    INSERT OR IGNORE INTO change_counter (id, seq)
+    SELECT 1, MAX(IFNULL((SELECT MAX(id) FROM sensor_datas), 0),
+                  IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'sensor_datas'), 0))
+    """)
+
+    # Writer yang mengisi change_seq sendiri (upsert ke partisi, restore)
+    # mengambil nomor dari change_counter; selebihnya diisi trigger
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sensor_change_seq_insert
+    AFTER INSERT ON sensor_datas
+    WHEN NEW.change_seq IS NULL
+    BEGIN
+        UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+        UPDATE sensor_datas SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)
+        WHERE id = NEW.id;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sensor_change_seq_update
+    AFTER UPDATE ON sensor_datas
+    WHEN NEW.change_seq IS OLD.change_seq
+    BEGIN
+        UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+        UPDATE sensor_datas SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)
+        WHERE id = NEW.id;
+    END
+    """)
+
+
+def _v9_deleted_rows(cur):
+    """
+    Log penghapusan (tombstone) untuk segmen backup: baris yang dihapus
+    retensi atau dipindah ke partisi tidak lagi punya change_seq di tabel,
+    jadi id-nya dicatat dengan nomor dari change_counter yang sama.
+    Tombstone dipangkas backup.py setelah tercatat di segmen.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sensor_datas_deleted (
+        seq INTEGER PRIMARY KEY,
+        id INTEGER NOT NULL
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sensor_change_seq_delete
+    AFTER DELETE ON sensor_datas
+    BEGIN
+        UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+        INSERT INTO sensor_datas_deleted (seq, id)
+        VALUES ((SELECT seq FROM change_counter WHERE id = 1), OLD.id);
+    END
+    """)
+
+
+def next_change_seqs(conn, count, schema="main"):
+    """Ambil `count` nomor change_seq berurutan (di dalam transaksi pemanggil); kembalikan nomor pertama"""
+    conn.execute(f"UPDATE {schema}.change_counter SET seq = seq + ? WHERE id = 1", (count,))
+    return conn.execute(f"SELECT seq FROM {schema}.change_counter WHERE id = 1").fetchone()[0] - count + 1
+
+
+MIGRATIONS = [
+    (1, "base sensor_datas table", _v1_base_table),
+    (2, "aggregate statistic columns", _v2_stat_columns),
+    (3, "composite & covering indexes", _v3_composite_indexes),
+    (4, "station registry + R-tree", _v4_station_registry),
+    (5, "rollup tables", _v5_rollup_tables),
+    (6, "created_at as epoch integer", _v6_created_at_epoch),
+    (7, "unique (device, timestamp)", _v7_unique_device_timestamp),
+    (8, "change sequence for watermark consumers", _v8_change_sequence),
+    (9, "deleted rows log for backup segments", _v9_deleted_rows),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at INTEGER
+    )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    """
+    Terapkan migrasi yang belum jalan. Tiap migrasi berjalan dalam transaksi
+    BEGIN IMMEDIATE sendiri, jadi beberapa service yang start bersamaan
+    tidak menerapkan migrasi yang sama dua kali.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    # Backfill awal bisa lama; tunggu service lain alih-alih langsung gagal
+    conn.execute("PRAGMA busy_timeout = 120000")
+
+    # Database baru: auto_vacuum hanya bisa diset sebelum tabel pertama dibuat.
+    # Halaman kosong hasil purge dikembalikan bertahap oleh retention.py.
+    # VACUUM pada file kosong instan, dan perlu agar berlaku di mode WAL.
+    if not conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    if current_version(conn) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    for version, name, migrate in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            logging.info(f"🔧 Menerapkan migrasi v{version}: {name}...")
+            migrate(conn.cursor())
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, int(time.time()))
+            )
+            conn.commit()
+            logging.info(f"✅ Migrasi v{version} selesai.")
+        except Exception:
+            conn.rollback()
+            logging.error(f"❌ Migrasi v{version} gagal.")
+            raise
+    return SCHEMA_VERSION
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from connections import connect as connect_db, readonly_uri
+
+# === Partisi Bulanan sensor_datas (opsional) ===
+# Aktif lewat config.json -> "partitions": {"enabled": true}. Database utama
+# tetap menampung data mentah bulan berjalan (hot_months terakhir), rollup,
+# registry stasiun, dan penulisan data baru (ingest massal API untuk bulan
+# yang sudah dipartisi langsung ke file partisinya). Bulan yang sudah tutup
+# dipindahkan oleh backup.py ke file sendiri:
+#   <folder database>/partitions/sensor_2025-01.sqlite
+# Pembacaan rentang waktu lewat PartitionRouter: hanya partisi yang
+# beririsan yang di-ATTACH, lalu TEMP VIEW bernama sensor_datas (menutupi
+# tabel main.sensor_datas untuk koneksi itu saja) menggabungkan main +
+# partisi, sehingga query yang sudah ada tidak perlu diubah.
+# Retensi cukup menghapus file partisi; backup hanya menyalin partisi yang
+# berubah sejak backup sebelumnya.
+PARTITIONS = {
+    "enabled": False,
+    "dir": None,          # None = <folder database>/partitions
+    "hot_months": 2,      # bulan berjalan + bulan lalu tetap di database utama
+    "batch_rows": 2000,   # baris per transaksi saat memindahkan bulan
+    "batch_sleep": 0.05
+}
+
+PARTITION_PREFIX = "sensor_"
+PARTITION_SUFFIX = ".sqlite"
+TABLE = "sensor_datas"
+# SQLITE_MAX_ATTACHED bawaan; rentang yang lebih panjang dipecah per jendela
+MAX_ATTACHED = 10
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+_KEY_RE = re.compile(r"^\d{4}-\d{2}$")
+
+
+def partition_settings(overrides=None):
+    """PARTITIONS + config.json -> "partitions" + overrides"""
+    cfg = dict(PARTITIONS)
+    try:
+        with open(CONFIG_PATH) as f:
+            cfg.update(json.load(f).get("partitions", {}))
+    except (OSError, ValueError):
+        pass
+    cfg.update(overrides or {})
+    return cfg
+
+
+# === Kunci bulan (waktu lokal, sama seperti bucket rollup) ===
+def month_key(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m")
+
+
+def add_months(key, n):
+    year, month = map(int, key.split("-"))
+    index = year * 12 + month - 1 + n
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def month_start(key):
+    year, month = map(int, key.split("-"))
+    return int(datetime(year, month, 1).timestamp())
+
+
+def month_end(key):
+    """Awal bulan berikutnya (eksklusif)"""
+    return month_start(add_months(key, 1))
+
+
+def schema_name(key):
+    """Nama schema ATTACH untuk partisi bulan `key`"""
+    return "p_" + key.replace("-", "_")
+
+
+def temp_ddl(conn, *statements):
+    """DDL pada schema temp; koneksi query_only dibuka sebentar (file tetap read-only)"""
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    if query_only:
+        conn.execute("PRAGMA query_only = OFF")
+    try:
+        for sql in statements:
+            conn.execute(sql)
+    finally:
+        if query_only:
+            conn.execute("PRAGMA query_only = ON")
+
+
+class PartitionRouter:
+    """
+    Menentukan partisi yang beririsan dengan rentang waktu dan memasangnya
+    pada koneksi. Jika partisi nonaktif atau tidak ada yang beririsan,
+    koneksi dibiarkan apa adanya (langsung ke main.sensor_datas).
+    """
+
+    def __init__(self, db_file, settings=None, readonly=False):
+        self.db_file = str(db_file)
+        # readonly: partisi di-ATTACH dengan mode=ro (koneksi utama harus dibuka sebagai URI)
+        self.readonly = readonly
+        self.settings = partition_settings(settings)
+        self.enabled = bool(self.settings["enabled"])
+        self.dir = self.settings["dir"] or os.path.join(os.path.dirname(self.db_file), "partitions")
+
+    def path(self, key):
+        return os.path.join(self.dir, f"{PARTITION_PREFIX}{key}{PARTITION_SUFFIX}")
+
+    def partitions(self, start=None, end=None):
+        """[(kunci bulan, path)] urut waktu yang beririsan dengan [start, end]"""
+        if not self.enabled or not os.path.isdir(self.dir):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.dir)):
+            if not (name.startswith(PARTITION_PREFIX) and name.endswith(PARTITION_SUFFIX)):
+                continue
+            key = name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)]
+            if not _KEY_RE.match(key):
+                continue
+            if start is not None and month_end(key) <= start:
+                continue
+            if end is not None and month_start(key) > end:
+                continue
+            found.append((key, os.path.join(self.dir, name)))
+        return found
+
+    def write_target(self, ts):
+        """(kunci, path) partisi untuk baris ber-timestamp `ts`, None = database utama"""
+        if not self.enabled:
+            return None
+        key = month_key(ts)
+        path = self.path(key)
+        return (key, path) if os.path.exists(path) else None
+
+    def windows(self, start=None, end=None):
+        """
+        [(awal, akhir, partisi)] berurutan. Rentang dengan partisi lebih dari
+        MAX_ATTACHED dipecah di awal bulan; tiap jendela hanya memuat baris
+        main dalam [awal, akhir) sehingga hasil antar jendela tidak tumpang
+        tindih. None = tanpa batas. Umumnya cukup satu jendela.
+        """
+        parts = self.partitions(start, end)
+        if len(parts) <= MAX_ATTACHED:
+            return [(None, None, parts)]
+        groups = [parts[i:i + MAX_ATTACHED] for i in range(0, len(parts), MAX_ATTACHED)]
+        result = []
+        for i, group in enumerate(groups):
+            lo = month_start(group[0][0]) if i else None
+            hi = month_start(groups[i + 1][0][0]) if i + 1 < len(groups) else None
+            result.append((lo, hi, group))
+        return result
+
+    def view_sql(self, columns, lo, hi, attached):
+        """
+        CREATE TEMP VIEW sensor_datas: baris main dalam [lo, hi) + partisi
+        yang sudah di-ATTACH, attached = [(nama schema, kolom yang ada)]
+        """
+        where = []
+        if lo is not None:
+            where.append(f"timestamp >= {int(lo)}")
+        if hi is not None:
+            where.append(f"timestamp < {int(hi)}")
+        selects = [f"SELECT {', '.join(columns)} FROM main.{TABLE}"
+                   + (f" WHERE {' AND '.join(where)}" if where else "")]
+        for name, existing in attached:
+            if not existing:
+                # File terhapus retensi di antara listdir dan ATTACH
+                continue
+            # Partisi lama bisa belum punya kolom hasil migrasi terbaru
+            cols = [c if c in existing else f"NULL AS {c}" for c in columns]
+            selects.append(f"SELECT {', '.join(cols)} FROM {name}.{TABLE}")
+        return f"CREATE TEMP VIEW {TABLE} AS " + " UNION ALL ".join(selects)
+
+    def attach(self, conn, lo, hi, parts):
+        """ATTACH partisi lalu buat TEMP VIEW sensor_datas; kembalikan nama schema"""
+        if not parts and lo is None and hi is None:
+            return []
+        columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({TABLE})")]
+        names = []
+        attached = []
+        try:
+            for key, path in parts:
+                name = schema_name(key)
+                try:
+                    conn.execute("ATTACH DATABASE ? AS " + name, (readonly_uri(path) if self.readonly else path,))
+                except sqlite3.OperationalError:
+                    if not self.readonly:
+                        raise
+                    # mode=ro tidak membuat file: partisi terhapus retensi di antara listdir dan ATTACH
+                    continue
+                names.append(name)
+                attached.append((name, {row[1] for row in conn.execute(f"PRAGMA {name}.table_info({TABLE})")}))
+            temp_ddl(conn, f"DROP VIEW IF EXISTS temp.{TABLE}", self.view_sql(columns, lo, hi, attached))
+        except Exception:
+            self.detach(conn, names)
+            raise
+        return names
+
+    def detach(self, conn, names):
+        temp_ddl(conn, f"DROP VIEW IF EXISTS temp.{TABLE}")
+        for name in names:
+            conn.execute(f"DETACH DATABASE {name}")
+
+    @contextmanager
+    def routed(self, conn, lo=None, hi=None, parts=()):
+        """Pasang satu jendela pada koneksi yang sudah ada (mis. koneksi pool)"""
+        names = self.attach(conn, lo, hi, parts)
+        try:
+            yield conn
+        finally:
+            if names or lo is not None or hi is not None or parts:
+                self.detach(conn, names)
+
+    def connections(self, start=None, end=None, connect=None):
+        """Yield satu koneksi siap pakai per jendela; ditutup setelah dipakai"""
+        for lo, hi, parts in self.windows(start, end):
+            conn = connect() if connect else connect_db(self.db_file, readonly=self.readonly)
+            try:
+                self.attach(conn, lo, hi, parts)
+                yield conn
+            finally:
+                conn.close()
+
+
+# === Memindahkan bulan tertutup ke partisi ===
+def prepare_partition(conn, path):
+    """
+    Buat/perbarui skema partisi mengikuti main.sensor_datas (kolom + index).
+    Dipanggil sebelum menulis ke partisi, jadi partisi lama ikut migrasi.
+    """
+    # Sengaja tanpa profil WAL: partisi tetap rollback journal (satu file),
+    # sehingga backup per-file berdasarkan ukuran/mtime tetap akurat
+    part = sqlite3.connect(path)
+    try:
+        existing = {row[1] for row in part.execute(f"PRAGMA table_info({TABLE})")}
+        if not existing:
+            sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                               (TABLE,)).fetchone()[0]
+            part.execute(sql)
+        else:
+            for _, col, col_type, *_ in conn.execute(f"PRAGMA main.table_info({TABLE})"):
+                if col not in existing:
+                    part.execute(f"ALTER TABLE {TABLE} ADD COLUMN {col} {col_type}")
+                    if col == "change_seq":
+                        # Sama dengan migrasi v8: baris lama memakai id sebagai nomor urut
+                        part.execute(f"UPDATE {TABLE} SET change_seq = id")
+
+        indexes = dict(conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'index' "
+                                    "AND tbl_name = ? AND sql IS NOT NULL", (TABLE,)).fetchall())
+        current = {row[0] for row in part.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                                  "AND tbl_name = ? AND sql IS NOT NULL", (TABLE,))}
+        for name in current - set(indexes):
+            part.execute(f"DROP INDEX IF EXISTS {name}")
+        if "idx_sensor_device_timestamp_unique" in set(indexes) - current:
+            # Partisi dari sebelum migrasi v7 bisa berisi duplikat (device, timestamp)
+            part.execute(f"""
+            DELETE FROM {TABLE} WHERE device IS NOT NULL AND id NOT IN (
+                SELECT MAX(id) FROM {TABLE} WHERE device IS NOT NULL GROUP BY device, timestamp
+            )
+            """)
+        # sqlite_master menyimpan CREATE INDEX tanpa IF NOT EXISTS
+        for name, sql in indexes.items():
+            if name not in current:
+                part.execute(re.sub(r"^CREATE (UNIQUE )?INDEX ", r"CREATE \1INDEX IF NOT EXISTS ", sql))
+        part.commit()
+    finally:
+        part.close()
+
+
+def move_month(conn, router, key):
+    """
+    Pindahkan baris bulan `key` dari main ke file partisinya per batch.
+    Main memakai WAL sehingga commit lintas file tidak atomik: jika proses
+    mati di tengah batch, baris bisa sementara ada di keduanya. Putaran
+    berikutnya aman (INSERT OR IGNORE berdasarkan id, lalu DELETE).
+    """
+    start, end = month_start(key), month_end(key)
+    path = router.path(key)
+    prepare_partition(conn, path)
+    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({TABLE})"))
+    batch_rows = router.settings["batch_rows"]
+    moved = 0
+    conn.execute("ATTACH DATABASE ? AS part", (path,))
+    try:
+        while True:
+            ids = [row[0] for row in conn.execute(
+                f"SELECT id FROM main.{TABLE} WHERE timestamp >= ? AND timestamp < ? LIMIT ?",
+                (start, end, batch_rows))]
+            if not ids:
+                break
+            marks = ", ".join("?" for _ in ids)
+            with conn:
+                conn.execute(f"INSERT OR IGNORE INTO part.{TABLE} ({columns}) "
+                             f"SELECT {columns} FROM main.{TABLE} WHERE id IN ({marks})", ids)
+                conn.execute(f"DELETE FROM main.{TABLE} WHERE id IN ({marks})", ids)
+            moved += len(ids)
+            time.sleep(router.settings["batch_sleep"])
+    finally:
+        conn.execute("DETACH DATABASE part")
+    logging.info(f"📦 {moved} baris bulan {key} dipindahkan ke {os.path.basename(path)}")
+    return moved
+
+
+def rotate_partitions(db_file, settings=None, now=None):
+    """
+    Pindahkan semua bulan di luar hot_months dari database utama ke partisi
+    (termasuk data terlambat untuk bulan yang sudah dipindah).
+    Kembalikan {kunci bulan: jumlah baris}.
+    """
+    router = PartitionRouter(db_file, settings)
+    if not router.enabled:
+        return {}
+    hot_key = add_months(month_key(now if now is not None else time.time()),
+                         -(max(1, int(router.settings["hot_months"])) - 1))
+    hot_start = month_start(hot_key)
+    os.makedirs(router.dir, exist_ok=True)
+
+    moved = {}
+    conn = connect_db(db_file)
+    try:
+        # Partisi lama ikut skema terbaru (kolom, index) walau tidak ditulisi lagi
+        for _, path in router.partitions():
+            prepare_partition(conn, path)
+        while True:
+            oldest = conn.execute(f"SELECT MIN(timestamp) FROM main.{TABLE} WHERE timestamp < ?",
+                                  (hot_start,)).fetchone()[0]
+            if oldest is None:
+                break
+            key = month_key(oldest)
+            moved[key] = moved.get(key, 0) + move_month(conn, router, key)
+    finally:
+        conn.close()
+    return moved
+
+
+def drop_partitions(router, cutoff):
+    """Hapus file partisi yang seluruh bulannya sebelum cutoff; kembalikan kunci bulan"""
+    dropped = []
+    for key, path in router.partitions(end=cutoff):
+        if month_end(key) > cutoff:
+            continue
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        dropped.append(key)
+        logging.info(f"🗑️ Partisi {key} dihapus (retensi)")
+    return dropped
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# === Cache Response HTTP (web & API) ===
+# Body response endpoint baca disimpan di LRU per proses, dengan kunci
+# path + query + versi ingest. Selama tidak ada data baru, request ulang
+# dilayani dari memori; jika ETag cocok dengan If-None-Match cukup 304.
+CACHE_DEFAULTS = {
+    "max_entries": 256,
+    "max_bytes": 16 * 1024 * 1024,   # total body di memori
+    "max_body": 1024 * 1024,          # body lebih besar tidak disimpan
+    "ttl": 60                         # detik; rentang relatif ("1 jam terakhir") ikut bergeser
+}
+
+# Header response yang ikut disimpan (metadata payload, cursor halaman)
+KEPT_HEADER_PREFIX = "x-"
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Cocokkan header If-None-Match (boleh berisi beberapa ETag / weak / *)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or (tag.startswith("W/") and tag[2:] == etag):
+            return True
+    return False
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "media_type", "headers", "created")
+
+    def __init__(self, body, media_type, headers):
+        self.body = body
+        self.etag = make_etag(body)
+        self.media_type = media_type
+        self.headers = headers
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """LRU body response; aman dipakai banyak thread"""
+
+    def __init__(self, max_entries=CACHE_DEFAULTS["max_entries"], max_bytes=CACHE_DEFAULTS["max_bytes"],
+                 max_body=CACHE_DEFAULTS["max_body"], ttl=CACHE_DEFAULTS["ttl"]):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_body = max_body
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, media_type, headers=None):
+        """Simpan body (bytes); kembalikan entry (dengan ETag) walau tidak disimpan"""
+        headers = {k: v for k, v in (headers or {}).items() if k.lower().startswith(KEPT_HEADER_PREFIX)}
+        entry = CachedResponse(body, media_type, headers)
+        if len(body) > self.max_body:
+            return entry
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                self._drop(next(iter(self.entries)))
+        return entry
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.size -= len(entry.body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class IngestVersion:
+    """
+    Penanda "ada data baru": nomor versi cache data terakhir (latest_cache)
+    ditambah mtime/ukuran file database & WAL, supaya penulisan yang tidak
+    lewat ingest writer (import, purge, restore) juga membatalkan cache.
+    """
+
+    def __init__(self, db_file, latest_reader=None):
+        self.paths = [str(db_file), f"{db_file}-wal"]
+        self.latest_reader = latest_reader
+
+    def current(self):
+        parts = [self.latest_reader.version() if self.latest_reader else None]
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                parts += [st.st_mtime_ns, st.st_size]
+            except OSError:
+                parts += [None, None]
+        return tuple(parts)
+
+
+def cache_key(path, query_items, version, extra=None):
+    """Kunci cache; urutan parameter query tidak berpengaruh"""
+    return (path, tuple(sorted(query_items)), version, extra)
@@ -0,0 +1,178 @@
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+
+from backup import BACKUP_DIR, BASE_FILE, CHAIN_PREFIX, PARTITION_BACKUP_DIR, SEGMENT_TABLE, verify_backup
+from migrations import run_migrations
+from rollup import rebuild_rollups
+from partitions import PartitionRouter, rotate_partitions
+
+# === Restore dari Backup Inkremental ===
+# Bangun ulang database dari base.sqlite.gz + semua segmen dalam satu rantai:
+#   python restore.py /opt/aws/database/aws_db_restore.sqlite
+#   python restore.py --chain chain_2025-01-05_000012 --until 7 hasil.sqlite
+# Hentikan service sensor sebelum menimpa database yang sedang dipakai.
+# Jika partisi bulanan aktif, partisi yang belum ada di folder partisi juga
+# diekstrak dari backup/partitions/.
+
+INSERT_BATCH = 5000
+
+
+def latest_chain(backup_dir):
+    chains = sorted(d for d in os.listdir(backup_dir)
+                    if d.startswith(CHAIN_PREFIX) and os.path.exists(os.path.join(backup_dir, d, BASE_FILE)))
+    return chains[-1] if chains else None
+
+
+def chain_segments(chain_dir, until=None):
+    """Segmen berurutan; `until` = nomor segmen terakhir yang dipakai"""
+    segments = sorted(glob.glob(os.path.join(chain_dir, "seg_*.jsonl.gz")))
+    if until is not None:
+        segments = [p for p in segments if int(os.path.basename(p).split("_")[1]) <= until]
+    return segments
+
+
+def apply_segment(conn, path):
+    """
+    Masukkan baris segmen (id dipertahankan); baris yang sudah ada ditimpa
+    karena segmen berikutnya bisa membawa koreksi. Tombstone {"deleted": [...]}
+    dihapus setelah semua baris. Kembalikan (jumlah, timestamp terkecil,
+    change_seq terakhir).
+    """
+    count = 0
+    min_ts = None
+    deleted = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        meta = json.loads(f.readline())
+        table = meta.get("table", SEGMENT_TABLE)
+        columns = meta["columns"]
+        ts_index = columns.index("timestamp")
+        sql = (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)})")
+        batch = []
+        for line in f:
+            row = json.loads(line)
+            if isinstance(row, dict):
+                deleted.extend(row["deleted"])
+                continue
+            batch.append(row)
+            ts = row[ts_index]
+            if ts is not None and (min_ts is None or ts < min_ts):
+                min_ts = ts
+            if len(batch) >= INSERT_BATCH:
+                count += conn.executemany(sql, batch).rowcount
+                batch = []
+        if batch:
+            count += conn.executemany(sql, batch).rowcount
+    for i in range(0, len(deleted), INSERT_BATCH):
+        ids = deleted[i:i + INSERT_BATCH]
+        count += conn.execute(f"DELETE FROM {table} WHERE id IN ({', '.join('?' for _ in ids)})", ids).rowcount
+    return count, min_ts, meta.get("to_seq", 0)
+
+
+def restore_partitions(target, backup_dir, force=False):
+    """Ekstrak backup partisi ke folder partisi database target; kembalikan jumlah file"""
+    router = PartitionRouter(target)
+    src_dir = os.path.join(backup_dir, os.path.relpath(PARTITION_BACKUP_DIR, BACKUP_DIR))
+    if not router.enabled or not os.path.isdir(src_dir):
+        return 0
+    os.makedirs(router.dir, exist_ok=True)
+    count = 0
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith(".sqlite.gz"):
+            continue
+        dest = os.path.join(router.dir, name[:-len(".gz")])
+        if os.path.exists(dest) and not force:
+            continue
+        with gzip.open(os.path.join(src_dir, name), "rb") as src, open(dest + ".restore", "wb") as out:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+        os.replace(dest + ".restore", dest)
+        count += 1
+        logging.info(f"🔁 Partisi {name} diekstrak ke {dest}")
+    return count
+
+
+def restore(target, chain=None, until=None, backup_dir=BACKUP_DIR, force=False):
+    chain = chain or latest_chain(backup_dir)
+    if not chain:
+        raise FileNotFoundError(f"Tidak ada rantai backup di {backup_dir}")
+    chain_dir = os.path.join(backup_dir, chain)
+    if os.path.exists(target) and not force:
+        raise FileExistsError(f"{target} sudah ada (gunakan --force untuk menimpa)")
+
+    tmp_path = target + ".restore"
+    with gzip.open(os.path.join(chain_dir, BASE_FILE), "rb") as src, open(tmp_path, "wb") as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+    logging.info(f"🔁 Base {chain} diekstrak ke {tmp_path}")
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # Base lama mungkin belum punya kolom/tabel terbaru
+        run_migrations(conn)
+
+        total = 0
+        since = None
+        last_seq = 0
+        segments = chain_segments(chain_dir, until)
+        for path in segments:
+            count, min_ts, last_seq = apply_segment(conn, path)
+            total += count
+            if min_ts is not None and (since is None or min_ts < since):
+                since = min_ts
+            logging.info(f"🔁 {os.path.basename(path)}: {count} baris")
+        # Penghitung di base tertinggal dari change_seq segmen; jangan sampai dipakai ulang
+        conn.execute(f"""
+        UPDATE change_counter
+        SET seq = MAX(seq, ?, IFNULL((SELECT MAX(change_seq) FROM {SEGMENT_TABLE}), 0))
+        WHERE id = 1
+        """, (last_seq,))
+
+        # Rollup base sudah benar; hitung ulang hanya mulai data segmen
+        if since is not None:
+            rebuild_rollups(conn, since=since, commit=False)
+        conn.commit()
+    finally:
+        conn.close()
+
+    if not verify_backup(tmp_path):
+        os.remove(tmp_path)
+        raise RuntimeError("quick_check hasil restore gagal")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(tmp_path, target)
+
+    # Baris yang dipindah ke partisi setelah base sudah dihapus tombstone dan
+    # kembali lewat backup partisi; sisa bulan lama (mis. segmen berhenti di
+    # --until) dirotasi ulang (duplikat id diabaikan). No-op jika nonaktif.
+    restore_partitions(target, backup_dir, force)
+    rotate_partitions(target)
+    logging.info(f"✅ Restore selesai: {target} ({len(segments)} segmen, {total} baris)")
+    return len(segments), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore database AWS dari base + segmen backup")
+    parser.add_argument("target", help="File database hasil restore")
+    parser.add_argument("--chain", help="Nama folder rantai (default: terbaru)")
+    parser.add_argument("--until", type=int, help="Nomor segmen terakhir yang diterapkan")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    parser.add_argument("--force", action="store_true", help="Timpa target jika sudah ada")
+    args = parser.parse_args()
+
+    try:
+        segments, rows = restore(args.target, args.chain, args.until, args.backup_dir, args.force)
+    except Exception as e:
+        logging.error(f"❌ Restore gagal: {e}")
+        sys.exit(f"❌ Restore gagal: {e}")
+    print(f"✅ Restore selesai: {args.target} ({segments} segmen, {rows} baris)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from datetime import datetime
+
+from rollup import ROLLUP_LEVELS, bucket_start, rebuild_rollups
+from partitions import PartitionRouter, drop_partitions, month_start
+from connections import connect
+
+# === Retensi Data ===
+# Data mentah lebih tua dari raw_days dihapus bertahap: per batch kecil dalam
+# transaksi pendek lewat index timestamp, dengan jeda antar batch, sehingga
+# service lain tidak pernah menunggu lama. Sebelum dihapus, rollup untuk hari
+# tersebut dihitung ulang dari data mentah (downsample) agar grafik rentang
+# panjang tetap tersedia. Halaman kosong dikembalikan ke OS dengan
+# incremental_vacuum bertahap (butuh auto_vacuum=INCREMENTAL; database lama
+# tanpa itu tetap memakai ulang halaman kosong untuk data baru, tetapi file
+# tidak mengecil — lihat "Konversi auto_vacuum" di bawah).
+# Dengan partisi bulanan (partitions.py), bulan yang seluruhnya lewat batas
+# cukup dihapus filenya setelah rollup-nya dihitung ulang.
+RETENTION = {
+    "raw_days": 396,          # ±13 bulan data mentah
+    "rollup_1h_days": None,   # None = rollup disimpan selamanya
+    "rollup_1d_days": None,
+    "downsample": True,       # hitung ulang rollup sebelum data mentah dihapus
+    "batch_rows": 2000,       # baris per transaksi DELETE
+    "batch_sleep": 0.05,      # detik jeda antar batch
+    "vacuum_pages": 256,      # halaman per PRAGMA incremental_vacuum(N)
+    "vacuum_sleep": 0.05,
+    "busy_timeout": 5000,     # ms
+    "convert_auto_vacuum": False  # opt-in: ubah database lama ke auto_vacuum=INCREMENTAL
+}
+
+DAY = 86400
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+
+def retention_settings(overrides=None):
+    """RETENTION + config.json -> "retention" + overrides"""
+    cfg = dict(RETENTION)
+    try:
+        with open(CONFIG_PATH) as f:
+            cfg.update(json.load(f).get("retention", {}))
+    except (OSError, ValueError):
+        pass
+    cfg.update(overrides or {})
+    return cfg
+
+
+def day_cutoff(days, now=None):
+    """Batas purge dibulatkan ke awal hari lokal, agar bucket rollup tidak terpotong"""
+    now = int(now if now is not None else time.time())
+    return bucket_start(now - days * DAY, DAY)
+
+
+def downsample_days(conn, start, cutoff, sleep=0.0):
+    """Hitung ulang rollup per hari untuk [start, cutoff); satu transaksi per hari"""
+    day = bucket_start(start, DAY)
+    days = 0
+    while day < cutoff:
+        rebuild_rollups(conn, since=day, until=day + DAY)
+        days += 1
+        day += DAY
+        if sleep:
+            time.sleep(sleep)
+    return days
+
+
+def delete_in_batches(conn, table, column, cutoff, batch_rows, sleep, key="rowid"):
+    """DELETE ... WHERE column < cutoff dalam batch kecil; kembalikan jumlah baris"""
+    total = 0
+    while True:
+        cur = conn.execute(f"""
+        DELETE FROM {table} WHERE ({key}) IN (
+            SELECT {key} FROM {table} WHERE {column} < ? ORDER BY {column} LIMIT ?
+        )
+        """, (cutoff, batch_rows))
+        conn.commit()
+        total += cur.rowcount
+        if cur.rowcount < batch_rows:
+            return total
+        time.sleep(sleep)
+
+
+def auto_vacuum_mode(conn):
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    return AUTO_VACUUM_MODES.get(mode, str(mode))
+
+
+def incremental_vacuum(conn, pages, sleep):
+    """Kembalikan halaman kosong ke OS sedikit demi sedikit"""
+    mode = auto_vacuum_mode(conn)
+    if mode != "INCREMENTAL":
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        logging.warning(f"⚠️ auto_vacuum={mode}: {free} halaman kosong tidak bisa dikembalikan ke OS. "
+                        f"Konversi sekali dengan `python retention.py --enable-incremental-vacuum` "
+                        f"atau config.json -> \"retention\": {{\"convert_auto_vacuum\": true}}.")
+        return 0
+    freed = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return freed
+        # executescript menjalankan pragma sampai selesai (execute hanya satu langkah = 1 halaman)
+        conn.executescript(f"PRAGMA incremental_vacuum({min(pages, free)});")
+        freed += min(pages, free)
+        time.sleep(sleep)
+
+
+# === Konversi auto_vacuum (sekali, opt-in) ===
+# auto_vacuum hanya bisa diubah lewat VACUUM penuh: seluruh file ditulis
+# ulang, writer lain menunggu sampai selesai (sensor tetap aman karena
+# insert tertahan di journal IngestWriter), dan butuh ruang kosong sekitar
+# 2× ukuran database (salinan sementara + WAL). Jalankan di jendela
+# maintenance malam hari; setelah itu retensi mingguan cukup memakai
+# incremental_vacuum bertahap.
+def enable_incremental_vacuum(conn, db_file):
+    """Ubah auto_vacuum ke INCREMENTAL dengan VACUUM; kembalikan durasi (detik) atau None jika sudah"""
+    if auto_vacuum_mode(conn) == "INCREMENTAL":
+        return None
+    size = os.path.getsize(db_file)
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(db_file))).free
+    if free < 2 * size:
+        raise RuntimeError(f"Ruang disk tidak cukup untuk VACUUM: butuh ±{2 * size // 2**20} MB, "
+                           f"tersedia {free // 2**20} MB")
+
+    logging.info(f"🧱 Konversi auto_vacuum → INCREMENTAL ({size // 2**20} MB), VACUUM penuh...")
+    start = time.monotonic()
+    # Salinan sementara VACUUM ke file, bukan RAM (profil memakai temp_store=MEMORY)
+    conn.execute("PRAGMA temp_store = FILE")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    # WAL berisi seluruh database setelah VACUUM; pindahkan dan potong
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    seconds = round(time.monotonic() - start, 1)
+    logging.info(f"✅ auto_vacuum={auto_vacuum_mode(conn)}, {os.path.getsize(db_file) // 2**20} MB, {seconds} detik.")
+    return seconds
+
+
+def run_retention(db_file, settings=None, now=None):
+    """Jalankan seluruh siklus retensi; kembalikan ringkasan (dict)"""
+    cfg = dict(RETENTION)
+    cfg.update(settings or {})
+    summary = {"raw_deleted": 0, "rollup_deleted": 0, "days_downsampled": 0, "pages_freed": 0,
+               "partitions_dropped": 0, "vacuum_seconds": None}
+
+    conn = connect(db_file, profile={"busy_timeout": int(cfg["busy_timeout"])})
+    try:
+        start = time.monotonic()
+
+        cutoff = day_cutoff(cfg["raw_days"], now)
+        router = PartitionRouter(db_file)
+        oldest = conn.execute("SELECT MIN(timestamp) FROM sensor_datas").fetchone()[0]
+        expired = router.partitions(end=cutoff - 1)
+        if expired:
+            first = month_start(expired[0][0])
+            oldest = first if oldest is None else min(oldest, first)
+        if oldest is not None and oldest < cutoff:
+            if cfg["downsample"]:
+                # Rollup dihitung dari main + partisi yang beririsan, per jendela
+                for lo, hi, parts in router.windows(oldest, cutoff - 1):
+                    with router.routed(conn, lo, hi, parts):
+                        summary["days_downsampled"] += downsample_days(
+                            conn, oldest if lo is None else max(oldest, lo),
+                            cutoff if hi is None else min(cutoff, hi), cfg["batch_sleep"])
+            summary["raw_deleted"] = delete_in_batches(
+                conn, "sensor_datas", "timestamp", cutoff, cfg["batch_rows"], cfg["batch_sleep"], key="id")
+        summary["partitions_dropped"] = len(drop_partitions(router, cutoff))
+
+        for table, _ in ROLLUP_LEVELS:
+            days = cfg.get(f"{table.replace('sensor_', '')}_days")
+            if days:
+                # Tabel WITHOUT ROWID: hapus per batch lewat kunci (device, bucket)
+                summary["rollup_deleted"] += delete_in_batches(
+                    conn, table, "bucket", day_cutoff(days, now), cfg["batch_rows"], cfg["batch_sleep"],
+                    key="device, bucket")
+
+        if cfg["convert_auto_vacuum"]:
+            # Setelah purge: VACUUM sekaligus mengembalikan halaman yang baru kosong
+            summary["vacuum_seconds"] = enable_incremental_vacuum(conn, db_file)
+        summary["pages_freed"] = incremental_vacuum(conn, cfg["vacuum_pages"], cfg["vacuum_sleep"])
+        summary["auto_vacuum"] = auto_vacuum_mode(conn)
+        summary["cutoff"] = datetime.fromtimestamp(cutoff).strftime("%Y-%m-%d")
+        summary["seconds"] = round(time.monotonic() - start, 1)
+    finally:
+        conn.close()
+    return summary
+
+
+# === Entry Point ===
+# python retention.py [db] [--enable-incremental-vacuum]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Retensi data AWS / konversi auto_vacuum")
+    parser.add_argument("db", nargs="?", default="/opt/aws/database/aws_db.sqlite")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Konversi sekali ke auto_vacuum=INCREMENTAL (VACUUM penuh, jalankan saat maintenance)")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"❌ Database tidak ditemukan: {args.db}")
+
+    if args.enable_incremental_vacuum:
+        db = connect(args.db, profile={"busy_timeout": 120000})
+        try:
+            seconds = enable_incremental_vacuum(db, args.db)
+            print("auto_vacuum sudah INCREMENTAL" if seconds is None else f"Selesai dalam {seconds} detik")
+        finally:
+            db.close()
+    else:
+        print(json.dumps(run_retention(args.db, retention_settings()), indent=2))
@@ -0,0 +1,245 @@
+import logging
+import math
+import sqlite3
+import time
+
+# === Definisi Rollup ===
+# Data mentah di sensor_datas tercatat tiap 5 menit. Rollup meringkasnya
+# menjadi bucket 1 jam dan 1 hari (min/max/avg/count per parameter) supaya
+# grafik rentang panjang cukup membaca ratusan baris, bukan ribuan.
+RAW_INTERVAL = 300
+
+ROLLUP_LEVELS = [
+    # (nama tabel, lebar bucket dalam detik) — urut dari yang paling halus
+    ("sensor_rollup_1h", 3600),
+    ("sensor_rollup_1d", 86400),
+]
+
+ROLLUP_PARAMS = ["temp", "hum", "press", "wspeed", "wdir", "rain", "srad"]
+
+# Komponen vektor angin (u = timur, v = utara) ikut diringkas agar arah
+# angin rata-rata bisa dihitung dengan benar dari rollup.
+WIND_PARAMS = ["wind_u", "wind_v"]
+
+ALL_PARAMS = ROLLUP_PARAMS + WIND_PARAMS
+
+# Jumlah titik minimum agar grafik tetap informatif
+MIN_CHART_POINTS = 150
+
+
+def utc_offset():
+    """Offset zona waktu lokal (detik) agar bucket harian mulai pukul 00:00 lokal"""
+    return time.localtime().tm_gmtoff
+
+
+def bucket_start(ts, width):
+    """Awal bucket (epoch detik) untuk timestamp ts"""
+    return ts - (ts + utc_offset()) % width
+
+
+def wind_components(wspeed, wdir):
+    """Ubah kecepatan & arah angin menjadi komponen vektor (u, v)"""
+    if wspeed is None or wdir is None:
+        return None, None
+    rad = math.radians(wdir)
+    return wspeed * math.sin(rad), wspeed * math.cos(rad)
+
+
+def wind_direction(u, v):
+    """Arah angin (derajat 0–360) dari komponen vektor rata-rata"""
+    if u is None or v is None:
+        return None
+    return round((math.degrees(math.atan2(u, v)) + 360) % 360, 2)
+
+
+# === Skema ===
+def _column_defs():
+    cols = []
+    for p in ALL_PARAMS:
+        cols += [f"{p}_min REAL", f"{p}_max REAL", f"{p}_avg REAL", f"{p}_count INTEGER NOT NULL DEFAULT 0"]
+    return ",\n            ".join(cols)
+
+
+def create_rollup_tables(cur):
+    """Buat tabel rollup dan index jika belum ada"""
+    for table, _ in ROLLUP_LEVELS:
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            device TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            {_column_defs()},
+            PRIMARY KEY (device, bucket)
+        ) WITHOUT ROWID
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)")
+
+
+# === Upsert Inkremental ===
+def _merge_clause():
+    """
+    SET clause ON CONFLICT untuk menggabungkan statistik bucket lama dengan
+    yang baru. Semua ekspresi membaca nilai lama, jadi urutannya bebas.
+    """
+    parts = []
+    for p in ALL_PARAMS:
+        old_n, new_n = f"{p}_count", f"excluded.{p}_count"
+        parts += [
+            f"{p}_min = CASE WHEN {new_n} = 0 THEN {p}_min WHEN {old_n} = 0 THEN excluded.{p}_min "
+            f"ELSE min({p}_min, excluded.{p}_min) END",
+            f"{p}_max = CASE WHEN {new_n} = 0 THEN {p}_max WHEN {old_n} = 0 THEN excluded.{p}_max "
+            f"ELSE max({p}_max, excluded.{p}_max) END",
+            f"{p}_avg = CASE WHEN {new_n} = 0 THEN {p}_avg WHEN {old_n} = 0 THEN excluded.{p}_avg "
+            f"ELSE ({p}_avg * {old_n} + excluded.{p}_avg * {new_n}) * 1.0 / ({old_n} + {new_n}) END",
+            f"{old_n} = {old_n} + {new_n}",
+        ]
+    return ",\n            ".join(parts)
+
+
+def _stat_columns():
+    cols = []
+    for p in ALL_PARAMS:
+        cols += [f"{p}_min", f"{p}_max", f"{p}_avg", f"{p}_count"]
+    return cols
+
+
+def update_rollups(cur, device, ts, values):
+    """
+    Perbarui semua level rollup dengan satu baris data mentah.
+    `values` adalah dict {param: nilai}; dipanggil dalam transaksi yang sama
+    dengan INSERT ke sensor_datas.
+    """
+    values = dict(values)
+    values["wind_u"], values["wind_v"] = wind_components(values.get("wspeed"), values.get("wdir"))
+
+    stats = []
+    for p in ALL_PARAMS:
+        v = values.get(p)
+        stats += [v, v, v, 0 if v is None else 1]
+
+    cols = ["device", "bucket"] + _stat_columns()
+    placeholders = ", ".join("?" for _ in cols)
+    for table, width in ROLLUP_LEVELS:
+        cur.execute(f"""
+        INSERT INTO {table} ({", ".join(cols)})
+        VALUES ({placeholders})
+        ON CONFLICT(device, bucket) DO UPDATE SET
+            {_merge_clause()}
+        """, [device or "", bucket_start(ts, width)] + stats)
+
+
+# === Backfill ===
+def register_math(conn):
+    """SQLite bawaan Python belum tentu punya fungsi matematika"""
+    # Daftar ulang di tengah transaksi bisa gagal ("Error creating function")
+    # selagi statement yang memakainya masih aktif, jadi cukup sekali
+    try:
+        conn.execute("SELECT sin(radians(0)), cos(0)").fetchone()
+        return
+    except sqlite3.OperationalError:
+        pass
+    conn.create_function("sin", 1, lambda x: None if x is None else math.sin(x), deterministic=True)
+    conn.create_function("cos", 1, lambda x: None if x is None else math.cos(x), deterministic=True)
+    conn.create_function("radians", 1, lambda x: None if x is None else math.radians(x), deterministic=True)
+
+
+def rebuild_rollups(conn, since=None, commit=True, until=None):
+    """
+    Hitung ulang rollup dari data mentah untuk [since, until). Tanpa `since`
+    mulai dari data mentah tertua, sehingga rollup hasil downsample data yang
+    sudah dipurge (lihat retention.py) tidak ikut terhapus.
+    Dipakai saat tabel rollup baru dibuat, setelah import massal, atau per
+    hari sebelum purge. `commit=False` jika dipanggil di dalam transaksi
+    pemanggil (migrasi).
+    """
+    register_math(conn)
+    cur = conn.cursor()
+    create_rollup_tables(cur)
+    offset = utc_offset()
+
+    if since is None:
+        since = cur.execute("SELECT MIN(timestamp) FROM sensor_datas").fetchone()[0]
+        if since is None:
+            if commit:
+                conn.commit()
+            return
+
+    u_expr = "wspeed * sin(radians(wdir))"
+    v_expr = "wspeed * cos(radians(wdir))"
+
+    for table, width in ROLLUP_LEVELS:
+        start = bucket_start(since, width)
+        # `until` harus di batas bucket (mis. tengah malam) agar bucket tidak terpotong
+        end = until if until is not None else 2 ** 62
+        cur.execute(f"DELETE FROM {table} WHERE bucket >= ? AND bucket < ?", (start, end))
+
+        select_cols = []
+        for p in ALL_PARAMS:
+            expr = {"wind_u": u_expr, "wind_v": v_expr}.get(p, p)
+            select_cols += [f"MIN({expr})", f"MAX({expr})", f"AVG({expr})", f"COUNT({expr})"]
+
+        cur.execute(f"""
+        INSERT INTO {table} (device, bucket, {", ".join(_stat_columns())})
+        SELECT IFNULL(device, ''), timestamp - (timestamp + ?) % ? AS b, {", ".join(select_cols)}
+        FROM sensor_datas
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY IFNULL(device, ''), b
+        """, (offset, width, start, end))
+
+    if commit:
+        conn.commit()
+    logging.debug(f"✅ Rollup dibangun ulang {since}–{until or 'sekarang'}.")
+
+
+# === Query ===
+def choose_level(start_time, end_time):
+    """
+    Pilih tabel rollup paling kasar yang masih memberi >= MIN_CHART_POINTS
+    titik untuk rentang waktu ini. Kembalikan (tabel, lebar); tabel None
+    berarti pakai data mentah.
+    """
+    span = end_time - start_time
+    for table, width in reversed(ROLLUP_LEVELS):
+        if span // width >= MIN_CHART_POINTS:
+            return table, width
+    return None, RAW_INTERVAL
+
+
+def series_query(table, param):
+    """
+    SQL time series satu parameter dari tabel rollup. Bucket dari beberapa
+    device digabung supaya hasilnya setara dengan query data mentah.
+    Kolom: timestamp, <param>, min, max
+    Arah angin tidak bisa dirata-rata sebagai angka (350° & 10° -> 180°);
+    pakai wind_query + wind_direction.
+    """
+    if param not in ROLLUP_PARAMS:
+        raise ValueError(f"Parameter tidak dikenal: {param}")
+    if param == "wdir":
+        raise ValueError("wdir dari rollup dihitung lewat wind_query (komponen vektor)")
+    return f"""
+    SELECT bucket AS timestamp,
+           SUM({param}_avg * {param}_count) * 1.0 / SUM({param}_count) AS {param},
+           MIN({param}_min) AS min,
+           MAX({param}_max) AS max
+    FROM {table}
+    WHERE bucket >= ?
+    GROUP BY bucket
+    ORDER BY bucket ASC;
+    """
+
+
+def wind_query(table):
+    """
+    SQL time series angin dari tabel rollup.
+    Kolom: timestamp, wspeed, wind_u, wind_v
+    """
+    return f"""
+    SELECT bucket AS timestamp,
+           SUM(wspeed_avg * wspeed_count) * 1.0 / SUM(wspeed_count) AS wspeed,
+           SUM(wind_u_avg * wind_u_count) * 1.0 / SUM(wind_u_count) AS wind_u,
+           SUM(wind_v_avg * wind_v_count) * 1.0 / SUM(wind_v_count) AS wind_v
+    FROM {table}
+    WHERE bucket >= ?
+    GROUP BY bucket
+    ORDER BY bucket ASC;
+    """
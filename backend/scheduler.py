@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+import traceback
+
+from sensor import SensorDriver, SerialBus
+from database import insert_data
+from aggregator import PARAMETERS, IntervalAggregator
+
+# === Default per device (bisa di-override di config.json -> "devices") ===
+DEVICE_DEFAULTS = {
+    "slave_id": 0xFF,
+    "baudrate": 9600,
+    "interval": 1,      # detik antar sampling
+    "timeout": 0.5,     # detik menunggu respon per request
+    "retries": 2        # percobaan ulang jika respon gagal/CRC salah
+}
+
+# snapshot : satu pembacaan per storage_interval (selaras jam dinding), disimpan apa adanya
+# aggregate: sampling tiap `interval` detik, disimpan ringkasannya (opt-in)
+SAMPLING_MODES = ("snapshot", "aggregate")
+
+
+def load_devices(config):
+    """
+    Daftar device dari config. Tanpa kunci "devices", satu device dibentuk
+    dari konfigurasi lama (device/port/geo/location di level atas).
+    """
+    sampling = config.get("sampling", {})
+    base = dict(DEVICE_DEFAULTS)
+    base.update({
+        "mode": sampling.get("mode", "snapshot"),
+        "port": config.get("port", "/dev/ttyS0"),
+        "interval": sampling.get("sample_interval", DEVICE_DEFAULTS["interval"]),
+        "storage_interval": sampling.get("storage_interval", 300),
+        "rain_mode": sampling.get("rain_mode", "counter"),
+        "location": config.get("location", "unknown"),
+        "geo": config.get("geo", {})
+    })
+
+    specs = config.get("devices") or [{
+        "device": config.get("device", "unknown"),
+        "slave_id": config.get("slave_id", DEVICE_DEFAULTS["slave_id"]),
+        "baudrate": config.get("baudrate", DEVICE_DEFAULTS["baudrate"])
+    }]
+
+    devices = []
+    for spec in specs:
+        device = dict(base)
+        device.update(spec)
+        devices.append(device)
+    return devices
+
+
+class DevicePoller:
+    """Jadwal, driver, dan agregator untuk satu slave Modbus"""
+
+    def __init__(self, spec, bus):
+        self.spec = spec
+        self.name = spec["device"]
+        self.snapshot = spec["mode"] == "snapshot"
+        self.storage_interval = spec["storage_interval"]
+        self.interval = self.storage_interval if self.snapshot else spec["interval"]
+        self.retries = spec["retries"]
+        self.driver = SensorDriver(
+            port=spec["port"],
+            slave_id=spec["slave_id"],
+            timeout=spec["timeout"],
+            bus=bus
+        )
+        self.aggregator = IntervalAggregator(rain_mode=spec["rain_mode"])
+        self.failures = 0
+
+        now = time.time()
+        # Sampel & batas interval diselaraskan ke jam dinding
+        self.next_sample = (int(now // self.interval) + 1) * self.interval
+        self.window_end = (int(now // self.storage_interval) + 1) * self.storage_interval
+
+    def poll(self):
+        """
+        Baca sensor dengan retry. Mode aggregate: sampel valid masuk ke
+        agregator; mode snapshot: langsung disimpan dengan timestamp slot.
+        """
+        for attempt in range(1 + self.retries):
+            sensor_data = self.driver.read()
+            if sensor_data:
+                if self.snapshot:
+                    self.store_snapshot(sensor_data)
+                else:
+                    self.aggregator.add(sensor_data)
+                return True
+            logging.debug(f"🔁 [{self.name}] Percobaan {attempt + 1} gagal.")
+        self.failures += 1
+        if self.snapshot:
+            logging.warning(f"⚠️ [{self.name}] Pembacaan sensor gagal. Tidak menyimpan.")
+        return False
+
+    def store_snapshot(self, sensor_data):
+        logging.info(f"✅ [{self.name}] Data sensor terbaca: {sensor_data}")
+        insert_data(
+            timestamp=self.next_sample,
+            device=self.name,
+            location=self.spec["location"],
+            geo=self.spec["geo"],
+            **dict(zip(PARAMETERS, sensor_data))
+        )
+
+    def advance(self):
+        # Lewati slot yang terlewat jika pembacaan lambat
+        self.next_sample += self.interval
+        while self.next_sample <= time.time():
+            self.next_sample += self.interval
+
+    def maybe_store(self):
+        """Simpan ringkasan jika batas interval penyimpanan sudah lewat"""
+        if self.snapshot or time.time() < self.window_end:
+            return
+
+        # Sampel tepat di batas interval masuk ke interval yang ditutup: (t - N, t]
+        result = self.aggregator.flush()
+        if result:
+            values, stats = result
+            logging.info(f"✅ [{self.name}] Ringkasan interval ({stats['sample_count']} sampel, "
+                         f"{self.failures} gagal): {values}")
+            insert_data(
+                timestamp=self.window_end,
+                stats=stats,
+                device=self.name,
+                location=self.spec["location"],
+                geo=self.spec["geo"],
+                **values
+            )
+        else:
+            logging.warning(f"⚠️ [{self.name}] Tidak ada sampel valid dalam interval "
+                            f"({self.failures} gagal). Tidak menyimpan.")
+        self.failures = 0
+        while self.window_end <= time.time():
+            self.window_end += self.storage_interval
+
+
+class PortWorker(threading.Thread):
+    """
+    Satu thread per port serial. RS-485 bersifat half-duplex, jadi device
+    pada port yang sama dipoll bergantian sesuai jadwal masing-masing,
+    sementara port yang berbeda berjalan paralel.
+    """
+
+    def __init__(self, port, specs, stop_event):
+        super().__init__(name=f"poll-{port}", daemon=True)
+        first = specs[0]
+        self.bus = SerialBus(port, baudrate=first["baudrate"], timeout=first["timeout"])
+        self.pollers = [DevicePoller(spec, self.bus) for spec in specs]
+        self.stop_event = stop_event
+
+    def run(self):
+        names = ", ".join(p.name for p in self.pollers)
+        logging.info(f"▶️ Worker {self.bus.port} dimulai untuk device: {names}")
+        while not self.stop_event.is_set():
+            poller = min(self.pollers, key=lambda p: p.next_sample)
+            delay = poller.next_sample - time.time()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+
+            try:
+                poller.poll()
+            except Exception as e:
+                logging.error(f"❌ [{poller.name}] Error saat membaca sensor: {e}")
+                logging.error(traceback.format_exc())
+            poller.advance()
+
+            try:
+                poller.maybe_store()
+            except Exception as e:
+                logging.error(f"❌ [{poller.name}] Error saat menyimpan data: {e}")
+                logging.error(traceback.format_exc())
+        self.bus.close()
+
+
+def run(devices):
+    """Jalankan satu worker per port sampai dihentikan (Ctrl+C / SIGTERM)"""
+    by_port = {}
+    for spec in devices:
+        by_port.setdefault(spec["port"], []).append(spec)
+
+    stop_event = threading.Event()
+    workers = [PortWorker(port, specs, stop_event) for port, specs in by_port.items()]
+    for worker in workers:
+        worker.start()
+
+    print(f"⏱️ Polling {len(devices)} device pada {len(workers)} port...")
+    logging.info(f"⏱️ Scheduler dimulai: {len(devices)} device, {len(workers)} port.")
+    try:
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=1)
+    finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=5)
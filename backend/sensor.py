@@ -1,5 +1,4 @@
 import serial
-import time
 import logging
 import os
 import sys
@@ -33,60 +32,206 @@ except Exception as e:
     sys.exit(1)
 
 
-def read_sensor():
-    try:
-        port = config.get("port", "/dev/ttyS0")
-        logging.info(f"📡 Membuka port {port}...")
-
-        ser = serial.Serial(
-            port=port,
-            baudrate=9600,
+# === Modbus RTU ===
+READ_HOLDING_REGISTERS = 0x03
+
+
+def crc16_modbus(data):
+    """Hitung CRC-16/MODBUS (polinomial 0xA001, init 0xFFFF)"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def build_request(slave_id, start_register, register_count, function=READ_HOLDING_REGISTERS):
+    """Susun frame request Modbus RTU lengkap dengan CRC (little-endian)"""
+    frame = bytearray([slave_id, function])
+    frame += start_register.to_bytes(2, byteorder='big')
+    frame += register_count.to_bytes(2, byteorder='big')
+    crc = crc16_modbus(frame)
+    frame += bytearray([crc & 0xFF, crc >> 8])
+    return bytes(frame)
+
+
+def check_crc(frame):
+    """True jika 2 byte terakhir frame cocok dengan CRC isi frame"""
+    if len(frame) < 4:
+        return False
+    crc = crc16_modbus(frame[:-2])
+    return frame[-2] == (crc & 0xFF) and frame[-1] == (crc >> 8)
+
+
+def parse_response(response):
+    """Konversi register mentah menjadi nilai parameter"""
+    temp = round(int.from_bytes(response[3:5], byteorder='big') / 100 - 40, 2)
+    hum = round(int.from_bytes(response[5:7], byteorder='big') / 100, 2)
+    press = round(int.from_bytes(response[7:9], byteorder='big') / 10, 2)
+    wspeed = round(int.from_bytes(response[9:11], byteorder='big') / 100, 2)
+    wdir = round(int.from_bytes(response[11:13], byteorder='big') / 10, 2)
+    rain = round(int.from_bytes(response[13:15], byteorder='big') / 10, 2)
+    srad = int.from_bytes(response[15:17], byteorder='big')
+    return (temp, hum, press, wspeed, wdir, rain, srad)
+
+
+class SerialBus:
+    """
+    Satu port serial RS-485 yang tetap terbuka. Beberapa slave Modbus pada
+    bus yang sama memakai objek ini bersama (bergantian, bukan paralel).
+    """
+
+    def __init__(self, port, baudrate=9600, timeout=0.5, inter_byte_timeout=0.05):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.inter_byte_timeout = inter_byte_timeout
+        self.ser = None
+
+    def connect(self):
+        if self.ser and self.ser.is_open:
+            return self.ser
+        logging.info(f"📡 Membuka port {self.port}...")
+        self.ser = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
             bytesize=serial.EIGHTBITS,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
-            timeout=1
+            timeout=self.timeout,
+            inter_byte_timeout=self.inter_byte_timeout
         )
+        logging.debug("✅ Port serial dibuka.")
+        return self.ser
+
+    def close(self):
+        if self.ser:
+            try:
+                self.ser.close()
+            except Exception as e:
+                logging.warning(f"⚠️ Gagal menutup port {self.port}: {e}")
+        self.ser = None
+
+
+class SensorDriver:
+    """
+    Driver sensor dengan koneksi serial yang tetap terbuka.
+
+    Setiap poll mengirim request Modbus RTU, lalu membaca tepat sepanjang
+    frame respon yang diharapkan (tanpa sleep buta). Respon dengan CRC salah
+    ditolak, dan port dibuka ulang otomatis setelah error.
+    """
+
+    def __init__(self, port, slave_id=0xFF, start_register=0x0009, register_count=7,
+                 baudrate=9600, timeout=0.5, inter_byte_timeout=0.05, bus=None):
+        self.bus = bus or SerialBus(port, baudrate, timeout, inter_byte_timeout)
+        self.port = self.bus.port
+        self.slave_id = slave_id
+        self.start_register = start_register
+        self.register_count = register_count
+        self.timeout = timeout
+        self.request = build_request(slave_id, start_register, register_count)
+        # slave + function + byte count + data + CRC
+        self.response_length = 3 + 2 * register_count + 2
+
+    @property
+    def ser(self):
+        return self.bus.ser
+
+    def connect(self):
+        ser = self.bus.connect()
+        # Timeout bisa berbeda per slave pada bus yang sama
+        if ser.timeout != self.timeout:
+            ser.timeout = self.timeout
+        return ser
+
+    def close(self):
+        self.bus.close()
+
+    def _transact(self):
+        """Kirim request dan baca satu frame respon; None jika gagal"""
+        self.connect()
+        self.ser.reset_input_buffer()
+        self.ser.write(self.request)
+
+        header = self.ser.read(3)
+        if len(header) < 3:
+            logging.warning(f"❌ Response kosong atau terlalu pendek: {header}")
+            return None
 
-        if not ser.is_open:
-            ser.open()
-            logging.debug("✅ Port serial dibuka.")
+        if header[1] & 0x80:
+            # Exception response: slave, function|0x80, kode error, CRC
+            frame = header + self.ser.read(2)
+            logging.warning(f"❌ Modbus exception dari slave {header[0]}: kode {header[2]} ({frame.hex()})")
+            return None
 
-        # Kirim request data ke sensor
-        request = bytearray([0xFF, 0x03, 0x00, 0x09, 0x00, 0x07])
-        request += bytearray([0xC1, 0xD4])  # CRC (disesuaikan sesuai sensor)
+        response = header + self.ser.read(self.response_length - 3)
+        if len(response) < self.response_length:
+            logging.warning(f"❌ Response kosong atau terlalu pendek: {response}")
+            return None
 
-        ser.write(request)
-        time.sleep(1)
-        response = ser.read(256)
-        ser.close()
+        if not check_crc(response):
+            logging.warning(f"❌ CRC tidak cocok: {response.hex()}")
+            return None
 
-        if not response or len(response) < 17:
-            logging.warning(f"❌ Response kosong atau terlalu pendek: {response}")
+        if response[0] != self.slave_id or response[1] != READ_HOLDING_REGISTERS:
+            logging.warning(f"❌ Response dari slave/fungsi tak terduga: {response.hex()}")
             return None
 
-        logging.info(f"✅ Raw response: {response.hex()}")
+        return response
 
+    def read(self):
+        """Poll sensor sekali; kembalikan tuple nilai atau None"""
         try:
-            temp = round(int.from_bytes(response[3:5], byteorder='big') / 100 - 40, 2)
-            hum = round(int.from_bytes(response[5:7], byteorder='big') / 100, 2)
-            press = round(int.from_bytes(response[7:9], byteorder='big') / 10, 2)
-            wspeed = round(int.from_bytes(response[9:11], byteorder='big') / 100, 2)
-            wdir = round(int.from_bytes(response[11:13], byteorder='big') / 10, 2)
-            rain = round(int.from_bytes(response[13:15], byteorder='big') / 10, 2)
-            srad = int.from_bytes(response[15:17], byteorder='big')
+            response = self._transact()
+        except Exception as e:
+            logging.error(f"❌ Exception saat membaca sensor: {e}")
+            traceback.print_exc()
+            # Tutup supaya poll berikutnya membuka ulang port
+            self.close()
+            return None
 
-            logging.info(f"✅ Parsed: Temp={temp}, Hum={hum}, Press={press}, WSpeed={wspeed}, WDir={wdir}, Rain={rain}, Srad={srad}")
-            return (temp, hum, press, wspeed, wdir, rain, srad)
+        if response is None:
+            # Buang sisa byte di buffer supaya frame berikutnya sinkron
+            try:
+                self.ser.reset_input_buffer()
+            except Exception:
+                self.close()
+            return None
+
+        logging.debug(f"✅ Raw response: {response.hex()}")
 
+        try:
+            values = parse_response(response)
+            logging.debug("✅ Parsed: Temp=%s, Hum=%s, Press=%s, WSpeed=%s, WDir=%s, Rain=%s, Srad=%s", *values)
+            return values
         except Exception as parse_err:
             logging.error(f"❌ Gagal parsing data sensor: {parse_err}")
             traceback.print_exc()
             return None
 
-    except Exception as e:
-        logging.error(f"❌ Exception saat membaca sensor: {e}")
-        traceback.print_exc()
-        return None
+
+# Driver bersama untuk proses ini (port dibuka sekali)
+_driver = None
+
+
+def get_driver():
+    global _driver
+    if _driver is None:
+        _driver = SensorDriver(
+            port=config.get("port", "/dev/ttyS0"),
+            slave_id=config.get("slave_id", 0xFF),
+            baudrate=config.get("baudrate", 9600)
+        )
+    return _driver
+
+
+def read_sensor():
+    return get_driver().read()
 
 
 # === Untuk pengujian langsung ===
@@ -0,0 +1,95 @@
+import math
+import statistics
+
+import pytest
+
+from aggregator import PARAMETERS, STAT_COLUMNS, IntervalAggregator, RunningStats
+
+
+def test_running_stats_matches_population_stddev():
+    values = [20.1, 20.4, 19.8, 21.0, 20.0, 20.7]
+    stats = RunningStats()
+    for v in values + [None]:
+        stats.add(v)
+    mean, lo, hi, std = stats.result()
+    assert stats.n == len(values)
+    assert mean == pytest.approx(statistics.fmean(values))
+    assert (lo, hi) == (min(values), max(values))
+    assert std == pytest.approx(statistics.pstdev(values))
+
+
+def test_running_stats_large_offset_is_stable():
+    # Tekanan udara: nilai besar dengan variasi kecil (rumus sum-of-squares kehilangan presisi)
+    values = [1013.0 + 0.01 * (i % 5) for i in range(10000)]
+    stats = RunningStats()
+    for v in values:
+        stats.add(v)
+    assert stats.std == pytest.approx(statistics.pstdev(values), rel=1e-6)
+
+
+def test_running_stats_empty():
+    assert RunningStats().result() == (None, None, None, None)
+
+
+def test_wind_direction_wraps_north():
+    agg = IntervalAggregator()
+    for wdir in (350, 10, 355, 5):
+        agg.add({"wspeed": 2.0, "wdir": wdir})
+    direction, std = agg._wind_direction()
+    assert min(direction, 360 - direction) == pytest.approx(0, abs=1e-6)
+    assert 0 < std < 10
+
+
+def test_yamartino_constant_direction_is_zero():
+    agg = IntervalAggregator()
+    for _ in range(10):
+        agg.add({"wspeed": 3.0, "wdir": 90})
+    direction, std = agg._wind_direction()
+    assert direction == pytest.approx(90)
+    assert std == pytest.approx(0, abs=1e-6)
+
+
+def test_yamartino_matches_reference():
+    directions = [80, 90, 100, 110, 70]
+    agg = IntervalAggregator()
+    for wdir in directions:
+        agg.add({"wdir": wdir})
+    sa = sum(math.sin(math.radians(d)) for d in directions) / len(directions)
+    ca = sum(math.cos(math.radians(d)) for d in directions) / len(directions)
+    eps = math.sqrt(1 - (sa * sa + ca * ca))
+    expected = math.degrees(math.asin(eps) * (1 + (2 / math.sqrt(3) - 1) * eps ** 3))
+    direction, std = agg._wind_direction()
+    assert direction == pytest.approx(90)
+    assert std == pytest.approx(expected)
+    # Sebaran kecil: Yamartino mendekati stddev linear biasa
+    assert std == pytest.approx(statistics.pstdev(directions), rel=0.05)
+
+
+def test_rain_counter_delta_and_reset():
+    agg = IntervalAggregator(rain_mode="counter")
+    for rain in (10.0, 10.5, 11.0, 0.2, 0.4):
+        agg.add({"rain": rain})
+    values, stats = agg.summary()
+    # 0.5 + 0.5 + 0.2 (counter direset) + 0.2
+    assert stats["rain_sum"] == pytest.approx(1.4)
+    assert values["rain"] == 0.4
+
+
+def test_rain_sum_mode():
+    agg = IntervalAggregator(rain_mode="sum")
+    for rain in (0.2, 0.0, 0.4):
+        agg.add({"rain": rain})
+    assert agg.summary()[1]["rain_sum"] == pytest.approx(0.6)
+
+
+def test_summary_columns_and_flush():
+    agg = IntervalAggregator()
+    agg.add((25.0, 60.0, 1010.0, 2.0, 90.0, 5.0, 800))
+    agg.add(dict(zip(PARAMETERS, (27.0, 62.0, 1012.0, 4.0, 90.0, 5.5, 900))))
+    values, stats = agg.flush()
+    assert set(stats) == set(STAT_COLUMNS)
+    assert values["temp"] == 26.0 and stats["temp_min"] == 25.0 and stats["temp_max"] == 27.0
+    assert stats["temp_std"] == 1.0
+    assert stats["wind_vec_speed"] == 3.0 and stats["wind_vec_dir"] == 90.0
+    assert stats["sample_count"] == 2
+    assert agg.summary() is None
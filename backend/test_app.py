@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+import app as web
+from connections import ReadOnlyConnections
+from partitions import PartitionRouter
+from response_cache import CACHE_DEFAULTS, ResponseCache
+from rollup import rebuild_rollups
+
+
+@pytest.fixture
+def client(db_file, monkeypatch):
+    monkeypatch.setattr(web, "read_connections", ReadOnlyConnections(db_file, row_factory=sqlite3.Row))
+    monkeypatch.setattr(web, "partition_router", PartitionRouter(db_file, {"enabled": False}, readonly=True))
+    monkeypatch.setattr(web, "response_cache", ResponseCache(**CACHE_DEFAULTS))
+    return web.app.test_client()
+
+
+def fill(db_file, wdirs, hours=7 * 24 - 1):
+    """Satu baris per 5 menit selama `hours` jam penuh terakhir, arah angin bergiliran dari `wdirs`"""
+    # Mulai dari batas jam agar setiap bucket 1 jam berisi 12 sampel lengkap
+    end = int(time.time()) // 3600 * 3600
+    conn = sqlite3.connect(db_file)
+    conn.executemany(
+        "INSERT INTO sensor_datas (device, timestamp, temp, wspeed, wdir) VALUES ('A', ?, ?, 2.0, ?)",
+        [(end - (i + 1) * 300, 20.0 + i % 3, wdirs[i % len(wdirs)]) for i in range(hours * 12)])
+    conn.commit()
+    rebuild_rollups(conn)
+    conn.close()
+
+
+@pytest.mark.parametrize("range_time", ["7d", "30d"])
+def test_history_wdir_rollup_wraps_north(client, db_file, range_time):
+    fill(db_file, [350.0, 10.0])
+    body = client.get(f"/api/history?param=wdir&range={range_time}").get_json()
+    assert body["resolution"] == 3600
+    values = [v for v in body["values"] if v is not None]
+    assert values
+    # Rata-rata vektor 350° & 10° = utara, bukan 180°
+    assert all(min(v, 360 - v) < 1 for v in values)
+    assert "min" not in body and "max" not in body
+
+
+def test_history_scalar_rollup_keeps_min_max(client, db_file):
+    fill(db_file, [90.0])
+    body = client.get("/api/history?param=temp&range=7d").get_json()
+    assert body["resolution"] == 3600
+    assert len(body["min"]) == len(body["max"]) == len(body["values"])
+    assert min(v for v in body["min"] if v is not None) == 20.0
+    assert max(v for v in body["max"] if v is not None) == 22.0
+
+
+def test_windrose_rollup_matches_history(client, db_file):
+    fill(db_file, [350.0, 10.0])
+    history = client.get("/api/history?param=wdir&range=7d").get_json()
+    windrose = client.get("/api/windrose?range=7d").get_json()
+    assert windrose["wdir"] == history["values"]
+
+
+def export_range():
+    now = time.time()
+    return {"start": time.strftime("%Y-%m-%dT%H:%M", time.localtime(now - 86400)),
+            "end": time.strftime("%Y-%m-%dT%H:%M", time.localtime(now + 60))}
+
+
+def test_import_does_not_load_pyarrow():
+    code = "import sys, app; print(any(m.split('.')[0] in ('pyarrow', 'numpy') for m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(web.__file__),
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip().splitlines()[-1] == "False"
+
+
+def test_export_parquet(client, db_file, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    fill(db_file, [90.0], hours=2)
+    response = client.post("/api/export", json=dict(export_range(), format="parquet"))
+    assert response.status_code == 200
+    path = tmp_path / "export.parquet"
+    path.write_bytes(response.get_data())
+    response.close()
+    table = pq.read_table(path)
+    assert table.num_rows == 24
+    assert "change_seq" not in table.column_names
+
+
+def test_export_parquet_without_pyarrow(client, db_file, monkeypatch):
+    fill(db_file, [90.0], hours=2)
+    # None di sys.modules membuat import gagal dengan ImportError
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    response = client.post("/api/export", json=dict(export_range(), format="parquet"))
+    assert response.status_code == 400
+    assert "pyarrow" in response.get_json()["error"]
@@ -0,0 +1,128 @@
+import glob
+import os
+import sqlite3
+
+import pytest
+
+import backup
+import partitions
+from restore import restore
+
+DAY = 86400
+T0 = 1_750_000_000
+
+
+@pytest.fixture
+def source(db_file, tmp_path, monkeypatch):
+    # Tanpa partisi dari config.json perangkat; partisi diuji di test_partitions.py
+    monkeypatch.setattr(partitions, "CONFIG_PATH", str(tmp_path / "no_config.json"))
+    monkeypatch.setattr(backup, "BASE_DB", db_file)
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backup"))
+    os.makedirs(backup.BACKUP_DIR)
+    conn = sqlite3.connect(db_file)
+    insert(conn, range(100))
+    conn.close()
+    return db_file
+
+
+def insert(conn, minutes, device="A"):
+    conn.executemany("INSERT INTO sensor_datas (device, timestamp, created_at, temp, hum) VALUES (?, ?, ?, ?, ?)",
+                     [(device, T0 + m * 300, T0 + m * 300, 20 + m % 10, 70.0) for m in minutes])
+    conn.commit()
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT * FROM sensor_datas ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def chain_dir(state):
+    return os.path.join(backup.BACKUP_DIR, state["chain"]["dir"])
+
+
+def test_base_then_segments_round_trip(source, tmp_path):
+    state = {}
+    assert backup.backup_database(state)
+    assert state["chain"]["format"] == backup.CHAIN_FORMAT
+    assert state["chain"]["segments"] == 0
+
+    conn = sqlite3.connect(source)
+    insert(conn, range(100, 150))                                      # baris baru
+    conn.execute("UPDATE sensor_datas SET temp = -5 WHERE id = 10")    # koreksi di tempat
+    conn.execute("DELETE FROM sensor_datas WHERE id IN (20, 21)")      # retensi / rotasi
+    conn.commit()
+    assert backup.backup_database(state)
+    assert state["chain"]["segments"] == 1
+    after_first = rows(source)
+
+    insert(conn, range(1000, 1010), device="B")
+    conn.execute("DELETE FROM sensor_datas WHERE id = 105")
+    conn.commit()
+    assert backup.backup_database(state)
+    assert state["chain"]["segments"] == 2
+    assert state["chain"]["last_seq"] == conn.execute("SELECT seq FROM change_counter").fetchone()[0]
+    conn.close()
+
+    target = str(tmp_path / "restored.sqlite")
+    assert restore(target, backup_dir=backup.BACKUP_DIR) == (2, 50 + 1 + 2 + 10 + 1)
+    assert rows(target) == rows(source)
+
+    restored = sqlite3.connect(target)
+    # Penghitung tidak mundur: nomor yang sudah dipakai segmen tidak dipakai ulang
+    assert restored.execute("SELECT seq FROM change_counter").fetchone()[0] >= state["chain"]["last_seq"]
+    # Rollup data segmen dihitung ulang
+    day_b = restored.execute("SELECT SUM(temp_count) FROM sensor_rollup_1d WHERE device = 'B'").fetchone()[0]
+    assert day_b == 10
+    restored.close()
+
+    partial = str(tmp_path / "partial.sqlite")
+    restore(partial, until=1, backup_dir=backup.BACKUP_DIR)
+    assert rows(partial) == after_first
+
+
+def test_tombstones_pruned_after_next_segment(source):
+    state = {}
+    backup.backup_database(state)
+    conn = sqlite3.connect(source)
+    conn.execute("DELETE FROM sensor_datas WHERE id <= 5")
+    conn.commit()
+    backup.backup_database(state)
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas_deleted").fetchone()[0] == 5
+
+    # Segmen berikutnya (walau kosong) memangkas tombstone sampai watermark tersimpan
+    assert backup.backup_database(state)
+    assert state["chain"]["segments"] == 1
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas_deleted").fetchone()[0] == 0
+    conn.close()
+
+
+def test_no_changes_writes_no_segment(source):
+    state = {}
+    backup.backup_database(state)
+    assert backup.backup_database(state)
+    assert state["chain"]["segments"] == 0
+    assert glob.glob(os.path.join(chain_dir(state), "seg_*")) == []
+
+
+def test_old_chain_format_starts_new_base(source):
+    state = {}
+    backup.backup_database(state)
+    old = dict(state["chain"])
+    os.rename(chain_dir(state), os.path.join(backup.BACKUP_DIR, "chain_2000-01-01_000000"))
+    state["chain"] = {"dir": "chain_2000-01-01_000000", "base_date": old["base_date"],
+                      "base_id": 100, "last_id": 100, "segments": 0}
+    assert backup.backup_database(state)
+    assert state["chain"]["format"] == backup.CHAIN_FORMAT
+    assert state["chain"]["dir"] != "chain_2000-01-01_000000"
+    assert os.path.exists(os.path.join(chain_dir(state), backup.BASE_FILE))
+
+
+def test_restore_refuses_to_overwrite(source, tmp_path):
+    backup.backup_database({})
+    target = tmp_path / "exists.sqlite"
+    target.write_bytes(b"")
+    with pytest.raises(FileExistsError):
+        restore(str(target), backup_dir=backup.BACKUP_DIR)
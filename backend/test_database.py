@@ -0,0 +1,109 @@
+import json
+import sqlite3
+
+import pytest
+
+import database
+from database import BASE_COLUMNS, IngestWriter
+from latest_cache import LatestCacheWriter
+
+T0 = 1_750_003_200  # awal jam UTC
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    # Cache data terakhir & live update diarahkan ke folder sementara
+    cache = str(tmp_path / "latest.cache")
+    monkeypatch.setattr(database, "LatestCacheWriter", lambda: LatestCacheWriter(cache))
+    monkeypatch.setattr(database, "publish", lambda payload: None)
+    return str(tmp_path / "ingest_journal.jsonl")
+
+
+def reading(minute, temp, device="A"):
+    ts = T0 + minute * 60
+    values = [temp, 70.0, 1010.0, 2.0, 90.0, 0.0, 500.0, device, ts, ts, -6.5, 106.8, 250.0, "Bogor"]
+    return dict(zip(BASE_COLUMNS, values))
+
+
+def writer(db_file, journal_file, batch_size=100):
+    return IngestWriter(db_file, journal_file, batch_size=batch_size, flush_interval=3600, journal_fsync=False)
+
+
+def stored(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute("SELECT device, timestamp, temp FROM sensor_datas ORDER BY device, timestamp").fetchall()
+        rollups = {table: conn.execute(f"SELECT SUM(temp_count), SUM(temp_avg * temp_count) FROM {table}").fetchone()
+                   for table in ("sensor_rollup_1h", "sensor_rollup_1d")}
+        return rows, rollups
+    finally:
+        conn.close()
+
+
+def test_replay_stores_each_row_once(db_file, journal):
+    committed = [reading(m, 20.0 + m) for m in range(3)]
+    w = writer(db_file, journal)
+    for row in committed:
+        w.append(row)
+    assert w.flush() == 3
+    w.close()
+
+    # Mati listrik setelah commit tetapi sebelum journal dikosongkan, lalu dua
+    # baris baru sempat masuk journal dan baris terakhir terpotong
+    pending = [reading(5, 30.0), reading(5, 31.0, device="B")]
+    with open(journal, "w", encoding="utf-8") as f:
+        for row in committed + pending:
+            f.write(json.dumps(row) + "\n")
+        f.write(json.dumps(reading(10, 99.0))[:25])
+
+    w = writer(db_file, journal)
+    rows, rollups = stored(db_file)
+    assert rows == [("A", T0, 20.0), ("A", T0 + 60, 21.0), ("A", T0 + 120, 22.0), ("A", T0 + 300, 30.0),
+                    ("B", T0 + 300, 31.0)]
+    # Rollup hanya menghitung baris yang benar-benar baru disimpan
+    total = sum(temp for _, _, temp in rows)
+    for table, (count, weighted) in rollups.items():
+        assert count == 5, table
+        assert weighted == pytest.approx(total), table
+    with open(journal) as f:
+        assert f.read() == ""
+
+    # Replay kedua (journal kosong) tidak mengubah apa pun
+    w.close()
+    writer(db_file, journal).close()
+    assert stored(db_file) == (rows, rollups)
+
+
+def test_unflushed_rows_survive_crash(db_file, journal):
+    w = writer(db_file, journal)
+    w.append(reading(0, 20.0))
+    w.append(reading(1, 21.0))
+    # Proses mati: buffer hilang, hanya journal yang tersisa
+    w.closed = True
+    w.journal.close()
+    w.conn.close()
+    assert stored(db_file)[0] == []
+
+    writer(db_file, journal).close()
+    rows, rollups = stored(db_file)
+    assert rows == [("A", T0, 20.0), ("A", T0 + 60, 21.0)]
+    assert rollups["sensor_rollup_1h"][0] == rollups["sensor_rollup_1d"][0] == 2
+
+
+def test_close_flushes_buffer(db_file, journal):
+    w = writer(db_file, journal)
+    w.append(reading(0, 20.0))
+    assert stored(db_file)[0] == []
+    w.close()
+    assert stored(db_file)[0] == [("A", T0, 20.0)]
+    with open(journal) as f:
+        assert f.read() == ""
+
+
+def test_batch_size_triggers_flush(db_file, journal):
+    w = writer(db_file, journal, batch_size=2)
+    w.append(reading(0, 20.0))
+    w.append(reading(1, 21.0))
+    assert len(stored(db_file)[0]) == 2
+    assert w.buffer == []
+    w.close()
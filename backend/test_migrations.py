@@ -0,0 +1,127 @@
+import sqlite3
+
+import pytest
+
+from aggregator import STAT_COLUMNS
+from migrations import MIGRATIONS, SCHEMA_VERSION, current_version, next_change_seqs, run_migrations
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Database dari sebelum runner migrasi: created_at teks ISO dari dum_data.py lama, duplikat"""
+    path = str(tmp_path / "legacy.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE sensor_datas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        temp REAL, hum REAL, press REAL, wspeed REAL, wdir REAL, rain REAL, srad REAL,
+        device TEXT, timestamp INTEGER, created_at INTEGER,
+        latitude REAL, longitude REAL, altitude REAL, location TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX idx_timestamp ON sensor_datas (timestamp)")
+    rows = [
+        ("A", 1_700_000_000, 20.0, "2023-11-14 22:13:20", -6.5, 106.8),
+        ("A", 1_700_000_300, 21.0, "2023-11-14 22:18:20", -6.5, 106.8),
+        ("A", 1_700_000_300, 21.5, "2023-11-14 22:18:20", -6.5, 106.8),   # replay journal
+        ("B", 1_700_000_000, 15.0, 1_700_000_000, -7.0, 110.4),
+        ("B", 1_700_000_000, 15.5, 1_700_000_000, -7.0, 110.4),           # import ganda
+        (None, 1_700_000_000, 30.0, 1_700_000_000, None, None),
+        (None, 1_700_000_000, 31.0, 1_700_000_000, None, None),           # device NULL tidak dianggap duplikat
+    ]
+    conn.executemany("INSERT INTO sensor_datas (device, timestamp, temp, created_at, latitude, longitude) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def names(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def test_versions_are_sequential():
+    assert [m[0] for m in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
+    assert SCHEMA_VERSION == MIGRATIONS[-1][0]
+
+
+def test_new_database(db_file):
+    conn = sqlite3.connect(db_file)
+    assert current_version(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # INCREMENTAL
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sensor_datas)")}
+    assert set(STAT_COLUMNS) | {"change_seq"} <= columns
+    assert {"idx_sensor_timestamp", "idx_sensor_timestamp_cover", "idx_sensor_device_timestamp_unique",
+            "idx_sensor_change_seq"} <= names(conn, "index")
+    assert "idx_sensor_device_timestamp" not in names(conn, "index")
+    assert {"stations", "stations_rtree", "sensor_rollup_1h", "sensor_rollup_1d", "change_counter",
+            "sensor_datas_deleted"} <= names(conn, "table")
+    conn.close()
+
+
+def test_rerun_is_noop(db_file):
+    conn = sqlite3.connect(db_file)
+    applied = conn.execute("SELECT version, applied_at FROM schema_migrations ORDER BY version").fetchall()
+    assert run_migrations(conn) == SCHEMA_VERSION
+    assert conn.execute("SELECT version, applied_at FROM schema_migrations ORDER BY version").fetchall() == applied
+    conn.close()
+
+
+def test_legacy_upgrade(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    run_migrations(conn)
+    assert current_version(conn) == SCHEMA_VERSION
+    assert "idx_timestamp" not in names(conn, "index")
+
+    # v6: created_at teks -> epoch dari timestamp
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas WHERE typeof(created_at) = 'text'").fetchone()[0] == 0
+
+    # v7: duplikat (device, timestamp) dibuang, yang tersimpan terakhir dipertahankan
+    rows = conn.execute("SELECT id, device, timestamp, temp FROM sensor_datas ORDER BY id").fetchall()
+    assert rows == [
+        (1, "A", 1_700_000_000, 20.0),
+        (3, "A", 1_700_000_300, 21.5),
+        (5, "B", 1_700_000_000, 15.5),
+        (6, None, 1_700_000_000, 30.0),
+        (7, None, 1_700_000_000, 31.0),
+    ]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO sensor_datas (device, timestamp) VALUES ('A', 1700000000)")
+
+    # v5 + v7: rollup dihitung ulang tanpa duplikat
+    count = conn.execute("SELECT SUM(temp_count) FROM sensor_rollup_1h WHERE device = 'A'").fetchone()[0]
+    assert count == 2
+
+    # v4: registry stasiun dari lokasi terakhir
+    stations = conn.execute("SELECT device, latitude, longitude FROM stations ORDER BY device").fetchall()
+    assert stations == [("A", -6.5, 106.8), ("B", -7.0, 110.4)]
+    assert conn.execute("SELECT COUNT(*) FROM stations_rtree").fetchone()[0] == 2
+
+    # v8: baris lama memakai id, penghitung mulai dari id terbesar yang pernah dipakai
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas WHERE change_seq IS NOT id").fetchone()[0] == 0
+    assert conn.execute("SELECT seq FROM change_counter").fetchone()[0] == 7
+    conn.close()
+
+
+def test_change_seq_triggers(db_file):
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO sensor_datas (device, timestamp, temp) VALUES ('A', 100, 1.0)")
+    conn.execute("INSERT INTO sensor_datas (device, timestamp, temp) VALUES ('A', 200, 2.0)")
+    assert conn.execute("SELECT id, change_seq FROM sensor_datas ORDER BY id").fetchall() == [(1, 1), (2, 2)]
+
+    # Koreksi di tempat (id tetap) tetap mendapat nomor baru
+    conn.execute("UPDATE sensor_datas SET temp = 1.5 WHERE id = 1")
+    assert conn.execute("SELECT change_seq FROM sensor_datas WHERE id = 1").fetchone()[0] == 3
+
+    # Writer yang mengisi change_seq sendiri tidak ditimpa trigger
+    first = next_change_seqs(conn, 2)
+    assert first == 4
+    conn.execute("INSERT INTO sensor_datas (device, timestamp, change_seq) VALUES ('B', 100, ?)", (first,))
+    conn.execute("UPDATE sensor_datas SET temp = 9, change_seq = ? WHERE id = 2", (first + 1,))
+    assert conn.execute("SELECT id, change_seq FROM sensor_datas ORDER BY id").fetchall() == [(1, 3), (2, 5), (3, 4)]
+
+    # v9: penghapusan dicatat sebagai tombstone dengan nomor dari penghitung yang sama
+    conn.execute("DELETE FROM sensor_datas WHERE id = 2")
+    assert conn.execute("SELECT seq, id FROM sensor_datas_deleted").fetchall() == [(6, 2)]
+    assert conn.execute("SELECT seq FROM change_counter").fetchone()[0] == 6
+    conn.close()
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import partitions
+from partitions import (PartitionRouter, add_months, drop_partitions, month_end, month_key, month_start,
+                        rotate_partitions)
+
+MONTHS = ["2025-01", "2025-02", "2025-03", "2025-04", "2025-05"]
+ROWS_PER_MONTH = 20
+SETTINGS = {"enabled": True, "hot_months": 2, "batch_rows": 7, "batch_sleep": 0}
+NOW = datetime(2025, 5, 20).timestamp()
+
+
+@pytest.fixture
+def filled_db(db_file):
+    conn = sqlite3.connect(db_file)
+    for key in MONTHS:
+        start = month_start(key)
+        conn.executemany("INSERT INTO sensor_datas (device, timestamp, temp) VALUES ('A', ?, ?)",
+                         [(start + i * 3600, float(i)) for i in range(ROWS_PER_MONTH)])
+    conn.commit()
+    conn.close()
+    return db_file
+
+
+def count(path, where="1"):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM sensor_datas WHERE {where}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_month_helpers():
+    assert add_months("2025-11", 3) == "2026-02"
+    assert add_months("2025-01", -1) == "2024-12"
+    assert month_end("2024-12") == month_start("2025-01")
+    assert month_key(month_start("2025-03")) == "2025-03"
+    assert month_key(month_end("2025-03") - 1) == "2025-03"
+
+
+def test_disabled_router_is_noop(filled_db):
+    router = PartitionRouter(filled_db, {"enabled": False})
+    assert router.partitions() == []
+    assert router.write_target(month_start("2025-01")) is None
+    assert rotate_partitions(filled_db, {"enabled": False}) == {}
+
+
+def test_rotate_moves_closed_months(filled_db):
+    moved = rotate_partitions(filled_db, SETTINGS, now=NOW)
+    assert moved == {key: ROWS_PER_MONTH for key in MONTHS[:3]}
+
+    router = PartitionRouter(filled_db, SETTINGS)
+    assert [key for key, _ in router.partitions()] == MONTHS[:3]
+    for key, path in router.partitions():
+        assert count(path) == ROWS_PER_MONTH
+        # id & change_seq ikut pindah apa adanya
+        assert count(path, "change_seq = id") == ROWS_PER_MONTH
+    assert count(filled_db) == 2 * ROWS_PER_MONTH
+    assert count(filled_db, f"timestamp < {month_start('2025-04')}") == 0
+
+    # Pemindahan tercatat sebagai tombstone untuk segmen backup
+    conn = sqlite3.connect(filled_db)
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas_deleted").fetchone()[0] == 3 * ROWS_PER_MONTH
+    conn.close()
+
+    assert rotate_partitions(filled_db, SETTINGS, now=NOW) == {}
+
+
+def test_late_row_follows_partition(filled_db):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    router = PartitionRouter(filled_db, SETTINGS)
+    late = month_start("2025-02") + 30 * 60
+    assert router.write_target(late) == ("2025-02", router.path("2025-02"))
+    assert router.write_target(month_start("2025-05")) is None
+
+    conn = sqlite3.connect(filled_db)
+    conn.execute("INSERT INTO sensor_datas (device, timestamp, temp) VALUES ('A', ?, 99)", (late,))
+    conn.commit()
+    conn.close()
+    assert rotate_partitions(filled_db, SETTINGS, now=NOW) == {"2025-02": 1}
+    assert count(router.path("2025-02")) == ROWS_PER_MONTH + 1
+
+
+def test_partitions_filter_by_range(filled_db):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    router = PartitionRouter(filled_db, SETTINGS)
+    keys = [key for key, _ in router.partitions(month_start("2025-02") + 1, month_start("2025-03"))]
+    assert keys == ["2025-02", "2025-03"]
+    assert router.partitions(start=month_start("2025-04")) == []
+
+
+def test_routed_view_unions_main_and_partitions(filled_db):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    router = PartitionRouter(filled_db, SETTINGS)
+    conn = sqlite3.connect(filled_db)
+    with router.routed(conn, parts=router.partitions()):
+        assert conn.execute("SELECT COUNT(*) FROM sensor_datas").fetchone()[0] == len(MONTHS) * ROWS_PER_MONTH
+        per_month = conn.execute("SELECT COUNT(DISTINCT timestamp / 86400) FROM sensor_datas").fetchone()[0]
+        assert per_month == len(MONTHS)
+    # Setelah keluar, koneksi kembali ke main.sensor_datas saja
+    assert conn.execute("SELECT COUNT(*) FROM sensor_datas").fetchone()[0] == 2 * ROWS_PER_MONTH
+    assert {row[1] for row in conn.execute("PRAGMA database_list")} <= {"main", "temp"}
+    conn.close()
+
+
+def test_windows_split_without_overlap(filled_db, monkeypatch):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    monkeypatch.setattr(partitions, "MAX_ATTACHED", 2)
+    router = PartitionRouter(filled_db, SETTINGS)
+    windows = router.windows()
+    assert [[key for key, _ in parts] for _, _, parts in windows] == [["2025-01", "2025-02"], ["2025-03"]]
+    assert windows[0][0] is None and windows[0][1] == windows[1][0] == month_start("2025-03")
+
+    total = 0
+    for conn in router.connections():
+        total += conn.execute("SELECT COUNT(*) FROM sensor_datas").fetchone()[0]
+    assert total == len(MONTHS) * ROWS_PER_MONTH
+
+
+def test_old_partition_gets_new_columns(filled_db):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    router = PartitionRouter(filled_db, SETTINGS)
+    path = router.path("2025-01")
+    part = sqlite3.connect(path)
+    # Partisi dari sebelum migrasi v8
+    part.execute("DROP INDEX idx_sensor_change_seq")
+    part.execute("ALTER TABLE sensor_datas DROP COLUMN change_seq")
+    part.commit()
+    part.close()
+
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    assert count(path, "change_seq = id") == ROWS_PER_MONTH
+
+
+def test_drop_partitions_before_cutoff(filled_db):
+    rotate_partitions(filled_db, SETTINGS, now=NOW)
+    router = PartitionRouter(filled_db, SETTINGS)
+    # Bulan yang belum seluruhnya lewat batas tetap disimpan
+    assert drop_partitions(router, month_start("2025-02") + 86400) == ["2025-01"]
+    assert [key for key, _ in router.partitions()] == ["2025-02", "2025-03"]
+    assert not os.path.exists(router.path("2025-01"))
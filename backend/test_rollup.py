@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+import rollup
+from rollup import (MIN_CHART_POINTS, RAW_INTERVAL, bucket_start, choose_level, rebuild_rollups,
+                    update_rollups, wind_components, wind_direction)
+
+HOUR = 3600
+DAY = 86400
+
+
+@pytest.fixture
+def utc(monkeypatch):
+    monkeypatch.setattr(rollup, "utc_offset", lambda: 0)
+
+
+def test_bucket_start_utc(utc):
+    assert bucket_start(5 * HOUR + 17, HOUR) == 5 * HOUR
+    assert bucket_start(5 * HOUR, HOUR) == 5 * HOUR
+    assert bucket_start(3 * DAY + 5 * HOUR, DAY) == 3 * DAY
+
+
+def test_bucket_start_daily_follows_local_midnight(monkeypatch):
+    # WIB (UTC+7): hari lokal mulai pukul 17:00 UTC
+    monkeypatch.setattr(rollup, "utc_offset", lambda: 7 * HOUR)
+    ts = 10 * DAY + 20 * HOUR
+    start = bucket_start(ts, DAY)
+    assert start == 10 * DAY + 17 * HOUR
+    assert bucket_start(10 * DAY + 16 * HOUR, DAY) == 9 * DAY + 17 * HOUR
+    assert bucket_start(start + DAY - 1, DAY) == start
+
+
+@pytest.mark.parametrize("span, expected", [
+    (HOUR, (None, RAW_INTERVAL)),
+    (MIN_CHART_POINTS * HOUR - 1, (None, RAW_INTERVAL)),
+    (MIN_CHART_POINTS * HOUR, ("sensor_rollup_1h", HOUR)),
+    (30 * DAY, ("sensor_rollup_1h", HOUR)),
+    (MIN_CHART_POINTS * DAY - 1, ("sensor_rollup_1h", HOUR)),
+    (MIN_CHART_POINTS * DAY, ("sensor_rollup_1d", DAY)),
+    (365 * DAY, ("sensor_rollup_1d", DAY)),
+])
+def test_choose_level(span, expected):
+    start = 1_700_000_000
+    assert choose_level(start, start + span) == expected
+
+
+@pytest.mark.parametrize("wdir", [0, 45, 90, 180, 270, 359])
+def test_wind_components_round_trip(wdir):
+    u, v = wind_components(5.0, wdir)
+    assert wind_direction(u, v) == pytest.approx(wdir % 360, abs=0.01)
+
+
+def test_wind_components_missing():
+    assert wind_components(None, 90) == (None, None)
+    assert wind_direction(None, 1.0) is None
+
+
+def _rollup_rows(conn, table):
+    return conn.execute(f"SELECT device, bucket, temp_min, temp_max, temp_avg, temp_count, wdir_count "
+                        f"FROM {table} ORDER BY device, bucket").fetchall()
+
+
+def test_incremental_matches_rebuild(utc, db_file):
+    rows = [("A", 2 * DAY + i * RAW_INTERVAL, 20.0 + i % 7, None if i % 5 == 0 else (i * 37) % 360)
+            for i in range(600)]
+    rows += [("B", 2 * DAY + i * RAW_INTERVAL, 10.0 - i, 90.0) for i in range(30)]
+    conn = sqlite3.connect(db_file)
+    cur = conn.cursor()
+    for device, ts, temp, wdir in rows:
+        cur.execute("INSERT INTO sensor_datas (device, timestamp, temp, wspeed, wdir) VALUES (?, ?, ?, ?, ?)",
+                    (device, ts, temp, 2.0, wdir))
+        update_rollups(cur, device, ts, {"temp": temp, "wspeed": 2.0, "wdir": wdir})
+    conn.commit()
+    incremental = {t: _rollup_rows(conn, t) for t in ("sensor_rollup_1h", "sensor_rollup_1d")}
+
+    rebuild_rollups(conn)
+    for table, expected in incremental.items():
+        rebuilt = _rollup_rows(conn, table)
+        assert len(rebuilt) == len(expected)
+        for got, want in zip(rebuilt, expected):
+            assert got[:4] == want[:4]
+            assert got[4] == pytest.approx(want[4])
+            assert got[5:] == want[5:]
+
+    hours = conn.execute("SELECT COUNT(*), SUM(temp_count) FROM sensor_rollup_1h WHERE device = 'A'").fetchone()
+    assert hours == (600 * RAW_INTERVAL // HOUR, 600)
+    conn.close()
+
+
+def test_rebuild_range_keeps_other_buckets(utc, db_file):
+    conn = sqlite3.connect(db_file)
+    for day in range(3):
+        conn.execute("INSERT INTO sensor_datas (device, timestamp, temp) VALUES ('A', ?, ?)",
+                     (day * DAY + HOUR, float(day)))
+    rebuild_rollups(conn)
+    conn.execute("UPDATE sensor_datas SET temp = 50 WHERE timestamp = ?", (DAY + HOUR,))
+    conn.execute("DELETE FROM sensor_datas WHERE timestamp = ?", (0 * DAY + HOUR,))
+    rebuild_rollups(conn, since=DAY, until=2 * DAY)
+    got = conn.execute("SELECT bucket, temp_avg FROM sensor_rollup_1d ORDER BY bucket").fetchall()
+    # Hari 0 tidak ikut dihitung ulang walau data mentahnya sudah dihapus
+    assert got == [(0, 0.0), (DAY, 50.0), (2 * DAY, 2.0)]
+    conn.close()
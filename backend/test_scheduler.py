@@ -0,0 +1,63 @@
+import pytest
+
+import scheduler
+from scheduler import DevicePoller, SerialBus, load_devices
+
+READING = (25.5, 60.25, 1013.2, 3.45, 270.5, 12.3, 850)
+CONFIG = {
+    "device": "legacy", "location": "Bogor", "geo": {"latitude": -6.5, "longitude": 106.8},
+    "sampling": {"sample_interval": 1, "storage_interval": 300},
+    "devices": [{"device": "AWS-1", "slave_id": 1}, {"device": "AWS-2", "slave_id": 2, "port": "/dev/ttyUSB1"}],
+}
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    rows = []
+    monkeypatch.setattr(scheduler, "insert_data", lambda **kwargs: rows.append(kwargs))
+    return rows
+
+
+def poller(spec, readings):
+    p = DevicePoller(spec, SerialBus(spec["port"]))
+    p.driver.read = lambda: readings.pop(0) if readings else None
+    return p
+
+
+def test_devices_default_to_snapshot_mode():
+    devices = load_devices(CONFIG)
+    assert [(d["device"], d["mode"], d["port"]) for d in devices] == [
+        ("AWS-1", "snapshot", "/dev/ttyS0"), ("AWS-2", "snapshot", "/dev/ttyUSB1")]
+    assert devices[0]["location"] == "Bogor"
+
+
+def test_snapshot_stores_each_reading_at_slot(stored):
+    spec = load_devices(CONFIG)[0]
+    p = poller(spec, [None, READING])
+    slot = p.next_sample
+    assert p.interval == 300 and slot % 300 == 0
+    assert p.poll()
+    assert stored == [{"timestamp": slot, "device": "AWS-1", "location": "Bogor", "geo": CONFIG["geo"],
+                       "temp": 25.5, "hum": 60.25, "press": 1013.2, "wspeed": 3.45, "wdir": 270.5,
+                       "rain": 12.3, "srad": 850}]
+    # Tidak ada ringkasan interval di mode snapshot
+    p.window_end -= p.storage_interval
+    p.maybe_store()
+    assert len(stored) == 1
+
+
+def test_snapshot_failure_stores_nothing(stored):
+    p = poller(load_devices(CONFIG)[0], [])
+    assert not p.poll()
+    assert stored == [] and p.failures == 1
+
+
+def test_aggregate_mode_is_opt_in(stored):
+    config = dict(CONFIG, sampling=dict(CONFIG["sampling"], mode="aggregate"))
+    p = poller(load_devices(config)[0], [READING, READING])
+    assert p.interval == 1
+    assert p.poll() and p.poll()
+    assert stored == []
+    p.window_end -= p.storage_interval
+    p.maybe_store()
+    assert stored[0]["stats"]["sample_count"] == 2
@@ -0,0 +1,106 @@
+import pytest
+
+from sensor import (READ_HOLDING_REGISTERS, SensorDriver, build_request, check_crc, crc16_modbus,
+                    parse_response)
+
+
+def frame_with_crc(body):
+    crc = crc16_modbus(body)
+    return bytes(body) + bytes([crc & 0xFF, crc >> 8])
+
+
+def response_frame(slave_id, registers):
+    body = bytearray([slave_id, READ_HOLDING_REGISTERS, 2 * len(registers)])
+    for reg in registers:
+        body += reg.to_bytes(2, byteorder="big")
+    return frame_with_crc(body)
+
+
+# temp 25.5 °C, hum 60.25 %, press 1013.2 hPa, wspeed 3.45, wdir 270.5, rain 12.3, srad 850
+REGISTERS = [6550, 6025, 10132, 345, 2705, 123, 850]
+
+
+class FakeSerial:
+    """Port serial palsu: mengembalikan byte respon sesuai jumlah yang diminta read()"""
+
+    def __init__(self, data, timeout=0.5):
+        self.data = bytearray(data)
+        self.timeout = timeout
+        self.is_open = True
+        self.written = []
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def read(self, size):
+        chunk, self.data = bytes(self.data[:size]), self.data[size:]
+        return chunk
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def driver():
+    drv = SensorDriver("/dev/null", slave_id=0x01)
+    drv.bus.connect = lambda: drv.bus.ser
+    return drv
+
+
+def test_crc16_modbus_reference_vector():
+    # Contoh spesifikasi Modbus: 01 03 00 00 00 0A -> CRC C5 CD
+    assert crc16_modbus(bytes.fromhex("01030000000A")) == 0xCDC5
+    # Nilai cek standar CRC-16/MODBUS
+    assert crc16_modbus(b"123456789") == 0x4B37
+
+
+def test_build_request_appends_crc_little_endian():
+    frame = build_request(0x01, 0x0000, 10)
+    assert frame == bytes.fromhex("01030000000AC5CD")
+    assert check_crc(frame)
+    assert build_request(0xFF, 0x0009, 7)[:6] == bytes.fromhex("FF0300090007")
+
+
+def test_check_crc_rejects_corruption_and_short_frames():
+    frame = response_frame(1, REGISTERS)
+    assert check_crc(frame)
+    corrupted = bytearray(frame)
+    corrupted[5] ^= 0x01
+    assert not check_crc(bytes(corrupted))
+    assert not check_crc(frame[:3])
+
+
+def test_parse_response_scales_registers():
+    assert parse_response(response_frame(1, REGISTERS)) == (25.5, 60.25, 1013.2, 3.45, 270.5, 12.3, 850)
+
+
+def test_read_valid_frame(driver):
+    driver.bus.ser = FakeSerial(response_frame(1, REGISTERS))
+    assert driver.read() == (25.5, 60.25, 1013.2, 3.45, 270.5, 12.3, 850)
+    assert driver.bus.ser.written == [driver.request]
+
+
+@pytest.mark.parametrize("data", [
+    b"",                                                         # tidak ada respon
+    response_frame(1, REGISTERS)[:10],                           # frame terpotong
+    response_frame(1, REGISTERS)[:-1] + b"\x00",                 # CRC salah
+    response_frame(2, REGISTERS),                                # slave lain
+    frame_with_crc(bytes([1, READ_HOLDING_REGISTERS | 0x80, 2])),  # exception Modbus
+])
+def test_read_rejects_bad_frames(driver, data):
+    driver.bus.ser = FakeSerial(data)
+    assert driver.read() is None
+
+
+def test_read_error_closes_port(driver):
+    class BrokenSerial(FakeSerial):
+        def write(self, data):
+            raise OSError("port hilang")
+
+    driver.bus.ser = ser = BrokenSerial(b"")
+    assert driver.read() is None
+    assert not ser.is_open
+    assert driver.bus.ser is None
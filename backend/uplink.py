@@ -0,0 +1,382 @@
+import os
+import gzip
+import json
+import random
+import sqlite3
+import logging
+import time
+import http.client
+from urllib.parse import urlsplit
+
+from partitions import PartitionRouter
+from connections import connect
+from migrations import run_migrations
+
+# === Path Konfigurasi ===
+BASE_DB = "/opt/aws/database/aws_db.sqlite"
+OUTBOX_DB = "/opt/aws/database/uplink_outbox.sqlite"
+LOG_PATH = "/opt/aws/logs/uplink.log"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+# === Uplink store-and-forward ke API pusat ===
+# Baris sensor_datas dengan change_seq di atas watermark dibaca per batch
+# (change_seq naik setiap baris ditulis atau dikoreksi lewat upsert, lihat
+# migrasi v8, jadi koreksi ikut terkirim ulang), dikemas
+# sebagai NDJSON terkompresi gzip, lalu disimpan dulu ke outbox (SQLite
+# terpisah). Penyimpanan batch dan kenaikan watermark terjadi dalam satu
+# transaksi outbox, sehingga setiap baris ada di tepat satu tempat: di bawah
+# watermark (sudah di outbox / terkirim) atau di atasnya (belum dibaca).
+# Batch dikirim berurutan ke POST /api/sensors/bulk lewat satu koneksi HTTP
+# keep-alive dan baru dihapus dari outbox setelah server membalas 2xx.
+# Endpoint bulk melakukan upsert pada (device, timestamp), jadi pengiriman
+# ulang setelah timeout tidak menggandakan data.
+# Saat link putus, pengiriman diulang dengan backoff eksponensial + jitter;
+# batch baru yang belum penuh tidak dibuat selama outbox masih antre, sehingga
+# data yang menumpuk selama putus terkirim dalam batch penuh.
+UPLINK = {
+    "enabled": False,
+    "url": None,              # mis. http://pusat:5011/api/sensors/bulk
+    "token": None,            # Bearer token API pusat
+    "batch_rows": 500,        # baris per batch / request
+    "max_batches": 20,        # batch maksimal di outbox; sisanya menunggu di database
+    "interval": 60,           # detik jeda jika semua data sudah terkirim
+    "timeout": 30,            # detik timeout koneksi & response
+    "backoff_initial": 5,     # detik jeda setelah kegagalan pertama
+    "backoff_max": 900,       # batas jeda (15 menit)
+    "compress_level": 6,
+    "backfill": True          # False = mulai dari data terbaru saat pertama aktif
+}
+
+# Kolom yang diterima SensorCreate di API pusat
+UPLINK_COLUMNS = [
+    "timestamp", "device", "temp", "hum", "press", "wspeed", "wdir", "rain", "srad",
+    "latitude", "longitude", "altitude", "location"
+]
+TABLE = "sensor_datas"
+
+# Status HTTP yang tidak akan berhasil walau diulang: batch ditandai "dead"
+# (tetap di outbox untuk diperiksa), pengiriman lanjut ke batch berikutnya.
+# 401/403 tetap diulang karena biasanya hanya token yang perlu diperbaiki.
+PERMANENT_STATUS = {400, 404, 405, 413, 415, 422}
+
+
+def uplink_settings(overrides=None):
+    """UPLINK + config.json -> "uplink" + overrides"""
+    cfg = dict(UPLINK)
+    try:
+        with open(CONFIG_PATH) as f:
+            cfg.update(json.load(f).get("uplink", {}))
+    except (OSError, ValueError):
+        pass
+    cfg.update(overrides or {})
+    return cfg
+
+
+# === Outbox ===
+def open_outbox(path=OUTBOX_DB):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Outbox kecil; FULL agar batch & watermark tetap ada setelah mati listrik
+    conn = connect(path, profile={"synchronous": "FULL"})
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_id INTEGER NOT NULL,   -- change_seq pertama/terakhir batch
+        last_id INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        payload BLOB NOT NULL,
+        created_at INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        status TEXT NOT NULL DEFAULT 'pending'
+    )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS uplink_state (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.commit()
+    return conn
+
+
+def get_watermark(outbox):
+    row = outbox.execute("SELECT value FROM uplink_state WHERE key = 'last_seq'").fetchone()
+    if row is None:
+        # Outbox lama menyimpan watermark id; migrasi v8 memberi baris lama change_seq = id
+        row = outbox.execute("SELECT value FROM uplink_state WHERE key = 'last_id'").fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(outbox, seq):
+    outbox.execute("INSERT OR REPLACE INTO uplink_state (key, value) VALUES ('last_seq', ?)", (seq,))
+
+
+def pending_batches(outbox):
+    return outbox.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+def read_rows(db_file, after_seq, limit, router=None):
+    """
+    Baris dengan change_seq > after_seq, urut change_seq, maksimal `limit`.
+    Jika partisi aktif, file partisi ikut dibaca (change_seq dipertahankan
+    saat dipindah, koreksi bulan lama ditulis langsung ke partisi), sehingga
+    baris yang sempat dirotasi selama link putus lama tetap terkirim.
+    """
+    columns = ", ".join(UPLINK_COLUMNS)
+    sources = [db_file] + [path for _, path in (router.partitions() if router else [])]
+    rows = []
+    for path in sources:
+        conn = connect(path, readonly=True)
+        try:
+            # Partisi yang belum disesuaikan ke skema v8 (rotasi berikutnya) masih urut id
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+            seq = "change_seq" if "change_seq" in existing else "id"
+            sql = f"SELECT {seq}, {columns} FROM {TABLE} WHERE {seq} > ? ORDER BY {seq} LIMIT ?"
+            rows.extend(conn.execute(sql, (after_seq, limit)).fetchall())
+        except sqlite3.OperationalError as e:
+            logging.warning(f"⚠️ Gagal membaca {os.path.basename(path)}: {e}")
+        finally:
+            conn.close()
+    rows.sort(key=lambda r: r[0])
+    return rows[:limit]
+
+
+def encode_batch(rows, level=6):
+    """Baris -> NDJSON terkompresi gzip"""
+    lines = [json.dumps(dict(zip(UPLINK_COLUMNS, row[1:])), separators=(",", ":")) for row in rows]
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=level)
+
+
+def enqueue_batches(outbox, db_file, cfg, router=None):
+    """
+    Pindahkan baris baru ke outbox per batch. Batch yang belum penuh hanya
+    dibuat jika outbox kosong. Kembalikan jumlah batch baru.
+    """
+    hwm = get_watermark(outbox)
+    if hwm is None:
+        hwm = 0
+        if not cfg["backfill"]:
+            conn = connect(db_file, readonly=True)
+            try:
+                hwm = conn.execute("SELECT seq FROM change_counter WHERE id = 1").fetchone()[0]
+            finally:
+                conn.close()
+        with outbox:
+            set_watermark(outbox, hwm)
+        logging.info(f"📍 Watermark awal uplink: change_seq {hwm}")
+
+    batch_rows = int(cfg["batch_rows"])
+    created = 0
+    pending = pending_batches(outbox)
+    while pending < cfg["max_batches"]:
+        rows = read_rows(db_file, hwm, batch_rows, router)
+        if not rows or (len(rows) < batch_rows and pending):
+            break
+        payload = encode_batch(rows, cfg["compress_level"])
+        with outbox:
+            outbox.execute(
+                "INSERT INTO outbox (first_id, last_id, rows, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (rows[0][0], rows[-1][0], len(rows), payload, int(time.time())))
+            set_watermark(outbox, rows[-1][0])
+        hwm = rows[-1][0]
+        created += 1
+        pending += 1
+        if len(rows) < batch_rows:
+            break
+    return created
+
+
+# === Pengiriman HTTP (keep-alive) ===
+class UplinkError(Exception):
+    """Kegagalan pengiriman; retry_after (detik) dari server jika ada"""
+
+    def __init__(self, message, permanent=False, retry_after=None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+
+class UplinkClient:
+    """Satu koneksi HTTP/1.1 yang dipakai ulang antar batch, dibuka ulang jika putus"""
+
+    def __init__(self, url, token=None, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"URL uplink tidak valid: {url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.token = token
+        self.timeout = timeout
+        self.conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        self.conn = cls(self.host, self.port, timeout=self.timeout)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def post(self, payload):
+        """Kirim satu batch gzip NDJSON; kembalikan body JSON response (dict)"""
+        headers = {
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+            "Accept-Encoding": "identity",
+            "Connection": "keep-alive"
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        # Koneksi keep-alive bisa sudah ditutup server saat idle: ulang sekali
+        for attempt in (1, 2):
+            reused = self.conn is not None
+            if not reused:
+                self._connect()
+            try:
+                self.conn.request("POST", self.path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                if reused and attempt == 1 and isinstance(
+                        e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)):
+                    continue
+                raise UplinkError(f"Koneksi gagal: {e}")
+
+        if response.will_close:
+            self.close()
+        if response.status >= 300:
+            retry_after = response.getheader("Retry-After")
+            raise UplinkError(
+                f"HTTP {response.status}: {body[:200].decode('utf-8', 'replace')}",
+                permanent=response.status in PERMANENT_STATUS,
+                retry_after=int(retry_after) if retry_after and retry_after.isdigit() else None)
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+
+def send_pending(outbox, client):
+    """
+    Kirim batch outbox dari yang tertua sampai habis atau gagal.
+    Kembalikan (batch terkirim, UplinkError terakhir atau None).
+    """
+    sent = 0
+    while True:
+        row = outbox.execute(
+            "SELECT id, first_id, last_id, rows, payload FROM outbox WHERE status = 'pending' "
+            "ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return sent, None
+        batch_id, first_id, last_id, rows, payload = row
+        try:
+            result = client.post(payload)
+            # Batch yang gagal di sisi server (mis. database terkunci) diulang utuh
+            failed = [b for b in result.get("batches", []) if b.get("error")]
+            if failed:
+                raise UplinkError(f"Server gagal menyimpan batch: {failed[0]['error']}")
+        except UplinkError as e:
+            with outbox:
+                outbox.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, last_error = ?, status = ? WHERE id = ?",
+                    (str(e), "dead" if e.permanent else "pending", batch_id))
+            if e.permanent:
+                logging.error(f"☠️ Batch seq {first_id}-{last_id} ditolak permanen, disimpan di outbox: {e}")
+                continue
+            return sent, e
+
+        with outbox:
+            outbox.execute("DELETE FROM outbox WHERE id = ?", (batch_id,))
+        sent += 1
+        rejected = result.get("rejected", 0)
+        if rejected:
+            logging.warning(f"⚠️ Batch seq {first_id}-{last_id}: {rejected} dari {rows} baris ditolak server "
+                            f"({result.get('errors', [])[:3]})")
+        else:
+            logging.info(f"📤 Batch seq {first_id}-{last_id} terkirim ({rows} baris, {len(payload)} byte)")
+
+
+def backoff_delay(failures, cfg, retry_after=None):
+    """Backoff eksponensial dengan jitter penuh, dibatasi backoff_max"""
+    delay = min(cfg["backoff_max"], cfg["backoff_initial"] * 2 ** max(failures - 1, 0))
+    delay = random.uniform(delay / 2, delay)
+    if retry_after:
+        delay = max(delay, min(retry_after, cfg["backoff_max"]))
+    return delay
+
+
+def run_once(outbox, client, cfg, db_file=BASE_DB, router=None):
+    """Satu putaran: isi outbox lalu kirim. Kembalikan (batch terkirim, error)"""
+    enqueue_batches(outbox, db_file, cfg, router)
+    total = 0
+    while True:
+        sent, error = send_pending(outbox, client)
+        total += sent
+        # Lanjut membaca selama masih ada batch penuh dan link sehat
+        if error or not enqueue_batches(outbox, db_file, cfg, router):
+            return total, error
+
+
+# === Main Loop ===
+def main_loop():
+    cfg = uplink_settings()
+    if not cfg["enabled"] or not cfg["url"]:
+        logging.info("⏸️ Uplink nonaktif (config.json -> \"uplink\"). Cek ulang tiap 1 jam.")
+        while not (cfg["enabled"] and cfg["url"]):
+            time.sleep(3600)
+            cfg = uplink_settings()
+
+    logging.info(f"🚀 Memulai uplink ke {cfg['url']} (batch {cfg['batch_rows']} baris)...")
+    # Watermark memakai change_seq (migrasi v8); pastikan skema sudah terbaru
+    conn = connect(BASE_DB)
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
+    outbox = open_outbox()
+    client = UplinkClient(cfg["url"], cfg["token"], cfg["timeout"])
+    router = PartitionRouter(BASE_DB)
+    failures = 0
+    try:
+        while True:
+            try:
+                sent, error = run_once(outbox, client, cfg, BASE_DB, router)
+            except sqlite3.Error as e:
+                sent, error = 0, UplinkError(f"Database: {e}")
+
+            if error:
+                failures += 1
+                delay = backoff_delay(failures, cfg, error.retry_after)
+                logging.warning(f"🔁 Gagal kirim ({failures}x): {error}. Coba lagi dalam {delay:.0f} detik "
+                                f"({pending_batches(outbox)} batch antre)")
+                # Koneksi yang gagal tidak dipakai ulang
+                client.close()
+                time.sleep(delay)
+                continue
+
+            if failures:
+                logging.info(f"✅ Link pulih setelah {failures} kegagalan")
+                failures = 0
+            time.sleep(cfg["interval"])
+    finally:
+        client.close()
+        outbox.close()
+
+
+# === Entry Point ===
+if __name__ == "__main__":
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    logging.basicConfig(
+        filename=LOG_PATH,
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    try:
+        main_loop()
+    except KeyboardInterrupt:
+        logging.info("🛑 Dihentikan oleh pengguna.")
+    except Exception as e:
+        logging.error(f"❌ Fatal error: {e}")
@@ -0,0 +1,130 @@
+import sqlite3
+
+from rollup import register_math, wind_direction
+
+# === Wind Rose (binning di server) ===
+# Histogram arah × kelas kecepatan dihitung SQLite dalam satu query GROUP BY,
+# jadi ukuran respon tetap kecil berapapun panjang rentang waktunya.
+WINDROSE_DEFAULTS = {
+    "sectors": 16,
+    "calm": 0.5,                      # m/s, di bawah ini dihitung calm
+    "speed_classes": [2, 4, 6, 8, 10]  # batas kelas (m/s) di atas calm
+}
+
+COMPASS_LABELS = {
+    4: ["N", "E", "S", "W"],
+    8: ["N", "NE", "E", "SE", "S", "SW", "W", "NW"],
+    16: ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+         "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"],
+}
+
+MAX_SECTORS = 72
+
+
+def sector_labels(sectors):
+    """Label mata angin untuk 4/8/16 sektor, selain itu derajat tengah sektor"""
+    if sectors in COMPASS_LABELS:
+        return COMPASS_LABELS[sectors]
+    width = 360 / sectors
+    return [f"{round(i * width, 1):g}°" for i in range(sectors)]
+
+
+def speed_bins(calm, edges):
+    """Kelas kecepatan sebagai [bawah, atas) — kelas terakhir tanpa batas atas"""
+    bounds = [calm] + list(edges)
+    return [[lo, hi] for lo, hi in zip(bounds, bounds[1:])] + [[bounds[-1], None]]
+
+
+def validate(sectors, calm, edges):
+    if not 1 <= sectors <= MAX_SECTORS:
+        raise ValueError(f"sectors harus 1..{MAX_SECTORS}")
+    if calm < 0:
+        raise ValueError("calm tidak boleh negatif")
+    bounds = [calm] + list(edges)
+    if any(b <= a for a, b in zip(bounds, bounds[1:])):
+        raise ValueError("speed_classes harus naik dan lebih besar dari calm")
+
+
+def windrose_bins(conn, start_time, end_time=None, sectors=16, calm=0.5, edges=(2, 4, 6, 8, 10), device=None):
+    """
+    Histogram wind rose untuk rentang [start_time, end_time].
+
+    Sektor 0 berpusat di utara (arah angin datang, searah jarum jam). Sampel
+    dengan kecepatan < calm tidak masuk sektor mana pun. Rata-rata vektor
+    dihitung dari semua sampel (termasuk calm), berbobot kecepatan.
+    `conn` boleh berupa iterable koneksi (jendela partisi); hitungan per
+    sektor bersifat aditif sehingga hasil tiap koneksi cukup dijumlahkan.
+    """
+    validate(sectors, calm, edges)
+    conns = [conn] if isinstance(conn, sqlite3.Connection) else conn
+    width = 360.0 / sectors
+
+    class_expr = "CASE " + " ".join(
+        f"WHEN wspeed < {float(edge)!r} THEN {i}" for i, edge in enumerate(edges)
+    ) + f" ELSE {len(edges)} END" if edges else "0"
+
+    # Operator % SQLite membulatkan REAL ke integer, jadi sektor dihitung dari
+    # (wdir + setengah sektor) / lebar sektor; arah negatif diabaikan
+    where = ["timestamp >= ?", "wspeed IS NOT NULL", "wdir >= 0"]
+    params = [start_time]
+    if end_time is not None:
+        where.append("timestamp <= ?")
+        params.append(end_time)
+    if device:
+        where.append("device = ?")
+        params.append(device)
+
+    query = f"""
+    SELECT
+        CASE WHEN wspeed < ? THEN -1
+             ELSE CAST((wdir + ?) / ? AS INTEGER) % ? END AS sector,
+        CASE WHEN wspeed < ? THEN -1 ELSE {class_expr} END AS speed_class,
+        COUNT(*),
+        SUM(wspeed),
+        SUM(wspeed * sin(radians(wdir))),
+        SUM(wspeed * cos(radians(wdir)))
+    FROM sensor_datas
+    WHERE {" AND ".join(where)}
+    GROUP BY sector, speed_class
+    """
+    rows = []
+    for c in conns:
+        register_math(c)
+        rows += c.execute(query, [calm, width / 2, width, sectors, calm] + params).fetchall()
+
+    n_classes = len(edges) + 1
+    counts = [[0] * n_classes for _ in range(sectors)]
+    speed_sums = [0.0] * sectors
+    total = calm_count = 0
+    speed_total = sum_u = sum_v = 0.0
+    for sector, speed_class, count, speed_sum, u, v in rows:
+        total += count
+        speed_total += speed_sum
+        sum_u += u
+        sum_v += v
+        if sector < 0:
+            calm_count += count
+            continue
+        counts[sector][speed_class] += count
+        speed_sums[sector] += speed_sum
+
+    sector_totals = [sum(c) for c in counts]
+    return {
+        "sectors": sectors,
+        "labels": sector_labels(sectors),
+        "sector_width": width,
+        "speed_classes": speed_bins(calm, edges),
+        "counts": counts,
+        "mean_speed": [
+            round(speed_sums[i] / sector_totals[i], 2) if sector_totals[i] else None
+            for i in range(sectors)
+        ],
+        "total": total,
+        "calm": calm_count,
+        "calm_percent": round(100.0 * calm_count / total, 2) if total else None,
+        "mean_speed_all": round(speed_total / total, 2) if total else None,
+        "vector_mean": {
+            "speed": round((sum_u ** 2 + sum_v ** 2) ** 0.5 / total, 2) if total else None,
+            "direction": wind_direction(sum_u, sum_v) if total else None
+        }
+    }
@@ -55,95 +55,101 @@ async function fetchData() {
     try {
         const res = await fetch('/api/latest');
         const data = await res.json();
+        applyLatest(data);
+    } catch (e) {
+        console.error("Gagal fetch data terbaru:", e);
+    }
+}
 
-        Object.keys(data).forEach(key => {
-            const el = document.getElementById(`${key}-value`);
-            if (el && typeof data[key] === 'number') {
-                el.textContent = data[key].toFixed(2);
-            }
-        });
-
-        if (data.timestamp) {
-            const formatted = data.timestamp.replace(' ', ' |');
-            const timestampEls = document.querySelectorAll('.timestamp');
-            timestampEls.forEach(el => el.textContent = formatted);
+function applyLatest(data) {
+    Object.keys(data).forEach(key => {
+        const el = document.getElementById(`${key}-value`);
+        if (el && typeof data[key] === 'number') {
+            el.textContent = data[key].toFixed(2);
         }
+    });
 
-    } catch (e) {
-        console.error("Gagal fetch data terbaru:", e);
+    if (data.timestamp) {
+        const formatted = data.timestamp.replace(' ', ' |');
+        const timestampEls = document.querySelectorAll('.timestamp');
+        timestampEls.forEach(el => el.textContent = formatted);
     }
 }
 
 
 
+// Ambil payload grafik biner (format=f32): int32 selisih epoch + float32 per seri.
+// Waktu diformat di browser, NaN menjadi null.
+async function fetchChartF32(url) {
+    const res = await fetch(url);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const buf = await res.arrayBuffer();
+    const n = parseInt(res.headers.get('X-Chart-Count') || '0', 10);
+    const names = (res.headers.get('X-Chart-Series') || '').split(',').filter(Boolean);
+    const data = {
+        resolution: parseInt(res.headers.get('X-Chart-Resolution') || '300', 10),
+        times: new Array(n)
+    };
+
+    const view = new DataView(buf);
+    let t = parseInt(res.headers.get('X-Chart-Start') || '0', 10);
+    for (let i = 0; i < n; i++) {
+        t += view.getInt32(i * 4, true);
+        data.times[i] = t * 1000;
+    }
+    names.forEach((name, s) => {
+        const offset = (n + s * n) * 4;
+        const values = new Array(n);
+        for (let i = 0; i < n; i++) {
+            const v = view.getFloat32(offset + i * 4, true);
+            values[i] = Number.isNaN(v) ? null : v;
+        }
+        data[name] = values;
+    });
+    return data;
+}
+
 async function renderWindRose(range = "realtime") {
     try {
-        const res = await fetch(`/api/windrose?range=${range}`);
+        // Histogram arah × kelas kecepatan sudah dihitung di server
+        const res = await fetch(`/api/windrose/bins?range=${range}`);
         const data = await res.json();
+        if (!res.ok) throw new Error(data.error || `HTTP ${res.status}`);
 
-        // Buat array dari arah dan kecepatan
-        const rawData = [];
-        for (let i = 0; i < data.wdir.length; i++) {
-            const dir = data.wdir[i];
-            const spd = data.wspeed[i];
-            if (dir !== null && spd !== null) {
-                rawData.push({
-                    dir: degToCompass16(dir),
-                    speed: spd
-                });
-            }
-        }
-
-        // Kelompokkan data berdasarkan arah
-        const grouped = {};
-        rawData.forEach(d => {
-            if (!grouped[d.dir]) grouped[d.dir] = [];
-            grouped[d.dir].push(d.speed);
-        });
-
-        const directions = [
-            'N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
-            'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'
-        ];
-
-        const meanSpeeds = directions.map(dir => {
-            const speeds = grouped[dir] || [];
-            const mean = speeds.length ? speeds.reduce((a, b) => a + b, 0) / speeds.length : 0;
-            return +mean.toFixed(2);
-        });
-
-        const trace = {
+        const colors = ['#4575b4', '#74add1', '#abd9e9', '#fdae61', '#f46d43', '#d73027'];
+        const traces = data.speed_classes.map(([lo, hi], k) => ({
             type: 'barpolar',
-            r: meanSpeeds,
-            theta: directions,
-            name: 'Wind Speed',
-            marker: {
-                color: meanSpeeds,
-                colorscale: 'Bluered',
-                colorbar: {
-                    title: 'm/s',
-                    thickness: 10
-                }
-            }
-        };
+            r: data.counts.map(row => data.total ? +(100 * row[k] / data.total).toFixed(2) : 0),
+            theta: data.labels,
+            name: hi === null ? `≥ ${lo} m/s` : `${lo}–${hi} m/s`,
+            marker: { color: colors[k % colors.length] },
+            customdata: data.mean_speed,
+            hovertemplate: '%{theta}: %{r}%<br>rata-rata %{customdata} m/s<extra>%{fullData.name}</extra>'
+        }));
+
+        const vm = data.vector_mean;
+        const subtitle = data.total
+            ? `Calm ${data.calm_percent}% · Vektor rata-rata ${vm.speed} m/s dari ${vm.direction}°`
+            : 'Tidak ada data';
 
         const layout = {
-            title: 'Wind Rose (Average Speed)',
+            title: { text: `Wind Rose<br><sub>${subtitle}</sub>` },
             polar: {
                 angularaxis: {
                     direction: 'clockwise',
                     rotation: 90
                 },
                 radialaxis: {
-                    ticksuffix: ' m/s',
+                    ticksuffix: '%',
                     angle: 45
                 }
             },
-            margin: { t: 50, b: 30, l: 30, r: 30 },
-            showlegend: false
+            margin: { t: 60, b: 30, l: 30, r: 30 },
+            legend: { font: { size: 10 } },
+            showlegend: true
         };
 
-        Plotly.newPlot("windRoseChart", [trace], layout);
+        Plotly.newPlot("windRoseChart", traces, layout);
 
     } catch (e) {
         console.error("❌ Gagal render wind rose:", e);
@@ -151,55 +157,41 @@ async function renderWindRose(range = "realtime") {
 }
 
 
-function degToCompass16(deg) {
-    const directions = [
-        'N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
-        'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'
-    ];
-    const index = Math.round(deg / 22.5) % 16;
-    return directions[index];
-}
-
-
 async function renderHistoryChart(param = "temp", range = "realtime") {
     try {
         console.log("🟢 renderHistoryChart() dipanggil:", param, range);
-        const res = await fetch(`/api/history?param=${param}&range=${range}`);
-        const data = await res.json();
-
-        console.log("📈 Data timestamps:", data.timestamps);
-        console.log("📉 Data values:", data.values);
+        const data = await fetchChartF32(`/api/history?param=${param}&range=${range}&format=f32`);
 
-        if (!data.timestamps.length) {
+        if (!data.times.length) {
             console.warn("⚠️ Tidak ada data untuk range:", range);
             Plotly.react("dataChart", [], { title: "Tidak ada data" });
             return;
         }
 
-        // ✅ Konversi timestamps ke milidetik
-        const timestamps = data.timestamps.map(ts => new Date(ts).getTime());
+        // ✅ Epoch milidetik dari server
+        const timestamps = data.times;
 
-        // ✅ Threshold gap 6 menit (ms)
-        const GAP_THRESHOLD = 6 * 60 * 1000; // 6 menit dalam ms
+        // ✅ Threshold gap = 1.2x resolusi data (5 menit mentah → 6 menit, rollup 1 jam → 72 menit)
+        const GAP_THRESHOLD = (data.resolution || 300) * 1.2 * 1000;
 
         const filledTimestamps = [];
         const filledValues = [];
 
-        filledTimestamps.push(data.timestamps[0]);
+        filledTimestamps.push(new Date(timestamps[0]));
         filledValues.push(data.values[0]);
 
         for (let i = 1; i < timestamps.length; i++) {
             const prev = timestamps[i - 1];
             const curr = timestamps[i];
 
-            // ⏳ Jika ada gap lebih dari 6 menit, masukkan null
+            // ⏳ Jika ada gap lebih dari threshold, masukkan null
             if (curr - prev > GAP_THRESHOLD) {
                 console.log(`⛔ Gap terdeteksi antara ${new Date(prev).toISOString()} dan ${new Date(curr).toISOString()}`);
-                filledTimestamps.push(new Date(prev + 1).toISOString()); // timestamp dummy
+                filledTimestamps.push(new Date(prev + 1)); // timestamp dummy
                 filledValues.push(null); // ⬅️ Isi null biar garis putus
             }
 
-            filledTimestamps.push(data.timestamps[i]);
+            filledTimestamps.push(new Date(curr));
             filledValues.push(data.values[i]);
         }
 
@@ -354,46 +346,101 @@ setInterval(() => {
    loadUsbOptions();
 }, 10000);
 
-// Auto refresh tiap 1 menit
-setInterval(() => {
-    fetchData();
+function refreshCharts() {
     const param = document.getElementById('param-select').value;
     const range = document.getElementById('time-range').value;
-    //fetchHistory(param, range);
     renderHistoryChart(param, range);
     renderWindRose(range);
-}, 60000);
+}
+
+// Fallback: auto refresh tiap 1 menit jika live update tidak tersedia
+let pollingTimer = null;
+function startPolling() {
+    if (pollingTimer) return;
+    console.warn("⚠️ Live update tidak tersedia, kembali ke polling.");
+    pollingTimer = setInterval(() => {
+        fetchData();
+        refreshCharts();
+        updateWifiStatusUI();
+    }, 60000);
+}
+
+function stopPolling() {
+    if (pollingTimer) {
+        clearInterval(pollingTimer);
+        pollingTimer = null;
+    }
+}
+
+// Slot live update di server terbatas; tab yang ditolak (503) polling dulu
+// lalu mencoba lagi secara berkala
+const LIVE_RETRY_MS = 5 * 60 * 1000;
+
+// Live update: server mendorong data baru (SSE), tidak ada polling per tab
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const source = new EventSource('/api/stream');
+
+    source.addEventListener('open', () => {
+        stopPolling();
+    });
+
+    source.addEventListener('reading', e => {
+        const data = JSON.parse(e.data);
+        // Dashboard hanya menampilkan device dari config
+        if (config && config.device && data.device && data.device !== config.device) return;
+        applyLatest(data);
+        refreshCharts();
+    });
+
+    source.addEventListener('wifi', e => {
+        applyWifiStatus(JSON.parse(e.data));
+    });
+
+    source.addEventListener('error', () => {
+        // EventSource mencoba reconnect sendiri; jika ditutup permanen, polling
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+            setTimeout(startLiveUpdates, LIVE_RETRY_MS);
+        }
+    });
+}
 
 // Jalankan pertama kali
 loadConfig();
+startLiveUpdates();
 
 
 //wifi deteksi
 
+function applyWifiStatus(data) {
+  const dot = document.getElementById("wifi-status-dot");
+  const statusText = document.getElementById("wifi-current-status");
+
+  if (data.connected) {
+    dot.style.backgroundColor = "green";
+    statusText.innerText = `Terhubung ke WiFi: ${data.ssid}`;
+  } else {
+    dot.style.backgroundColor = "red";
+    statusText.innerText = `Tidak terhubung ke jaringan manapun.`;
+  }
+}
+
 function updateWifiStatusUI() {
   fetch('/api/wifi-status')
     .then(res => res.json())
-    .then(data => {
-      const dot = document.getElementById("wifi-status-dot");
-      const statusText = document.getElementById("wifi-current-status");
-
-      if (data.connected) {
-        dot.style.backgroundColor = "green";
-        statusText.innerText = `Terhubung ke WiFi: ${data.ssid}`;
-      } else {
-        dot.style.backgroundColor = "red";
-        statusText.innerText = `Tidak terhubung ke jaringan manapun.`;
-      }
-    })
+    .then(applyWifiStatus)
     .catch(err => {
       document.getElementById("wifi-status-dot").style.backgroundColor = "red";
       document.getElementById("wifi-current-status").innerText = "Gagal mendapatkan status koneksi.";
     });
 }
 
-// Jalankan saat halaman dimuat dan setiap 30 detik
+// Jalankan saat halaman dimuat; selanjutnya status dikirim lewat live update
 updateWifiStatusUI();
-setInterval(updateWifiStatusUI, 30000);
 
 
 // Fungsi untuk load SSID saat modal dibuka
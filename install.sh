@@ -20,7 +20,7 @@ echo "============================================"
 echo "📌 Dibuat oleh        : Abu Bakar <abubakar.it.dev@gmail.com>"
 echo "📌 Deskripsi          : Sistem pemantauan cuaca otomatis berbasis Python & API"
 echo "📌 Lokasi Instalasi   : /opt/aws"
-echo "📌 Service            : aws-sensor, aws-api, aws-web, aws-backup"
+echo "📌 Service            : aws-sensor, aws-api, aws-web, aws-backup, aws-uplink"
 echo "📌 Web Port           : 0.0.0.0:5010"
 echo "📌 API Port           : 0.0.0.0:5011"
 echo "📌 Dokumentasi API    : http://0.0.0.0:5011/docs"
@@ -57,7 +57,7 @@ fi
 # === Konfigurasi Default ===
 LOG_DIR="/opt/aws/logs"
 APP_BASE="/opt/aws"
-SERVICES=("aws-sensor.service" "aws-web.service" "aws-api.service" "aws-backup.service")
+SERVICES=("aws-sensor.service" "aws-web.service" "aws-api.service" "aws-backup.service" "aws-uplink.service")
 
 echo ""
 echo "🚀 Mulai proses instalasi AWS Project..."
@@ -77,6 +77,8 @@ REQ_FILE="$APP_BASE/requirements.txt"
 if [[ -f "$REQ_FILE" ]]; then
     echo "📦 Menginstall dependencies dari $REQ_FILE..."
     pip install -r "$REQ_FILE"
+    # Opsional: export Parquet; tanpa pyarrow export tetap tersedia dalam CSV
+    pip install pyarrow || echo "⚠️  pyarrow tidak terpasang, export Parquet nonaktif"
 else
     echo "⚠️  File requirements.txt tidak ditemukan, melewati install dependencies"
 fi
@@ -181,6 +183,28 @@ Group=root
 WantedBy=multi-user.target
 EOF
 
+# 5. aws-uplink.service
+echo "  • aws-uplink.service"
+cat <<EOF | tee /etc/systemd/system/aws-uplink.service > /dev/null
+[Unit]
+Description=AWS Uplink Store-and-Forward ke API Pusat
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=simple
+WorkingDirectory=$APP_BASE/backend
+ExecStart=$APP_BASE/venv/bin/python -u uplink.py
+StandardOutput=append:$LOG_DIR/uplink.log
+StandardError=append:$LOG_DIR/uplink.log
+Restart=always
+User=root
+Group=root
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # === Reload systemd & aktifkan semua service ===
 echo ""
 echo "🔄 Reload systemd dan aktifkan semua service..."
@@ -7,7 +7,7 @@ INSTALL_DIR="/opt/aws"
 LOG_DIR="$INSTALL_DIR/logs"
 BIN_PATH="/usr/bin/aws"
 DB_DIR="$INSTALL_DIR/database"
-SERVICES=("aws-sensor.service" "aws-web.service" "aws-api.service")
+SERVICES=("aws-sensor.service" "aws-web.service" "aws-api.service" "aws-backup.service" "aws-uplink.service")
 
 # Tanya apakah ingin menghapus database
 read -p "❓ Apakah Anda ingin menghapus database ? [y/N]: " DELETE_DB